@@ -1,3 +1,130 @@
-from django.test import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import json
+import threading
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app.chat.models import Conversation, Message
+from app.papers.models import Paper
+
+TOKENS = ['Transformers ', 'use ', 'attention.']
+
+
+class NdjsonOllama:
+    """
+    Local stand-in for Ollama's streaming /api/generate: one NDJSON line per token, then done.
+    """
+
+    def __init__(self):
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                lines = [{'response': token, 'done': False} for token in TOKENS]
+                lines.append({'response': '', 'done': True, 'prompt_eval_count': 42, 'eval_count': len(TOKENS)})
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                for line in lines:
+                    self.wfile.write((json.dumps(line) + '\n').encode())
+                    self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_sse(body: str):
+
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class StreamAnswerTests(TestCase):
+
+    def setUp(self):
+        self.ollama = NdjsonOllama()
+        self.addCleanup(self.ollama.close)
+
+        ml_config = {
+            **settings.ML_CONFIG,
+            'OLLAMA_BASE_URL': self.ollama.url,
+            'OLLAMA_SLOTS_URL': '',
+            'ANSWER_CACHE_ENABLED': False,
+            'RERANK_ENABLED': False,
+        }
+        overrider = override_settings(ML_CONFIG=ml_config)
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+        user = get_user_model().objects.create_user(username='reader', password='secret')
+        paper = Paper.objects.create(
+            user=user, title='Attention Is All You Need', pdf_file='pdfs/a.pdf', file_size=1, content_hash='0' * 64,
+        )
+        self.conversation = Conversation.objects.create(paper=paper, user=user)
+        self.token = str(RefreshToken.for_user(user).access_token)
+
+        self.sources = [{'chunk_id': 'c1', 'section': 'introduction', 'score': 0.9}]
+        prepared = {
+            'prompt': 'question and context',
+            'sources': self.sources,
+            'confidence': 0.9,
+            'rerank': None,
+            'context': {'tokens': 3},
+        }
+        for patcher in (
+            mock.patch('app.chat.views._retrieve', return_value=[]),
+            mock.patch('app.ml_services.qa_service.QAService.prepare_prompt', return_value=prepared),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_streams_sources_then_tokens_then_done_and_saves_answer(self):
+        response = await self.async_client.post(
+            f'/api/chat/conversations/{self.conversation.pk}/stream/',
+            {'question': 'What do transformers use?'},
+            content_type='application/json',
+            headers={'Authorization': f'Bearer {self.token}'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([part async for part in response.streaming_content]).decode()
+        events = parse_sse(body)
+
+        names = [name for name, _ in events]
+        self.assertEqual(names, ['sources'] + ['token'] * len(TOKENS) + ['done'])
+        self.assertEqual(events[0][1], {'sources': self.sources, 'confidence': 0.9})
+        self.assertEqual([data['text'] for name, data in events if name == 'token'], TOKENS)
+
+        done = events[-1][1]
+        self.assertEqual(done['answer'], 'Transformers use attention.')
+        self.assertEqual(done['tokens_used'], {'prompt': 42, 'completion': len(TOKENS)})
+
+        message = await sync_to_async(Message.objects.get)(pk=done['message_id'])
+        self.assertEqual(message.role, 'assistant')
+        self.assertEqual(message.content, 'Transformers use attention.')
+        self.assertEqual(message.cited_chunks, self.sources)
+        self.assertEqual(message.completion_tokens, len(TOKENS))
+        self.assertTrue(
+            await sync_to_async(
+                Message.objects.filter(conversation=self.conversation, role='user').exists
+            )()
+        )
@@ -2,5 +2,5 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    # example:
-]
\ No newline at end of file
+    path('conversations/<uuid:conversation_id>/stream/', views.stream_answer, name='chat_stream_answer'),
+]
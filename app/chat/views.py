@@ -1,3 +1,121 @@
-from django.shortcuts import render
+import json
+import logging
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from app.chat.models import Conversation, Message
+from app.ml_services.qa_service import QAService
+from app.ml_services.retrieval import HybridRetriever
+
+logger = logging.getLogger(__name__)
+
+
+def _authenticate(request):
+
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _load_conversation(conversation_id, user):
+
+    conversation = (
+        Conversation.objects
+        .select_related('paper', 'user')
+        .filter(pk=conversation_id, user=user)
+        .first()
+    )
+    if conversation is None:
+        return None, []
+
+    history = [
+        {'role': message.role, 'content': message.content}
+        for message in conversation.messages.order_by('-created_at')[:5]
+    ][::-1]
+    return conversation, history
+
+
+def _retrieve(qa_service: QAService, conversation: Conversation, question: str):
+
+    return HybridRetriever().retrieve(conversation.paper, question, top_k=qa_service.candidate_pool_size())
+
+
+def _sse(event: str, data) -> str:
+
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _event_stream(qa_service: QAService, conversation: Conversation, question: str, chunks, history, vector):
+
+    try:
+        async for event in qa_service.astream_answer(question, chunks, history):
+            name = event.pop('event')
+            if name == 'done':
+                message = await sync_to_async(qa_service.save_answer)(conversation, question, event)
+                await sync_to_async(qa_service.cache_answer, thread_sensitive=False)(
+                    conversation.paper_id, question, vector, event
+                )
+                event['message_id'] = str(message.pk)
+            yield _sse(name, event)
+
+    except Exception as e:
+        logger.error(f"Streaming answer for conversation {conversation.pk} failed: {e}")
+        yield _sse('error', {'detail': 'Failed to generate an answer'})
+
+
+async def _cached_event_stream(qa_service: QAService, conversation: Conversation, question: str, result):
+
+    yield _sse('sources', {'sources': result['sources'], 'confidence': result['confidence']})
+    yield _sse('token', {'text': result['answer']})
+
+    message = await sync_to_async(qa_service.save_answer)(conversation, question, result)
+    yield _sse('done', {**result, 'message_id': str(message.pk)})
+
+
+@csrf_exempt
+async def stream_answer(request, conversation_id):
+    """
+    POST {"question": "..."} -> text/event-stream with `sources`, `token`... and `done`
+    events. The assistant Message is saved when generation finishes. Serve through ASGI
+    (config/asgi.py); under WSGI the response is buffered by the sync worker.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        question = json.loads(request.body or b'{}').get('question', '').strip()
+    except (ValueError, AttributeError):
+        question = ''
+    if not question:
+        return JsonResponse({'detail': 'question is required'}, status=400)
+
+    conversation, history = await sync_to_async(_load_conversation)(conversation_id, user)
+    if conversation is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    qa_service = await sync_to_async(QAService, thread_sensitive=False)()
+    cached, vector = await sync_to_async(qa_service.cached_answer, thread_sensitive=False)(
+        conversation.paper_id, question, history
+    )
+
+    if cached is not None:
+        events = _cached_event_stream(qa_service, conversation, question, cached)
+    else:
+        chunks = await sync_to_async(_retrieve)(qa_service, conversation, question)
+        events = _event_stream(qa_service, conversation, question, chunks, history, vector)
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.config.settings')
 
@@ -9,4 +10,11 @@ app.autodiscover_tasks()
 
 @app.task(bind=True)
 def debug_task(self):
-    print('Request: {0!r}'.format(self.request))
\ No newline at end of file
+    print('Request: {0!r}'.format(self.request))
+
+@worker_process_init.connect
+def preload_ml_models(**kwargs):
+    # runs in every prefork child, so each worker process pays the model load once at boot;
+    # the children inherit the queues the parent selected with -Q
+    from app.ml_services.model_registry import preload_models
+    preload_models(queues=list(app.amqp.queues.consume_from))
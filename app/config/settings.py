@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 from decouple import config, Csv
 from datetime import timedelta
+from celery.schedules import crontab
 import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 
     'rest_framework',
     'rest_framework_simplejwt',
@@ -180,19 +182,144 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TIMEZONE = TIME_ZONE
+# CPU-heavy stages (chunking, BART, embeddings) and LLM-bound ones scale separately:
+#   celery -A app.config worker -Q cpu      celery -A app.config worker -Q llm
+# PDF extraction fans large documents out to its own process pool, which prefork children
+# (daemonic) may not start, so its queue runs on a thread pool:
+#   celery -A app.config worker -Q pdf -P threads -c 2
+CELERY_TASK_ROUTES = {
+    'app.ml_services.tasks.extract_paper_insights': {'queue': 'llm'},
+    'app.ml_services.tasks.extract_paper_text': {'queue': 'pdf'},
+    'app.ml_services.tasks.*': {'queue': 'cpu'},
+}
+# long-running stages ack late; prefetching more would park them behind a busy process
+CELERY_WORKER_PREFETCH_MULTIPLIER = config('CELERY_WORKER_PREFETCH_MULTIPLIER', default=1, cast=int)
+# tests run the pipeline in-process (CELERY_BROKER_URL=memory://, CELERY_TASK_ALWAYS_EAGER=True)
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+# eager propagation would raise summarize_paper's retries; stage failures still surface through the canvas
+CELERY_TASK_EAGER_PROPAGATES = False
+# run with `celery -A app.config beat`
+CELERY_BEAT_SCHEDULE = {
+    # re-queues pipelines whose chord state was lost
+    'resume-stalled-papers': {
+        'task': 'app.ml_services.tasks.resume_stalled_papers',
+        'schedule': timedelta(minutes=10),
+    },
+    # FairScheduler safety net: refills slots whose release was missed
+    'dispatch-scheduled-jobs': {
+        'task': 'app.ml_services.tasks.dispatch_scheduled_jobs',
+        'schedule': timedelta(minutes=1),
+    },
+    # related papers of ready papers whose centroid is missing or outdated
+    'refresh-stale-related-papers': {
+        'task': 'app.ml_services.tasks.refresh_stale_related_papers',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
 
 # ML Configuration
 ML_CONFIG = {
     'OPENAI_API_KEY': config('OPENAI_API_KEY', default=''),
     'OLLAMA_BASE_URL': config('OLLAMA_BASE_URL'),
     'OLLAMA_MODEL': config('OLLAMA_MODEL'),
+    'OLLAMA_MAX_CONCURRENCY': config('OLLAMA_MAX_CONCURRENCY', default=2, cast=int),
+    'OLLAMA_TIMEOUT': config('OLLAMA_TIMEOUT', default=120, cast=int),
+    'OLLAMA_MAX_RETRIES': config('OLLAMA_MAX_RETRIES', default=3, cast=int),
+    'OLLAMA_RETRY_BACKOFF': config('OLLAMA_RETRY_BACKOFF', default=0.5, cast=float),
+    'OLLAMA_POOL_SIZE': config('OLLAMA_POOL_SIZE', default=10, cast=int),
+    # Redis holding the generation slots shared by web and worker processes; empty = per-process limit only
+    'OLLAMA_SLOTS_URL': config(
+        'OLLAMA_SLOTS_URL', default=CELERY_BROKER_URL if CELERY_BROKER_URL.startswith('redis') else '',
+    ),
     'MAX_PDF_SIZE_MB': config('MAX_PDF_SIZE_MB', cast=int),
     "CHUNK_SIZE": config('CHUNK_SIZE', cast=int),
     "CHUNK_OVERLAP": config('CHUNK_OVERLAP', cast=int),
+    'CHUNK_UNIT': config('CHUNK_UNIT', default='chars'),
+    'CHUNK_TOKENS': config('CHUNK_TOKENS', default=0, cast=int),
+    'CHUNK_TOKEN_OVERLAP': config('CHUNK_TOKEN_OVERLAP', default=32, cast=int),
     'TOP_K_RESULTS': config('TOP_K_RESULTS', cast=int),
     'EMBEDDING_MODEL': config('EMBEDDING_MODEL'),
+    'EMBEDDING_BATCH_SIZE': config('EMBEDDING_BATCH_SIZE', default=32, cast=int),
+    'EMBEDDING_CACHE_ENABLED': config('EMBEDDING_CACHE_ENABLED', default=True, cast=bool),
+    'EMBEDDING_CACHE_PATH': config('EMBEDDING_CACHE_PATH', default=str(BASE_DIR / 'embedding_cache.sqlite3')),
+    'EMBEDDING_CACHE_MAX_ENTRIES': config('EMBEDDING_CACHE_MAX_ENTRIES', default=500000, cast=int),
+    'VECTOR_STORE': config('VECTOR_STORE', default='chroma'),
+    'CHROMA_PERSIST_DIR': config('CHROMA_PERSIST_DIR', default=str(BASE_DIR / 'chroma_db')),
+    'FAISS_INDEX_DIR': config('FAISS_INDEX_DIR', default=str(BASE_DIR / 'faiss_indexes')),
+    'FAISS_INDEX_TYPE': config('FAISS_INDEX_TYPE', default='hnsw'),
+    'FAISS_IVF_NLIST': config('FAISS_IVF_NLIST', default=1024, cast=int),
+    'FAISS_IVF_NPROBE': config('FAISS_IVF_NPROBE', default=16, cast=int),
+    'FAISS_HNSW_M': config('FAISS_HNSW_M', default=32, cast=int),
+    'FAISS_HNSW_EF_SEARCH': config('FAISS_HNSW_EF_SEARCH', default=64, cast=int),
+    'FAISS_DELTA_MAX_VECTORS': config('FAISS_DELTA_MAX_VECTORS', default=5000, cast=int),
+    'FAISS_COMPACT_RATIO': config('FAISS_COMPACT_RATIO', default=0.2, cast=float),
+    # filters allowing at most this share (and count) of a collection are scored exactly
+    'FAISS_EXACT_FILTER_RATIO': config('FAISS_EXACT_FILTER_RATIO', default=0.05, cast=float),
+    'FAISS_EXACT_FILTER_MAX': config('FAISS_EXACT_FILTER_MAX', default=20000, cast=int),
+    'GLOBAL_INDEX_SHARDS': config('GLOBAL_INDEX_SHARDS', default=1, cast=int),
+    'GLOBAL_INDEX_PREFIX': config('GLOBAL_INDEX_PREFIX', default='papers_global'),
+    'REINDEX_CONCURRENCY': config('REINDEX_CONCURRENCY', default=2, cast=int),
+    'REINDEX_MAX_PAPERS_PER_MINUTE': config('REINDEX_MAX_PAPERS_PER_MINUTE', default=0, cast=float),
+    'REINDEX_BATCH_SIZE': config('REINDEX_BATCH_SIZE', default=64, cast=int),
+    'REINDEX_RETIRED_GRACE_SECONDS': config('REINDEX_RETIRED_GRACE_SECONDS', default=300, cast=int),
+    'SCHEDULER_MAX_IN_FLIGHT': config('SCHEDULER_MAX_IN_FLIGHT', default=8, cast=int),
+    'SCHEDULER_INTERACTIVE_RESERVED': config('SCHEDULER_INTERACTIVE_RESERVED', default=2, cast=int),
+    'SCHEDULER_INTERACTIVE_PER_USER': config('SCHEDULER_INTERACTIVE_PER_USER', default=2, cast=int),
+    'SCHEDULER_MAX_QUEUED_PER_USER': config('SCHEDULER_MAX_QUEUED_PER_USER', default=500, cast=int),
+    'SCHEDULER_MAX_QUEUED': config('SCHEDULER_MAX_QUEUED', default=5000, cast=int),
+    # "plan:weight" pairs matched against the user's group names, e.g. "pro:2,team:4"
+    'SCHEDULER_PLAN_WEIGHTS': config(
+        'SCHEDULER_PLAN_WEIGHTS', default='',
+        cast=lambda value: {name.strip(): float(weight) for name, weight in
+                            (pair.split(':') for pair in value.split(',') if pair.strip())},
+    ),
+    # prefix: related_papers.centroid_collection adds a suffix per embedding model
+    'CENTROID_COLLECTION': config('CENTROID_COLLECTION', default='paper_centroids'),
+    'RELATED_PAPERS_TOP_N': config('RELATED_PAPERS_TOP_N', default=10, cast=int),
+    'RELATED_PAPERS_CANDIDATES': config('RELATED_PAPERS_CANDIDATES', default=50, cast=int),
+    'RELATED_PAPERS_MIN_SCORE': config('RELATED_PAPERS_MIN_SCORE', default=0.3, cast=float),
+    'HYBRID_RETRIEVAL': config('HYBRID_RETRIEVAL', default=True, cast=bool),
+    'HYBRID_CANDIDATES': config('HYBRID_CANDIDATES', default=20, cast=int),
+    'RRF_K': config('RRF_K', default=60, cast=int),
+    'SEARCH_CONFIG': config('SEARCH_CONFIG', default='english'),
+    'RERANK_ENABLED': config('RERANK_ENABLED', default=False, cast=bool),
+    'RERANK_MODEL': config('RERANK_MODEL', default='cross-encoder/ms-marco-MiniLM-L-6-v2'),
+    'RERANK_CANDIDATES': config('RERANK_CANDIDATES', default=20, cast=int),
+    'RERANK_BATCH_SIZE': config('RERANK_BATCH_SIZE', default=16, cast=int),
+    'RERANK_BUDGET_MS': config('RERANK_BUDGET_MS', default=300, cast=int),
+    'RERANK_TOKEN_BUDGET': config('RERANK_TOKEN_BUDGET', default=1500, cast=int),
+    # Hugging Face tokenizer of OLLAMA_MODEL; empty picks it from context_packer.OLLAMA_TOKENIZERS
+    'LLM_TOKENIZER': config('LLM_TOKENIZER', default=''),
+    'CONTEXT_TOKEN_BUDGET': config('CONTEXT_TOKEN_BUDGET', default=2000, cast=int),
+    'CONTEXT_DEDUP_THRESHOLD': config('CONTEXT_DEDUP_THRESHOLD', default=0.8, cast=float),
+    'ANSWER_CACHE_ENABLED': config('ANSWER_CACHE_ENABLED', default=True, cast=bool),
+    'ANSWER_CACHE_PATH': config('ANSWER_CACHE_PATH', default=str(BASE_DIR / 'answer_cache.sqlite3')),
+    'ANSWER_CACHE_SIMILARITY': config('ANSWER_CACHE_SIMILARITY', default=0.95, cast=float),
+    'ANSWER_CACHE_TTL': config('ANSWER_CACHE_TTL', default=7 * 24 * 3600, cast=int),
+    'ANSWER_CACHE_MAX_ENTRIES': config('ANSWER_CACHE_MAX_ENTRIES', default=50000, cast=int),
+    'SUMMARIZATION_MODEL': config('SUMMARIZATION_MODEL', default='facebook/bart-large-cnn'),
+    # empty: preload what the worker's queues need (PRELOAD_MODELS_BY_QUEUE)
+    'PRELOAD_MODELS': config('PRELOAD_MODELS', default='', cast=Csv()),
+    'PRELOAD_MODELS_BY_QUEUE': {
+        'cpu': ['embedding', 'summarization', 'vector_store'],
+        'llm': ['llm'],
+        'pdf': [],
+    },
     'SUMMARY_MAX_LENGTH': config('SUMMARY_MAX_LENGTH', cast=int),
     'SUMMARY_MIN_LENGTH': config('SUMMARY_MIN_LENGTH', cast=int),
+    'SUMMARY_MAX_INPUT_TOKENS': config('SUMMARY_MAX_INPUT_TOKENS', default=1000, cast=int),
+    'SUMMARY_MULTI_LENGTH_MODE': config('SUMMARY_MULTI_LENGTH_MODE', default='shared_encoder'),
+    'SUMMARY_EXTRACTIVE_PREFILTER': config('SUMMARY_EXTRACTIVE_PREFILTER', default=0.0, cast=float),
+    'SUMMARY_BATCH_SIZE': config('SUMMARY_BATCH_SIZE', default=8, cast=int),
+    'SUMMARY_BATCH_WINDOW_SECONDS': config('SUMMARY_BATCH_WINDOW_SECONDS', default=5, cast=int),
+    'SUMMARY_BATCH_MAX_PAPERS': config('SUMMARY_BATCH_MAX_PAPERS', default=16, cast=int),
+    # how often the pipeline's summarization stage checks on its batch
+    'SUMMARY_BATCH_POLL_SECONDS': config('SUMMARY_BATCH_POLL_SECONDS', default=10, cast=int),
+    # batch rows still `processing` after this long belonged to a lost consumer and are claimed again
+    'SUMMARY_BATCH_RECLAIM_SECONDS': config('SUMMARY_BATCH_RECLAIM_SECONDS', default=1800, cast=int),
+    'PDF_EXTRACTION_WORKERS': config('PDF_EXTRACTION_WORKERS', default=0, cast=int),
+    'PDF_PARALLEL_MIN_PAGES': config('PDF_PARALLEL_MIN_PAGES', default=64, cast=int),
+    'SECTION_FONT_HINTS': config('SECTION_FONT_HINTS', default=True, cast=bool),
 }
 
 # Logging
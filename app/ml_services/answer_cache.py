@@ -0,0 +1,248 @@
+from typing import Dict, Optional
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from app.ml_services.embedding_cache import text_hash
+from app.ml_services.model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+
+    return " ".join(re.findall(r'\w+', question.lower()))
+
+
+class AnswerCache:
+    """
+    Semantic QA answer cache in a local SQLite file, scoped by (paper, model, prompt version).
+
+    A lookup first tries the exact normalized question, then compares the question
+    embedding with every cached question of the paper and returns the best entry whose
+    cosine similarity reaches the threshold. Entries expire after `ttl_seconds`, the
+    least recently used rows are evicted past `max_entries`, and hit/miss counters are
+    kept in the file so every web and worker process reports the same hit rate.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self,
+                 path: str,
+                 similarity_threshold: float = 0.95,
+                 ttl_seconds: int = 7 * 24 * 3600,
+                 max_entries: int = 50_000):
+        self.path = str(path)
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._puts_since_evict = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                paper_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                question_hash TEXT NOT NULL,
+                question TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (paper_id, model, prompt_version, question_hash)
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        connection.commit()
+
+    def get(self, paper_id, model: str, prompt_version: str, question: str, vector: np.ndarray) -> Optional[Dict]:
+        """
+        Returns the cached result with 'cache': {'similarity', 'question'} added, or None.
+        """
+        paper_id = str(paper_id)
+        question_hash = text_hash(normalize_question(question))
+        oldest = time.time() - self.ttl_seconds
+
+        connection = self._connection()
+        rows = connection.execute(
+            """
+            SELECT id, question_hash, question, vector, result FROM answers
+            WHERE paper_id = ? AND model = ? AND prompt_version = ? AND created_at >= ?
+            """,
+            [paper_id, model, prompt_version, oldest],
+        ).fetchall()
+
+        best = None
+        best_similarity = -1.0
+        if rows:
+            exact = [row for row in rows if row[1] == question_hash]
+            if exact:
+                best, best_similarity = exact[0], 1.0
+            else:
+                vectors = np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+                similarities = vectors @ self._unit(vector)
+                position = int(np.argmax(similarities))
+                best, best_similarity = rows[position], float(similarities[position])
+
+        if best is None or best_similarity < self.similarity_threshold:
+            self._increment('misses')
+            return None
+
+        connection.execute(
+            "UPDATE answers SET last_used = ?, hits = hits + 1 WHERE id = ?",
+            [time.time(), best[0]],
+        )
+        connection.commit()
+        self._increment('hits')
+
+        result = json.loads(best[4])
+        result['cache'] = {
+            'similarity': round(best_similarity, 4),
+            'question': best[2],
+        }
+        return result
+
+    def put(self, paper_id, model: str, prompt_version: str, question: str, vector: np.ndarray, result: Dict):
+
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            """
+            INSERT OR REPLACE INTO answers
+                (paper_id, model, prompt_version, question_hash, question, vector, result, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                str(paper_id), model, prompt_version,
+                text_hash(normalize_question(question)), question,
+                self._unit(vector).tobytes(), json.dumps(result),
+                now, now,
+            ],
+        )
+        connection.commit()
+
+        with self._lock:
+            self._puts_since_evict += 1
+            should_evict = self._puts_since_evict >= self.EVICT_EVERY
+            if should_evict:
+                self._puts_since_evict = 0
+
+        if should_evict:
+            self.evict()
+
+    def invalidate_paper(self, paper_id) -> int:
+
+        connection = self._connection()
+        deleted = connection.execute("DELETE FROM answers WHERE paper_id = ?", [str(paper_id)]).rowcount
+        connection.commit()
+        if deleted:
+            logger.info(f"Invalidated {deleted} cached answers of paper {paper_id}")
+        return deleted
+
+    def evict(self) -> int:
+
+        connection = self._connection()
+        expired = connection.execute(
+            "DELETE FROM answers WHERE created_at < ?", [time.time() - self.ttl_seconds]
+        ).rowcount
+
+        (count,) = connection.execute("SELECT COUNT(*) FROM answers").fetchone()
+        overflow = max(0, count - self.max_entries)
+        if overflow:
+            connection.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used LIMIT ?)",
+                [overflow],
+            )
+        connection.commit()
+
+        if expired or overflow:
+            logger.info(f"Evicted {expired} expired and {overflow} least recently used answers from {self.path}")
+        return expired + overflow
+
+    def stats(self) -> Dict:
+
+        connection = self._connection()
+        counters = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+        (entries,) = connection.execute("SELECT COUNT(*) FROM answers").fetchone()
+
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+        }
+
+    def _increment(self, name: str):
+
+        connection = self._connection()
+        connection.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            [name],
+        )
+        connection.commit()
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _connection(self) -> sqlite3.Connection:
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+
+    ml_config = settings.ML_CONFIG
+    if not ml_config.get('ANSWER_CACHE_ENABLED', True):
+        return None
+
+    path = ml_config['ANSWER_CACHE_PATH']
+    return registry.get(
+        f'answer_cache:{path}',
+        lambda: AnswerCache(
+            path,
+            similarity_threshold=ml_config.get('ANSWER_CACHE_SIMILARITY', 0.95),
+            ttl_seconds=ml_config.get('ANSWER_CACHE_TTL', 7 * 24 * 3600),
+            max_entries=ml_config.get('ANSWER_CACHE_MAX_ENTRIES', 50_000),
+        ),
+    )
+
+
+def invalidate_paper_answers(paper_id) -> None:
+    """
+    Drops a paper's cached answers. Called by the code paths that replace its chunks
+    or switch its collection, since cached answers cite the old chunks.
+    """
+    cache = get_answer_cache()
+    if cache is not None:
+        cache.invalidate_paper(paper_id)
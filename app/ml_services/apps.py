@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MlServicesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app.ml_services"
+
+    def ready(self):
+        from app.ml_services import signals  # noqa: F401
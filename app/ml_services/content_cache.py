@@ -0,0 +1,123 @@
+from typing import Optional
+from django.conf import settings
+from django.db import transaction
+import hashlib
+import logging
+
+from app.ml_services.pdf_processor import PDFProcessor
+from app.ml_services.text_chunker import TextChunker
+from app.papers.models import Paper, PaperChunk
+
+logger = logging.getLogger(__name__)
+
+
+# Paper fields produced by extraction, summarization and key-insight extraction
+REUSABLE_FIELDS = [
+    'num_pages',
+    'full_text',
+    'full_text_length',
+    'short_summary',
+    'medium_summary',
+    'long_summary',
+    'key_findings',
+    'methodology',
+    'conclusion',
+]
+
+
+def pipeline_fingerprint() -> str:
+    """
+    Hash of everything besides the PDF bytes that determines processing output.
+    """
+    ml_config = settings.ML_CONFIG
+    parts = [
+        f"extractor={PDFProcessor.VERSION}",
+        f"chunker={TextChunker.VERSION}",
+        f"chunk_size={ml_config['CHUNK_SIZE']}",
+        f"chunk_overlap={ml_config['CHUNK_OVERLAP']}",
+        f"chunk_unit={ml_config.get('CHUNK_UNIT', 'chars')}",
+        f"chunk_tokens={ml_config.get('CHUNK_TOKENS', 0)}",
+        f"chunk_token_overlap={ml_config.get('CHUNK_TOKEN_OVERLAP', 32)}",
+        f"embedding_model={ml_config['EMBEDDING_MODEL']}",
+        f"summarization_model={ml_config['SUMMARIZATION_MODEL']}",
+        f"llm={ml_config['OLLAMA_MODEL']}",
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+class PaperContentCache:
+    """
+    Content-addressed reuse of processing results between papers with identical PDF bytes.
+
+    The lookup key is (Paper.content_hash, Paper.pipeline_fingerprint), both indexed,
+    so finding a previously processed copy never touches the stored files. A hit copies
+    extracted text, summaries and insights, clones the PaperChunk rows and adds the source's
+    vectors again under the new paper's id, so extraction, chunking, summarization and
+    embedding are all skipped.
+    """
+
+    def __init__(self):
+        self.fingerprint = pipeline_fingerprint()
+
+    def find_processed(self, paper: Paper) -> Optional[Paper]:
+
+        if not paper.content_hash:
+            return None
+
+        return (
+            Paper.objects
+            .filter(content_hash=paper.content_hash,
+                    pipeline_fingerprint=self.fingerprint,
+                    status='ready')
+            .exclude(pk=paper.pk)
+            .order_by('-updated_at')
+            .first()
+        )
+
+    def reuse(self, paper: Paper) -> bool:
+        """
+        Fills `paper` from an identical processed paper. Returns False on a cache miss.
+        """
+        source = self.find_processed(paper)
+        if source is None:
+            return False
+
+        # reindex imports this module
+        from app.ml_services.reindex import index_reused_paper
+
+        with transaction.atomic():
+            for field in REUSABLE_FIELDS:
+                setattr(paper, field, getattr(source, field))
+            paper.save(update_fields=REUSABLE_FIELDS + ['updated_at'])
+
+            PaperChunk.objects.filter(paper=paper).delete()
+            PaperChunk.objects.bulk_create([
+                PaperChunk(
+                    paper=paper,
+                    content=chunk.content,
+                    chunk_index=chunk.chunk_index,
+                    page_number=chunk.page_number,
+                    section_title=chunk.section_title,
+                    embedding_id=chunk.embedding_id,
+                    search_vector=chunk.search_vector,
+                    chunk_type=chunk.chunk_type,
+                )
+                for chunk in source.chunks.all().iterator()
+            ], batch_size=500)
+
+        # the cloned rows still carry the source's embedding ids until the copies replace them
+        index_reused_paper(paper, source)
+
+        paper.pipeline_fingerprint = self.fingerprint
+        paper.status = 'ready'
+        paper.save(update_fields=['pipeline_fingerprint', 'status', 'updated_at'])
+
+        logger.info(f"Reused processing results of paper {source.pk} for paper {paper.pk}")
+        return True
+
+    def mark_processed(self, paper: Paper):
+        """
+        Records the fingerprint once a paper finished processing so later uploads can reuse it.
+        """
+        paper.pipeline_fingerprint = self.fingerprint
+        paper.save(update_fields=['pipeline_fingerprint', 'updated_at'])
@@ -0,0 +1,261 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from django.conf import settings
+import logging
+import re
+
+from app.ml_services.model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+SHINGLE_SIZE = 5
+
+# Hugging Face tokenizers of Ollama model families (the model name before the ":tag");
+# every size of a family shares its tokenizer
+OLLAMA_TOKENIZERS = {
+    'llama2': 'hf-internal-testing/llama-tokenizer',
+    'llama3': 'NousResearch/Meta-Llama-3-8B-Instruct',
+    'llama3.1': 'NousResearch/Meta-Llama-3.1-8B-Instruct',
+    'llama3.2': 'NousResearch/Llama-3.2-1B',
+    'mistral': 'mistralai/Mistral-7B-Instruct-v0.2',
+    'mixtral': 'mistralai/Mixtral-8x7B-Instruct-v0.1',
+    'qwen2': 'Qwen/Qwen2-7B-Instruct',
+    'qwen2.5': 'Qwen/Qwen2.5-7B-Instruct',
+    'phi3': 'microsoft/Phi-3-mini-4k-instruct',
+    'gemma2': 'google/gemma-2-9b-it',
+}
+
+_estimate_warned = set()
+
+
+def llm_tokenizer_name() -> str:
+    """
+    ML_CONFIG['LLM_TOKENIZER'] when set, otherwise the tokenizer of OLLAMA_MODEL's family.
+    """
+    ml_config = settings.ML_CONFIG
+    if ml_config.get('LLM_TOKENIZER'):
+        return ml_config['LLM_TOKENIZER']
+
+    family = (ml_config.get('OLLAMA_MODEL') or '').split(':')[0].split('/')[-1].lower()
+    return OLLAMA_TOKENIZERS.get(family, '')
+
+
+class TokenCounter:
+    """
+    Counts tokens with the LLM's own tokenizer (see llm_tokenizer_name), so prompt budgets
+    match what the Ollama model sees. Without one it falls back to ~4 chars per token.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str] = None):
+        self.tokenizer_name = tokenizer_name if tokenizer_name is not None else llm_tokenizer_name()
+        self.tokenizer = self._load(self.tokenizer_name)
+
+        if self.tokenizer is None and self.tokenizer_name not in _estimate_warned:
+            _estimate_warned.add(self.tokenizer_name)
+            logger.warning(
+                f"No tokenizer for {self.tokenizer_name or settings.ML_CONFIG.get('OLLAMA_MODEL')!r}: "
+                f"token budgets are estimated at 4 characters per token; set LLM_TOKENIZER"
+            )
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [max(1, len(text) // 4) for text in texts]
+        return [len(ids) for ids in self.tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        """
+        (start, end) character offsets of every token in `text`, from one tokenizer call.
+        Without a fast tokenizer, words and punctuation marks stand in for tokens.
+        """
+        if self.tokenizer is not None and getattr(self.tokenizer, 'is_fast', False):
+            encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+            return [tuple(offset) for offset in encoding['offset_mapping']]
+        return [match.span() for match in re.finditer(r'\w+|[^\w\s]', text)]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+
+        if self.tokenizer is None:
+            return text[:max_tokens * 4]
+        ids = self.tokenizer(text, add_special_tokens=False)['input_ids'][:max_tokens]
+        return self.tokenizer.decode(ids)
+
+    @staticmethod
+    def _load(tokenizer_name: str):
+
+        if not tokenizer_name:
+            return None
+
+        def load():
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(tokenizer_name)
+
+        try:
+            return registry.get(f'tokenizer:{tokenizer_name}', load)
+        except Exception as e:
+            logger.error(f"Failed to load tokenizer {tokenizer_name}, estimating tokens: {e}")
+            return None
+
+
+def _merge_overlapping(first: str, second: str, max_overlap: int) -> Optional[str]:
+    """
+    Joins two texts when the end of `first` repeats the start of `second`
+    (the TextChunker overlap). Returns None when there is no such overlap.
+    """
+    probe = second[:min(40, len(second))]
+    if not probe:
+        return first
+
+    window_start = max(0, len(first) - max_overlap - len(probe))
+    position = first.find(probe, window_start)
+    while position != -1:
+        tail = first[position:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        position = first.find(probe, position + 1)
+    return None
+
+
+def _shingles(text: str) -> set:
+
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {hash(tuple(words))}
+    return {hash(tuple(words[i:i + SHINGLE_SIZE])) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+class ContextPacker:
+    """
+    Turns retrieved chunks (best first) into a prompt context within a token budget.
+
+    1. Chunks adjacent in the same paper and section (consecutive chunk_index) are merged,
+       and the overlapping text TextChunker repeats between them is written once.
+    2. Blocks whose word 5-gram Jaccard similarity with a better block exceeds
+       the dedup threshold are dropped.
+    3. Blocks are added by relevance while they fit the budget. The first block
+       is truncated if it alone exceeds the budget.
+    """
+
+    def __init__(self,
+                 token_budget: Optional[int] = None,
+                 dedup_threshold: Optional[float] = None,
+                 token_counter: Optional[TokenCounter] = None):
+        ml_config = settings.ML_CONFIG
+        self.token_budget = token_budget or ml_config.get('CONTEXT_TOKEN_BUDGET', 2000)
+        self.dedup_threshold = dedup_threshold or ml_config.get('CONTEXT_DEDUP_THRESHOLD', 0.8)
+        self.max_overlap = ml_config['CHUNK_OVERLAP'] * 2
+        self.token_counter = token_counter or TokenCounter()
+
+    def pack(self, chunks: List[Dict]) -> Dict:
+        """
+        Returns {'text', 'blocks', 'tokens', 'merged', 'dropped_duplicates', 'dropped_budget'}.
+        """
+        blocks = self._merge_adjacent(chunks)
+        merged = len(chunks) - len(blocks)
+
+        blocks, dropped_duplicates = self._drop_near_duplicates(blocks)
+
+        texts = [self._format_block(index, block) for index, block in enumerate(blocks, 1)]
+        token_counts = self.token_counter.count_many(texts)
+
+        selected = []
+        used = 0
+        for block, tokens in zip(blocks, token_counts):
+            if used + tokens <= self.token_budget:
+                selected.append(block)
+                used += tokens
+            elif not selected:
+                # the source header counts against the budget too
+                header_tokens = self.token_counter.count(self._format_block(1, {**block, 'content': ''}))
+                content_budget = max(self.token_budget - header_tokens, 1)
+                block = {**block, 'content': self.token_counter.truncate(block['content'], content_budget)}
+                selected.append(block)
+                used = self.token_counter.count(self._format_block(1, block))
+
+        text = "\n".join(self._format_block(index, block) for index, block in enumerate(selected, 1))
+
+        return {
+            'text': text,
+            'blocks': selected,
+            'tokens': used,
+            'merged': merged,
+            'dropped_duplicates': dropped_duplicates,
+            'dropped_budget': len(blocks) - len(selected),
+        }
+
+    def _merge_adjacent(self, chunks: List[Dict]) -> List[Dict]:
+
+        blocks: List[Dict] = []
+        # (paper, section, chunk_index) of each block's first / last chunk -> block position
+        heads: Dict[tuple, int] = {}
+        tails: Dict[tuple, int] = {}
+
+        for chunk in chunks:
+            metadata = chunk.get('metadata', {})
+            key = (metadata.get('paper_id'), metadata.get('section'))
+            chunk_index = metadata.get('chunk_index')
+
+            if chunk_index is None:
+                blocks.append({**chunk, 'metadata': dict(metadata), 'source_ids': [chunk['id']]})
+                continue
+
+            position = tails.pop((*key, chunk_index - 1), None)
+            if position is not None:
+                block = blocks[position]
+                block['content'] = self._join(block['content'], chunk['content'])
+                block['source_ids'].append(chunk['id'])
+                tails[(*key, chunk_index)] = position
+                continue
+
+            position = heads.pop((*key, chunk_index + 1), None)
+            if position is not None:
+                block = blocks[position]
+                block['content'] = self._join(chunk['content'], block['content'])
+                block['source_ids'].insert(0, chunk['id'])
+                block['metadata']['page_number'] = metadata.get('page_number', block['metadata'].get('page_number'))
+                heads[(*key, chunk_index)] = position
+                continue
+
+            blocks.append({**chunk, 'metadata': dict(metadata), 'source_ids': [chunk['id']]})
+            heads[(*key, chunk_index)] = len(blocks) - 1
+            tails[(*key, chunk_index)] = len(blocks) - 1
+
+        return blocks
+
+    def _join(self, first: str, second: str) -> str:
+
+        joined = _merge_overlapping(first, second, self.max_overlap)
+        return joined if joined is not None else f"{first}\n{second}"
+
+    def _drop_near_duplicates(self, blocks: List[Dict]):
+
+        kept = []
+        kept_shingles = []
+        dropped = 0
+
+        for block in blocks:
+            shingles = _shingles(block['content'])
+            duplicate = any(
+                len(shingles & other) / len(shingles | other) >= self.dedup_threshold
+                for other in kept_shingles
+            )
+            if duplicate:
+                dropped += 1
+                continue
+            kept.append(block)
+            kept_shingles.append(shingles)
+
+        return kept, dropped
+
+    @staticmethod
+    def _format_block(index: int, block: Dict) -> str:
+
+        metadata = block.get('metadata', {})
+        section = metadata.get('section', 'Unknown')
+        page = metadata.get('page_number', 'Unknown')
+        return f"[Source {index} - {section}, Page {page}]:\n{block['content']}\n"
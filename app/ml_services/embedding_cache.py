@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from django.conf import settings
+
+from app.ml_services.model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+
+    return " ".join(unicodedata.normalize('NFC', text).split())
+
+
+def text_hash(text: str) -> str:
+
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent (model, normalized text hash) -> float32 vector cache in a local SQLite file.
+
+    Vectors are stored as raw float32 blobs. Every hit refreshes last_used, and once
+    the table grows past max_entries the least recently used rows are evicted.
+    The file runs in WAL mode so web and worker processes can share it.
+    """
+
+    EVICT_EVERY = 1000
+
+    def __init__(self, path: str, max_entries: int = 500_000):
+        self.path = str(path)
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        connection.commit()
+
+    def get_many(self, model: str, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Returns ({index: vector} for cached texts, [indices that missed]).
+        """
+        hashes = [text_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+
+        found = {}
+        connection = self._connection()
+        # stay well below SQLite's bound-parameter limit
+        for start in range(0, len(unique_hashes), 500):
+            batch = unique_hashes[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *batch],
+            )
+            for row_hash, blob in rows:
+                found[row_hash] = np.frombuffer(blob, dtype=np.float32)
+
+        if found:
+            now = time.time()
+            connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(now, model, row_hash) for row_hash in found],
+            )
+            connection.commit()
+
+        cached = {}
+        missing = []
+        for index, row_hash in enumerate(hashes):
+            if row_hash in found:
+                cached[index] = found[row_hash]
+            else:
+                missing.append(index)
+
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(missing)
+
+        return cached, missing
+
+    def put_many(self, model: str, texts: List[str], embeddings: np.ndarray):
+
+        now = time.time()
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        connection = self._connection()
+        connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [
+                (model, text_hash(text), embeddings[index].tobytes(), now)
+                for index, text in enumerate(texts)
+            ],
+        )
+        connection.commit()
+
+        with self._lock:
+            self._puts_since_evict += len(texts)
+            should_evict = self._puts_since_evict >= self.EVICT_EVERY
+            if should_evict:
+                self._puts_since_evict = 0
+
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+
+        connection = self._connection()
+        (count,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return 0
+
+        connection.execute(
+            """
+            DELETE FROM embeddings WHERE (model, text_hash) IN (
+                SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            [overflow],
+        )
+        connection.commit()
+        logger.info(f"Evicted {overflow} embeddings from {self.path}")
+        return overflow
+
+    def stats(self) -> Dict:
+
+        lookups = self.hits + self.misses
+        (entries,) = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+
+    ml_config = settings.ML_CONFIG
+    if not ml_config.get('EMBEDDING_CACHE_ENABLED', True):
+        return None
+
+    path = ml_config['EMBEDDING_CACHE_PATH']
+    return registry.get(
+        f'embedding_cache:{path}',
+        lambda: EmbeddingCache(path, ml_config.get('EMBEDDING_CACHE_MAX_ENTRIES', 500_000)),
+    )
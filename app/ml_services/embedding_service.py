@@ -1,49 +1,98 @@
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Optional
+import numpy as np
+from typing import List, Dict, Iterable, Optional
+from itertools import islice
+from django.conf import settings
 import logging
 import uuid
 
+from app.ml_services.embedding_cache import get_embedding_cache
+from app.ml_services.model_registry import get_embedding_model
+from app.ml_services.vector_stores import VectorStore, get_vector_store
+
 logger = logging.getLogger(__name__)
 
+
+def encode_bucketed(model, texts: List[str], batch_size: int) -> np.ndarray:
+    """
+    Encodes texts in batches of similar token length so each batch pads to a
+    short maximum, writing into one preallocated contiguous float32 matrix
+    in the original order.
+    """
+    dimension = model.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+    if not texts:
+        return embeddings
+
+    token_lengths = model.tokenizer(
+        texts,
+        add_special_tokens=True,
+        truncation=True,
+        max_length=model.max_seq_length,
+        return_length=True,
+    )['length']
+    order = np.argsort(np.asarray(token_lengths), kind='stable')
+
+    for start in range(0, len(order), batch_size):
+        batch_indices = order[start:start + batch_size]
+        embeddings[batch_indices] = model.encode(
+            [texts[i] for i in batch_indices],
+            batch_size=len(batch_indices),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+
+    return embeddings
+
+
 class EmbeddingService:
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.model_name = SentenceTransformer(model_name)
+    def __init__(self,
+                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 batch_size: Optional[int] = None,
+                 vector_store: Optional[VectorStore] = None):
+        self.model_name = model_name
+        self.model = get_embedding_model(model_name)
+        self.batch_size = batch_size or settings.ML_CONFIG.get('EMBEDDING_BATCH_SIZE', 32)
 
-        self.chroma_client = chromadb.Client(Settings(
-            chroma_db_impl="duckdb+parquet",
-            persist_directory="./chroma_db"
-        ))
+        self.vector_store = vector_store or get_vector_store()
+        self.cache = get_embedding_cache()
 
         logger.info(f"Initialized embedding service with model: {model_name}")
 
-    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
-
+    def create_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 array. Texts already in the
+        embedding cache skip the encoder; only misses are encoded and stored.
+        """
         try:
-            embeddings = self.model.encode(texts, show_progress_bar=True)
-            return embeddings.tolist()
+            if self.cache is None:
+                return encode_bucketed(self.model, texts, self.batch_size)
+
+            cached, missing = self.cache.get_many(self.model_name, texts)
+
+            embeddings = np.empty(
+                (len(texts), self.model.get_sentence_embedding_dimension()),
+                dtype=np.float32,
+            )
+            for index, vector in cached.items():
+                embeddings[index] = vector
+
+            if missing:
+                missing_texts = [texts[i] for i in missing]
+                encoded = encode_bucketed(self.model, missing_texts, self.batch_size)
+                embeddings[missing] = encoded
+                self.cache.put_many(self.model_name, missing_texts, encoded)
+
+            return embeddings
         except Exception as e:
             logger.error(f"Failed to create embeddings: {e}")
             raise
 
-    def create_collection(self, collection_name: str) -> chromadb.Collection:
+    def create_collection(self, collection_name: str):
 
         try:
-
-            try:
-                self.chroma_client.delete_collection(collection_name)
-            except:
-                pass
-
-            collection = self.chroma_client.create_collection(
-                name = collection_name,
-                matadata={"hnsw:space": "cosine"}
-            )
-
+            self.vector_store.create_collection(collection_name)
             logger.info(f"Created collection: {collection_name}")
-            return collection
 
         except Exception as e:
             logger.error(f"Failed to create collection: {e}")
@@ -51,40 +100,72 @@ class EmbeddingService:
 
     def add_chunks_to_collection(self,
                                  collection_name: str,
-                                 chunks: List[Dict]
+                                 chunks: List[Dict],
+                                 extra_metadata: Optional[Dict] = None
                                  ) -> List[str]:
 
         try:
-            collection = self.chroma_client.get_collection(collection_name)
-
-            texts = [chunk['content'] for chunk in chunks]
-            embeddings = self.create_embeddings(texts)
-
-            ids = [str(uuid.uuid4()) for _ in chunks]
-
-            metadatas = []
-            for chunk in chunks:
-                metadata = {
-                    'chunk_index': chunk['chunk_index'],
-                    'page_number': chunk.get('page_number', 0),
-                    'section': chunk.get('metadata', {}).get('section', 'other'),
-                }
-                metadatas.append(metadata)
-
-            collection.add(
-                embeddings = embeddings,
-                documents = texts,
-                metadata = metadatas,
-                ids = ids,
-            )
-
-            logger.info(f"Added {len(chunks)} chunks to collection: {collection_name}")
-            return ids
+            embeddings = self.create_embeddings([chunk['content'] for chunk in chunks])
+            return self.add_embedded_chunks(collection_name, chunks, embeddings, extra_metadata)
 
         except Exception as e:
             logger.error(f"Failed to add chunks to collection: {e}")
             raise
 
+    def add_embedded_chunks(self,
+                            collection_name: str,
+                            chunks: List[Dict],
+                            embeddings: np.ndarray,
+                            extra_metadata: Optional[Dict] = None
+                            ) -> List[str]:
+        """
+        Stores chunks whose embeddings are already computed (e.g. reused from an older index).
+        """
+        ids = [str(uuid.uuid4()) for _ in chunks]
+
+        metadatas = []
+        for chunk in chunks:
+            metadata = {
+                'chunk_index': chunk['chunk_index'],
+                'page_number': chunk.get('page_number') or 0,
+                'section': chunk.get('section') or chunk.get('metadata', {}).get('section', 'other'),
+                **(extra_metadata or {}),
+            }
+            metadatas.append(metadata)
+
+        self.vector_store.add(
+            collection_name,
+            ids = ids,
+            embeddings = embeddings,
+            documents = [chunk['content'] for chunk in chunks],
+            metadatas = metadatas,
+        )
+
+        logger.info(f"Added {len(chunks)} chunks to collection: {collection_name}")
+        return ids
+
+    def add_chunks_streaming(self,
+                             collection_name: str,
+                             chunks: Iterable[Dict],
+                             batch_size: int = 64,
+                             extra_metadata: Optional[Dict] = None
+                             ) -> List[str]:
+        """
+        Consumes a chunk iterator (e.g. TextChunker.iter_chunks) in fixed-size batches,
+        so only one batch of texts and embeddings is alive at a time.
+        """
+        ids = []
+        chunk_iter = iter(chunks)
+
+        while True:
+            batch = list(islice(chunk_iter, batch_size))
+            if not batch:
+                break
+            ids.extend(self.add_chunks_to_collection(collection_name, batch, extra_metadata))
+
+        logger.info(f"Streamed {len(ids)} chunks into collection: {collection_name}")
+        return ids
+
     def search(self,
                collection_name: str,
                query: str,
@@ -93,27 +174,19 @@ class EmbeddingService:
                ) -> List[Dict]:
 
         try:
-            collection = self.chroma_client.get_collection(collection_name)
-
-            query_embedding = self.model.encode([query])[0].tolist()
+            query_embedding = self.create_embeddings([query])[0]
 
-            results = collection.query(
-                query_embeddings = [query_embedding],
-                n_retries = top_k,
-                where=filter_metadata
+            results = self.vector_store.query(
+                collection_name,
+                query_embedding,
+                top_k = top_k,
+                where = filter_metadata,
             )
 
-            formatted_results = []
-            for idx in range(len(results['ids'][0])):
-                formatted_results.append({
-                    'id': results['ids'][0][idx],
-                    'content': results['documents'][0][idx],
-                    'metadata': results['metadatas'][0][idx],
-                    'distance': results['distance'][0][idx],
-                    'similarity_score': 1 - results['distance'][0][idx],
-                })
+            for result in results:
+                result['similarity_score'] = 1 - result['distance']
 
-            return formatted_results
+            return results
 
         except Exception as e:
             logger.error(f"Failed to search results: {e}")
@@ -122,7 +195,7 @@ class EmbeddingService:
     def delete_collection(self, collection_name: str):
 
         try:
-            self.chroma_client.delete_collection(collection_name)
+            self.vector_store.delete_collection(collection_name)
             logger.info(f"Deleted collection: {collection_name}")
         except Exception as e:
             logger.error(f"Failed to delete collection: {e}")
\ No newline at end of file
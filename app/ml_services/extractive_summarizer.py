@@ -0,0 +1,181 @@
+from typing import Dict, List
+import logging
+import re
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+# a period after these does not end a sentence
+ABBREVIATIONS = {'e.g', 'i.e', 'et al', 'fig', 'figs', 'eq', 'eqs', 'sec', 'tab', 'vs', 'cf', 'approx', 'no', 'resp'}
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9(\[])')
+WORD = re.compile(r'[a-z][a-z0-9\-]+')
+
+STOP_WORDS = frozenset("""
+a an the and or but if of to in on for with by from as at is are was were be been being this that these
+those it its we our us they their them he she his her which who whom what when where while than then there
+here such can could may might will would shall should do does did done has have had not no nor so also into
+over under between through about above below each both any all some more most other only same very via
+""".split())
+
+
+def split_sentences(text: str) -> List[str]:
+
+    sentences = []
+    pending = ""
+    for piece in SENTENCE_END.split(" ".join(text.split())):
+        pending = f"{pending} {piece}" if pending else piece
+        last_words = pending.lower().rstrip('.').rsplit(' ', 2)
+        if (last_words[-1] in ABBREVIATIONS or " ".join(last_words[-2:]) in ABBREVIATIONS
+                or (len(last_words[-1]) == 1 and last_words[-1].isalpha())):
+            continue
+        sentences.append(pending)
+        pending = ""
+    if pending:
+        sentences.append(pending)
+    return sentences
+
+
+class ExtractiveSummarizer:
+    """
+    TextRank over TF-IDF sentence vectors, built with sparse matrix ops.
+
+    Sentences are TF-IDF encoded (sublinear tf, L2-normalized rows) into one CSR matrix;
+    their cosine-similarity graph is X @ X.T and centrality comes from a few power
+    iterations of PageRank on it. Selection takes sentences by centrality, skips ones
+    too similar to already selected sentences, stops at the length budget and returns
+    them in document order. A full paper takes tens of milliseconds, so this doubles as the
+    fallback when BART is unavailable and as an input-shrinking first stage.
+    """
+
+    def __init__(self,
+                 damping: float = 0.85,
+                 iterations: int = 30,
+                 redundancy_threshold: float = 0.6,
+                 min_sentence_words: int = 5):
+        self.damping = damping
+        self.iterations = iterations
+        self.redundancy_threshold = redundancy_threshold
+        self.min_sentence_words = min_sentence_words
+
+    def summarize(self, text: str, max_tokens: int) -> str:
+        """
+        ~max_tokens long summary (4 characters per token).
+        """
+        return self.summarize_lengths(text, {'summary': max_tokens})['summary']
+
+    def summarize_lengths(self, text: str, lengths: Dict[str, int]) -> Dict[str, str]:
+        """
+        Several summary lengths from one ranking, e.g. {'short': 200, 'medium': 500}.
+        """
+        sentences = split_sentences(text)
+        if not sentences:
+            return {name: "" for name in lengths}
+
+        ranked = self._rank(sentences)
+        return {
+            name: " ".join(sentences[index] for index in self._select(sentences, ranked, max_tokens * 4))
+            for name, max_tokens in lengths.items()
+        }
+
+    def compress(self, text: str, ratio: float) -> str:
+        """
+        Keeps the most central sentences covering about `ratio` of the text.
+        """
+        sentences = split_sentences(text)
+        if len(sentences) <= 2:
+            return text
+
+        ranked = self._rank(sentences)
+        return " ".join(sentences[index] for index in self._select(sentences, ranked, int(len(text) * ratio)))
+
+    def _rank(self, sentences: List[str]):
+        """
+        Returns (sentence indices by centrality, sentence cosine-similarity matrix).
+        """
+        matrix = self._tfidf(sentences)
+        similarity = (matrix @ matrix.T).tocsr()
+        similarity.setdiag(0)
+        # weak edges only add noise and density to the graph
+        similarity.data[similarity.data < 0.05] = 0
+        similarity.eliminate_zeros()
+
+        scores = self._pagerank(similarity)
+
+        # fragments (captions, equation debris) rarely make good summary sentences
+        word_counts = np.array([len(sentence.split()) for sentence in sentences])
+        scores = np.where(word_counts >= self.min_sentence_words, scores, scores * 0.1)
+
+        return np.argsort(-scores, kind='stable'), similarity
+
+    def _tfidf(self, sentences: List[str]) -> sparse.csr_matrix:
+
+        vocabulary: Dict[str, int] = {}
+        rows, columns = [], []
+        for row, sentence in enumerate(sentences):
+            for word in WORD.findall(sentence.lower()):
+                if word in STOP_WORDS:
+                    continue
+                rows.append(row)
+                columns.append(vocabulary.setdefault(word, len(vocabulary)))
+
+        shape = (len(sentences), max(len(vocabulary), 1))
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=shape
+        )
+        counts.sum_duplicates()
+
+        document_frequency = np.bincount(counts.indices, minlength=shape[1])
+        idf = np.log((1 + shape[0]) / (1 + document_frequency)).astype(np.float32) + 1
+
+        counts.data = 1 + np.log(counts.data)
+        weighted = counts @ sparse.diags(idf)
+
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ weighted
+
+    def _pagerank(self, similarity: sparse.csr_matrix) -> np.ndarray:
+
+        size = similarity.shape[0]
+        out_weight = np.asarray(similarity.sum(axis=1)).ravel()
+        dangling = out_weight == 0
+        out_weight[dangling] = 1
+        # the graph is symmetric, so the column-stochastic transition matrix is S @ D^-1
+        transition = (similarity @ sparse.diags(1 / out_weight)).tocsr()
+
+        scores = np.full(size, 1 / size, dtype=np.float64)
+        for _ in range(self.iterations):
+            dangling_mass = scores[dangling].sum() / size
+            updated = (1 - self.damping) / size + self.damping * (transition @ scores + dangling_mass)
+            if np.abs(updated - scores).sum() < 1e-6:
+                scores = updated
+                break
+            scores = updated
+        return scores
+
+    def _select(self, sentences: List[str], ranking, max_chars: int) -> List[int]:
+
+        order, similarity = ranking
+        lengths = np.array([len(sentence) + 1 for sentence in sentences])
+        # highest similarity of every sentence to any selected one
+        redundancy = np.zeros(len(sentences), dtype=np.float32)
+        selected: List[int] = []
+        used = 0
+
+        for index in order:
+            if selected and (used + lengths[index] > max_chars or redundancy[index] > self.redundancy_threshold):
+                continue
+            selected.append(int(index))
+            used += lengths[index]
+
+            start, end = similarity.indptr[index], similarity.indptr[index + 1]
+            neighbours = similarity.indices[start:end]
+            redundancy[neighbours] = np.maximum(redundancy[neighbours], similarity.data[start:end])
+            if used >= max_chars:
+                break
+
+        return sorted(selected)
@@ -0,0 +1,335 @@
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, F, Max
+from django.utils import timezone
+import heapq
+import itertools
+import logging
+import math
+import zlib
+
+import numpy as np
+from rest_framework.exceptions import Throttled
+
+from app.ml_services.models import ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+# key of the Postgres advisory lock held while dispatching
+DISPATCH_LOCK = zlib.crc32(b'fair_scheduler.dispatch')
+
+
+class QueueFull(Throttled):
+    """
+    Raised by FairScheduler.submit when queue depth is over a back-pressure threshold.
+    `retry_after` is a rough estimate in seconds; a DRF view that lets the exception
+    propagate answers 429 with a Retry-After header.
+    """
+    default_detail = 'Too many papers are queued for processing.'
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(wait=retry_after, detail=message)
+        self.retry_after = retry_after
+
+
+def finish_tag(virtual_time: float, user_last_tag: float, weight: float, cost: float = 1.0) -> float:
+    """
+    Weighted fair queuing tag: a job starts after the user's previous job and no earlier
+    than the current virtual time, and advances it by cost / weight. A user's 300th paper
+    gets a tag 300 units out, so a newcomer's single paper sorts ahead of most of them.
+    """
+    return max(virtual_time, user_last_tag) + cost / weight
+
+
+def choose_lane(user_pending: int, interactive_per_user: int) -> str:
+    """
+    The first few outstanding papers of a user are interactive; the rest of a bulk upload is bulk.
+    """
+    return INTERACTIVE if user_pending < interactive_per_user else BULK
+
+
+def dispatch_slots(max_in_flight: int,
+                   interactive_reserved: int,
+                   in_flight: int,
+                   interactive_waiting: int) -> Tuple[int, int]:
+    """
+    (interactive, bulk) jobs to dispatch now. Interactive jobs may use every free slot;
+    bulk jobs never take the last `interactive_reserved` ones, so an interactive upload
+    always starts within one dispatch even while a bulk backlog is draining.
+    """
+    free = max(max_in_flight - in_flight, 0)
+    interactive = min(free, interactive_waiting)
+    bulk = free - interactive - interactive_reserved
+    return interactive, max(bulk, 0)
+
+
+def wait_percentiles(waits: List[float]) -> Dict:
+
+    if not waits:
+        return {'count': 0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    waits = np.asarray(waits, dtype=np.float64)
+    return {
+        'count': len(waits),
+        'p50': float(np.percentile(waits, 50)),
+        'p95': float(np.percentile(waits, 95)),
+        'max': float(waits.max()),
+    }
+
+
+class FairQueue:
+    """
+    In-memory FairScheduler with the same lane, tag and slot rules, for simulations
+    (benchmark_fair_scheduling) where the database round trips would only add noise.
+    """
+
+    def __init__(self, max_in_flight: int, interactive_reserved: int, interactive_per_user: int):
+        self.max_in_flight = max_in_flight
+        self.interactive_reserved = interactive_reserved
+        self.interactive_per_user = interactive_per_user
+
+        self.queues = {lane: [] for lane in LANES}
+        self.last_tag: Dict[str, float] = defaultdict(float)
+        self.pending: Dict[str, int] = defaultdict(int)
+        self.virtual_time = 0.0
+        self.in_flight = {lane: 0 for lane in LANES}
+        self._sequence = itertools.count()
+
+    def submit(self, user, job, weight: float = 1.0, lane: Optional[str] = None) -> str:
+
+        lane = lane or choose_lane(self.pending[user], self.interactive_per_user)
+        tag = finish_tag(self._current_virtual_time(), self.last_tag[user], weight)
+        self.last_tag[user] = tag
+        self.pending[user] += 1
+        heapq.heappush(self.queues[lane], (tag, next(self._sequence), user, job))
+        return lane
+
+    def dispatch(self) -> List[Tuple[str, object, str]]:
+        """
+        Returns [(user, job, lane)] to start now.
+        """
+        interactive, bulk = dispatch_slots(
+            self.max_in_flight,
+            self.interactive_reserved,
+            sum(self.in_flight.values()),
+            len(self.queues[INTERACTIVE]),
+        )
+
+        started = []
+        for lane, slots in ((INTERACTIVE, interactive), (BULK, bulk)):
+            for _ in range(min(slots, len(self.queues[lane]))):
+                tag, _, user, job = heapq.heappop(self.queues[lane])
+                self.virtual_time = max(self.virtual_time, tag)
+                self.in_flight[lane] += 1
+                started.append((user, job, lane))
+        return started
+
+    def finish(self, user, lane: str):
+
+        self.in_flight[lane] -= 1
+        self.pending[user] -= 1
+
+    def _current_virtual_time(self) -> float:
+
+        heads = [queue[0][0] for queue in self.queues.values() if queue]
+        return min(heads) if heads else self.virtual_time
+
+
+class FairScheduler:
+    """
+    Per-user fair queuing in front of the paper-processing pipeline: tasks.process_paper
+    submits here, and dispatch starts the pipeline with tasks.start_pipeline.
+
+    A plain Celery queue is FIFO, so one user's bulk upload of 300 PDFs would delay every
+    other upload by hours. Papers are held in ScheduledJob rows instead. Each user's jobs
+    carry weighted fair queuing tags (weights by plan via SCHEDULER_PLAN_WEIGHTS), and at
+    most SCHEDULER_MAX_IN_FLIGHT pipelines are handed to Celery at a time. The Celery
+    queues stay short, and the dispatch order is decided here.
+
+    A user's first SCHEDULER_INTERACTIVE_PER_USER outstanding papers go to the interactive
+    lane. The rest go to the bulk lane, which never uses the SCHEDULER_INTERACTIVE_RESERVED
+    slots. Chat answers do not pass through here; they run in the web process. Their LLM
+    calls go ahead of batch work in the same process, and ahead of the workers' calls only
+    when OLLAMA_SLOTS_URL gives OllamaClient a shared Redis (see ollama_client.GlobalSlots).
+
+    Back-pressure: submit raises QueueFull once a user has SCHEDULER_MAX_QUEUED_PER_USER
+    queued papers, or, for bulk work, once SCHEDULER_MAX_QUEUED papers are queued in total.
+    """
+
+    def __init__(self):
+        ml_config = settings.ML_CONFIG
+        self.max_in_flight = ml_config.get('SCHEDULER_MAX_IN_FLIGHT', 8)
+        self.interactive_reserved = ml_config.get('SCHEDULER_INTERACTIVE_RESERVED', 2)
+        self.interactive_per_user = ml_config.get('SCHEDULER_INTERACTIVE_PER_USER', 2)
+        self.max_queued_per_user = ml_config.get('SCHEDULER_MAX_QUEUED_PER_USER', 500)
+        self.max_queued = ml_config.get('SCHEDULER_MAX_QUEUED', 5000)
+        self.plan_weights = ml_config.get('SCHEDULER_PLAN_WEIGHTS', {})
+
+    def weight_for(self, user) -> float:
+        """
+        Largest SCHEDULER_PLAN_WEIGHTS entry among the user's groups, 1 without a plan.
+        """
+        if not self.plan_weights:
+            return 1.0
+        groups = user.groups.values_list('name', flat=True)
+        return max([self.plan_weights[name] for name in groups if name in self.plan_weights], default=1.0)
+
+    def submit(self, paper, lane: Optional[str] = None) -> ScheduledJob:
+        """
+        Queues a saved paper for processing; dispatching happens after the transaction commits.
+        """
+        user = paper.user
+        weight = self.weight_for(user)
+
+        with transaction.atomic():
+            # tags of one user must be assigned one at a time
+            type(user).objects.select_for_update().filter(pk=user.pk).first()
+
+            outstanding = ScheduledJob.objects.filter(user=user, status__in=['queued', 'dispatched'])
+            queued = outstanding.filter(status='queued').count()
+            if queued >= self.max_queued_per_user:
+                raise QueueFull(
+                    f"{queued} papers are already queued for this user",
+                    self._retry_after(queued - self.max_queued_per_user + 1),
+                )
+
+            lane = lane or choose_lane(outstanding.count(), self.interactive_per_user)
+            if lane == BULK:
+                total_queued = ScheduledJob.objects.filter(status='queued').count()
+                if total_queued >= self.max_queued:
+                    raise QueueFull(
+                        f"{total_queued} papers are queued",
+                        self._retry_after(total_queued - self.max_queued + 1),
+                    )
+
+            user_last_tag = outstanding.aggregate(Max('virtual_finish'))['virtual_finish__max'] or 0.0
+            job = ScheduledJob.objects.create(
+                user=user,
+                paper=paper,
+                lane=lane,
+                virtual_finish=finish_tag(self._virtual_time(), user_last_tag, weight),
+            )
+
+        transaction.on_commit(self.dispatch)
+        return job
+
+    def dispatch(self) -> int:
+        """
+        Hands the next jobs to Celery while pipelines are below the in-flight limit.
+        Runs after every submit and finished job. Concurrent calls take turns: each one
+        waits for the previous dispatch to commit and then sees its jobs, so a slot freed
+        meanwhile is always refilled.
+        """
+        from app.ml_services.tasks import start_pipeline
+
+        with transaction.atomic():
+            self._lock_dispatch()
+
+            queued = ScheduledJob.objects.filter(status='queued').order_by('virtual_finish', 'enqueued_at')
+            interactive, bulk = dispatch_slots(
+                self.max_in_flight,
+                self.interactive_reserved,
+                ScheduledJob.objects.filter(status='dispatched').count(),
+                queued.filter(lane=INTERACTIVE).count(),
+            )
+
+            jobs = (
+                list(queued.filter(lane=INTERACTIVE).select_related('paper')[:interactive])
+                + list(queued.filter(lane=BULK).select_related('paper')[:bulk])
+            )
+            if not jobs:
+                return 0
+
+            now = timezone.now()
+            ScheduledJob.objects.filter(pk__in=[job.pk for job in jobs]).update(status='dispatched', dispatched_at=now)
+            for job in jobs:
+                start_pipeline(job.paper)
+                logger.info(
+                    f"Dispatched paper {job.paper_id} of user {job.user_id} ({job.lane}) "
+                    f"after {(now - job.enqueued_at).total_seconds():.1f}s in queue"
+                )
+
+        return len(jobs)
+
+    def job_finished(self, paper_id, failed: bool = False):
+        """
+        Frees the paper's in-flight slot and dispatches the next job.
+        """
+        finished = ScheduledJob.objects.filter(paper_id=paper_id, status='dispatched').update(
+            status='failed' if failed else 'done',
+            finished_at=timezone.now(),
+        )
+        if finished:
+            self.dispatch()
+
+    def stats(self, hours: int = 24) -> Dict:
+        """
+        Queue depth per lane and queue wait (dispatched_at - enqueued_at) percentiles in
+        seconds per lane and per user, over jobs dispatched in the last `hours`.
+        """
+        now = timezone.now()
+        recent = (
+            ScheduledJob.objects
+            .filter(dispatched_at__gte=now - timedelta(hours=hours))
+            .annotate(wait=F('dispatched_at') - F('enqueued_at'))
+            .values_list('user_id', 'lane', 'wait')
+        )
+
+        by_lane = defaultdict(list)
+        by_user = defaultdict(list)
+        for user_id, lane, wait in recent.iterator():
+            by_lane[lane].append(wait.total_seconds())
+            by_user[str(user_id)].append(wait.total_seconds())
+
+        queued = ScheduledJob.objects.filter(status='queued')
+        oldest = queued.order_by('enqueued_at').values_list('enqueued_at', flat=True).first()
+        return {
+            'queued': {lane: queued.filter(lane=lane).count() for lane in LANES},
+            'in_flight': ScheduledJob.objects.filter(status='dispatched').count(),
+            'oldest_queued_seconds': (now - oldest).total_seconds() if oldest else 0.0,
+            'wait_seconds': {lane: wait_percentiles(by_lane[lane]) for lane in LANES},
+            'wait_seconds_by_user': {user_id: wait_percentiles(waits) for user_id, waits in by_user.items()},
+        }
+
+    @staticmethod
+    def _lock_dispatch():
+
+        with connection.cursor() as cursor:
+            # released when the dispatching transaction ends
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [DISPATCH_LOCK])
+
+    def _virtual_time(self) -> float:
+        """
+        Tag of the next job to dispatch, or of the last dispatched one when nothing is queued.
+        """
+        heads = [
+            ScheduledJob.objects.filter(status='queued', lane=lane)
+            .order_by('virtual_finish').values_list('virtual_finish', flat=True).first()
+            for lane in LANES
+        ]
+        heads = [head for head in heads if head is not None]
+        if heads:
+            return min(heads)
+
+        last = (
+            ScheduledJob.objects.exclude(dispatched_at=None)
+            .order_by('-dispatched_at').values_list('virtual_finish', flat=True).first()
+        )
+        return last or 0.0
+
+    def _retry_after(self, jobs_ahead: int) -> int:
+
+        duration = (
+            ScheduledJob.objects
+            .filter(status='done', finished_at__gte=timezone.now() - timedelta(hours=1))
+            .aggregate(duration=Avg(F('finished_at') - F('dispatched_at')))['duration']
+        )
+        seconds = duration.total_seconds() if duration else 60.0
+        return max(int(math.ceil(jobs_ahead * seconds / max(self.max_in_flight, 1))), 1)
@@ -0,0 +1,142 @@
+from typing import Dict, Iterable, List, Optional
+from django.conf import settings
+import logging
+import zlib
+
+from app.ml_services.embedding_service import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+
+def build_filter(paper_id=None, user_id=None, section: Optional[str] = None,
+                 where: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Combines the common pre-filters into one Chroma-style `where` clause.
+    """
+    conditions = []
+    if paper_id is not None:
+        conditions.append({'paper_id': str(paper_id)})
+    if user_id is not None:
+        conditions.append({'user_id': str(user_id)})
+    if section:
+        conditions.append({'section': section})
+    if where:
+        conditions.append(where)
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {'$and': conditions}
+
+
+class GlobalVectorIndex:
+    """
+    One corpus-wide vector index instead of a collection per paper.
+
+    Every vector carries paper_id, user_id, section and page metadata, so per-paper,
+    per-user and whole-corpus top-k queries are a single filtered search per shard.
+    Papers are assigned to a fixed number of shards (GLOBAL_INDEX_SHARDS) by a hash
+    of their id. Query fan-out is bounded by the shard count and does not grow with
+    the number of papers, and a per-paper query touches exactly one shard.
+
+    A `generation` (see reindex.index_generation) gives the shards of one chunking /
+    embedding configuration their own names, so vectors from different embedding
+    models never share a shard and a re-index can build beside the serving version.
+    """
+
+    def __init__(self,
+                 embedding_service: Optional[EmbeddingService] = None,
+                 num_shards: Optional[int] = None,
+                 prefix: Optional[str] = None,
+                 generation: str = ''):
+        ml_config = settings.ML_CONFIG
+        self.embedding_service = embedding_service or EmbeddingService(ml_config['EMBEDDING_MODEL'])
+        self.vector_store = self.embedding_service.vector_store
+        self.num_shards = num_shards or ml_config.get('GLOBAL_INDEX_SHARDS', 1)
+        self.prefix = prefix or ml_config.get('GLOBAL_INDEX_PREFIX', 'papers_global')
+        self.generation = generation
+
+        for shard in self.shards():
+            self.vector_store.ensure_collection(shard)
+
+    def shards(self) -> List[str]:
+        return [self._shard_name(number) for number in range(self.num_shards)]
+
+    def shard_for(self, paper_id) -> str:
+        return self._shard_name(zlib.crc32(str(paper_id).encode()) % self.num_shards)
+
+    def is_global_collection(self, collection_name: str) -> bool:
+        return collection_name.startswith(f'{self.prefix}_')
+
+    def paper_metadata(self, paper) -> Dict:
+
+        return {
+            'paper_id': str(paper.pk),
+            'user_id': str(paper.user_id),
+        }
+
+    def add_paper_chunks(self, paper, chunks: Iterable[Dict], batch_size: int = 64) -> List[str]:
+        """
+        Embeds and stores a paper's chunks (a list or a streaming iterator) in its shard.
+        """
+        shard = self.shard_for(paper.pk)
+        ids = self.embedding_service.add_chunks_streaming(
+            shard, chunks, batch_size=batch_size, extra_metadata=self.paper_metadata(paper),
+        )
+        logger.info(f"Indexed {len(ids)} chunks of paper {paper.pk} into {shard}")
+        return ids
+
+    def delete_paper(self, paper_id, shard: Optional[str] = None):
+
+        self.vector_store.delete(shard or self.shard_for(paper_id), {'paper_id': str(paper_id)})
+
+    def search(self,
+               query: str,
+               top_k: int = 5,
+               paper_id=None,
+               user_id=None,
+               section: Optional[str] = None,
+               where: Optional[Dict] = None,
+               shard: Optional[str] = None) -> List[Dict]:
+        """
+        `shard` searches a paper's recorded collection (Paper.collection_name), which may
+        belong to an older generation while a re-index is in progress.
+        """
+        try:
+            query_embedding = self.embedding_service.create_embeddings([query])[0]
+            return self.search_by_vector(query_embedding, top_k, paper_id, user_id, section, where, shard)
+
+        except Exception as e:
+            logger.error(f"Failed to search global index: {e}")
+            raise
+
+    def search_by_vector(self,
+                         query_embedding,
+                         top_k: int = 5,
+                         paper_id=None,
+                         user_id=None,
+                         section: Optional[str] = None,
+                         where: Optional[Dict] = None,
+                         shard: Optional[str] = None) -> List[Dict]:
+
+        filters = build_filter(paper_id, user_id, section, where)
+        if shard:
+            shards = [shard]
+        else:
+            shards = [self.shard_for(paper_id)] if paper_id is not None else self.shards()
+
+        results = []
+        for shard in shards:
+            results.extend(self.vector_store.query(shard, query_embedding, top_k=top_k, where=filters))
+
+        results.sort(key=lambda result: result['distance'])
+        results = results[:top_k]
+        for result in results:
+            result['similarity_score'] = 1 - result['distance']
+        return results
+
+    def _shard_name(self, number: int) -> str:
+        if self.generation:
+            return f'{self.prefix}_{self.generation}_{number:03d}'
+        return f'{self.prefix}_{number:03d}'
@@ -0,0 +1,205 @@
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+import logging
+import time
+
+from app.ml_services.context_packer import TokenCounter
+from app.ml_services.extractive_summarizer import ExtractiveSummarizer
+from app.ml_services.section_detector import SectionDetector
+from app.ml_services.summarization_service import SummarizationService
+from app.ml_services.text_chunker import TextChunker
+
+logger = logging.getLogger(__name__)
+
+
+# guards against summaries that stop shrinking (e.g. the extractive fallback)
+MAX_REDUCE_ROUNDS = 5
+
+
+class HierarchicalSummarizer:
+    """
+    Map-reduce summarization that covers a whole paper instead of its first tokens.
+
+    split:  each section (PDFProcessor / SectionDetector spans) is chunked with TextChunker
+            and consecutive chunks are packed into pieces that fit the model's input limit.
+    map:    pieces are summarized in padded batches; pieces already shorter than a map
+            summary are passed through unchanged.
+    reduce: map summaries are packed and summarized again until they fit one input.
+    final:  the short / medium / long summaries are generated from that input.
+    """
+
+    def __init__(self,
+                 summarization_service: Optional[SummarizationService] = None,
+                 max_input_tokens: Optional[int] = None,
+                 map_max_length: int = 150,
+                 map_min_length: int = 40,
+                 batch_size: Optional[int] = None,
+                 prefilter_ratio: Optional[float] = None):
+        ml_config = settings.ML_CONFIG
+        self.service = summarization_service or SummarizationService(ml_config['SUMMARIZATION_MODEL'])
+        self.token_counter = TokenCounter(ml_config['SUMMARIZATION_MODEL'])
+        self.max_input_tokens = max_input_tokens or ml_config.get('SUMMARY_MAX_INPUT_TOKENS', 1000)
+        self.map_max_length = map_max_length
+        self.map_min_length = map_min_length
+        self.batch_size = batch_size or ml_config.get('SUMMARY_BATCH_SIZE', 8)
+        # 0 < ratio < 1 keeps that share of each section's most central sentences before the map stage
+        self.prefilter_ratio = prefilter_ratio if prefilter_ratio is not None else ml_config.get('SUMMARY_EXTRACTIVE_PREFILTER', 0.0)
+        self.extractive = ExtractiveSummarizer()
+        # overlapping text would only be summarized twice
+        self.chunker = TextChunker(chunk_size=ml_config['CHUNK_SIZE'], chunk_overlap=0)
+        self.section_detector = SectionDetector()
+
+    def summarize(self, text: str, sections: Optional[Dict] = None) -> Dict:
+        """
+        Returns {'summaries': {'short', 'medium', 'long'}, 'condensed', 'timings_ms', 'stats'}.
+        `condensed` is the reduced whole-paper text, reusable as LLM input.
+        """
+        return self.summarize_many([text], [sections])[0]
+
+    def summarize_many(self, texts: List[str], sections: Optional[List[Optional[Dict]]] = None) -> List[Dict]:
+        """
+        summarize() for several papers at once: the map, reduce and final stages of all
+        papers share padded batches. Timings are for the whole batch.
+        """
+        sections = sections or [None] * len(texts)
+        timings = {}
+        started = time.perf_counter()
+
+        stage = time.perf_counter()
+        sections = [
+            paper_sections if paper_sections is not None else self.section_detector.detect(text)
+            for text, paper_sections in zip(texts, sections)
+        ]
+        pieces = [self._split(text, paper_sections) for text, paper_sections in zip(texts, sections)]
+        timings['split'] = (time.perf_counter() - stage) * 1000
+
+        stage = time.perf_counter()
+        summaries = self._summarize_grouped(pieces)
+        timings['map'] = (time.perf_counter() - stage) * 1000
+
+        stage = time.perf_counter()
+        rounds = [0] * len(texts)
+        packed = [self._pack(paper_summaries) for paper_summaries in summaries]
+        while True:
+            pending = [
+                index for index, paper_packed in enumerate(packed)
+                if len(paper_packed) > 1 and rounds[index] < MAX_REDUCE_ROUNDS
+            ]
+            if not pending:
+                break
+            reduced = self._summarize_grouped([packed[index] for index in pending])
+            for index, paper_summaries in zip(pending, reduced):
+                rounds[index] += 1
+                packed[index] = self._pack(paper_summaries)
+        condensed = [self._condense(paper_packed) for paper_packed in packed]
+        timings['reduce'] = (time.perf_counter() - stage) * 1000
+
+        stage = time.perf_counter()
+        final = self.service.generate_multi_length_summaries_batch(condensed, batch_size=self.batch_size)
+        timings['final'] = (time.perf_counter() - stage) * 1000
+        timings['total'] = (time.perf_counter() - started) * 1000
+
+        condensed_tokens = self.token_counter.count_many(condensed)
+        logger.info(
+            f"Hierarchical summaries of {len(texts)} papers: {sum(map(len, pieces))} pieces, "
+            f"up to {max(rounds, default=0)} reduce rounds in {timings['total']:.0f} ms"
+        )
+
+        return [
+            {
+                'summaries': final[index],
+                'condensed': condensed[index],
+                'timings_ms': {name: round(value, 1) for name, value in timings.items()},
+                'stats': {
+                    'sections': len(sections[index]),
+                    'pieces': len(pieces[index]),
+                    'reduce_rounds': rounds[index],
+                    'condensed_tokens': condensed_tokens[index] if condensed[index] else 0,
+                    'batch_papers': len(texts),
+                },
+            }
+            for index in range(len(texts))
+        ]
+
+    def _split(self, text: str, sections: Dict) -> List[str]:
+
+        spans = sorted((span['start'], span['end']) for span in sections.values())
+        if not spans:
+            spans = [(0, len(text))]
+        elif spans[0][0] > 0:
+            # text before the first heading (title, abstract without a heading)
+            spans.insert(0, (0, spans[0][0]))
+
+        pieces = []
+        for start, end in spans:
+            section_text = text[start:end]
+            if 0 < self.prefilter_ratio < 1:
+                section_text = self.extractive.compress(section_text, self.prefilter_ratio)
+            chunks = [chunk['content'] for chunk in self.chunker.chunk_text(section_text)]
+            pieces.extend(self._pack(chunks))
+        return pieces
+
+    def _pack(self, texts: List[str]) -> List[str]:
+        """
+        Greedily joins consecutive texts into pieces of at most max_input_tokens.
+        """
+        texts = [text for text in texts if text.strip()]
+        pieces = []
+        current: List[str] = []
+        current_tokens = 0
+
+        for text, tokens in zip(texts, self.token_counter.count_many(texts)):
+            if current and current_tokens + tokens > self.max_input_tokens:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+
+        if current:
+            pieces.append("\n".join(current))
+        return pieces
+
+    def _condense(self, packed: List[str]) -> str:
+        """
+        The final-stage input of one paper. When MAX_REDUCE_ROUNDS left several pieces,
+        each is truncated to an equal share of the input budget and all are joined, so
+        every part of the paper still reaches the final summary.
+        """
+        if len(packed) <= 1:
+            return packed[0] if packed else ""
+
+        logger.warning(f"Summaries stopped shrinking after {MAX_REDUCE_ROUNDS} reduce rounds; "
+                       f"truncating {len(packed)} pieces to fit one input")
+        share = max(1, self.max_input_tokens // len(packed))
+        return "\n".join(self.token_counter.truncate(piece, share) for piece in packed)
+
+    def _summarize_grouped(self, groups: List[List[str]]) -> List[List[str]]:
+        """
+        Summarizes the pieces of several papers in one batched call, regrouped per paper.
+        """
+        flat = [piece for group in groups for piece in group]
+        summaries = iter(self._summarize_pieces(flat))
+        return [[next(summaries) for _ in group] for group in groups]
+
+    def _summarize_pieces(self, pieces: List[str]) -> List[str]:
+
+        if not pieces:
+            return []
+
+        token_counts = self.token_counter.count_many(pieces)
+        to_summarize: List[Tuple[int, str]] = [
+            (position, piece)
+            for position, (piece, tokens) in enumerate(zip(pieces, token_counts))
+            if tokens > self.map_max_length
+        ]
+
+        summaries = list(pieces)
+        outputs = self.service.summarize_batch(
+            [piece for _, piece in to_summarize],
+            max_length=self.map_max_length,
+            min_length=self.map_min_length,
+            batch_size=self.batch_size,
+        )
+        for (position, _), summary in zip(to_summarize, outputs):
+            summaries[position] = summary
+        return summaries
@@ -0,0 +1,74 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.ml_services.context_packer import TokenCounter
+from app.ml_services.text_chunker import embedding_max_tokens
+from app.papers.models import PaperChunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Token-length distribution of stored PaperChunk rows under the embedding model's tokenizer: "
+        "percentiles, share truncated at the model's max sequence length and padding waste per batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paper', help="Only chunks of this paper id")
+        parser.add_argument('--limit', type=int, default=0, help="Analyze at most this many chunks (0 = all)")
+        parser.add_argument('--batch-size', type=int, default=settings.ML_CONFIG.get('EMBEDDING_BATCH_SIZE', 32))
+        parser.add_argument('--bucket', type=int, default=32, help="Histogram bucket width in tokens")
+
+    def handle(self, *args, **options):
+        counter = TokenCounter(settings.ML_CONFIG['EMBEDDING_MODEL'])
+        max_tokens = embedding_max_tokens()
+
+        chunks = PaperChunk.objects.order_by('paper_id', 'chunk_index')
+        if options['paper']:
+            chunks = chunks.filter(paper_id=options['paper'])
+        contents = chunks.values_list('content', flat=True)
+        if options['limit']:
+            contents = contents[:options['limit']]
+
+        lengths = []
+        batch = []
+        for content in contents.iterator(chunk_size=2000):
+            batch.append(content)
+            if len(batch) == 2000:
+                lengths.extend(counter.count_many(batch))
+                batch = []
+        lengths.extend(counter.count_many(batch))
+
+        if not lengths:
+            self.stderr.write("No chunks to analyze")
+            return
+
+        lengths = np.array(lengths)
+        self.stdout.write(
+            f"{len(lengths)} chunks | mean {lengths.mean():.1f} | "
+            + " | ".join(f"p{q} {np.percentile(lengths, q):.0f}" for q in (5, 50, 90, 99))
+            + f" | max {lengths.max()}"
+        )
+        truncated = lengths > max_tokens
+        self.stdout.write(
+            f"over the {max_tokens}-token model limit: {truncated.mean() * 100:.1f}% of chunks, "
+            f"{(lengths[truncated] - max_tokens).sum() / lengths.sum() * 100:.1f}% of all tokens never embedded"
+        )
+
+        # padding each batch to its longest chunk (capped at the model limit)
+        batch_size = options['batch_size']
+        for label, ordered in (('stored order', lengths), ('length-sorted', np.sort(lengths))):
+            capped = np.minimum(ordered, max_tokens)
+            padded = sum(
+                capped[start:start + batch_size].max() * len(capped[start:start + batch_size])
+                for start in range(0, len(capped), batch_size)
+            )
+            self.stdout.write(f"padding waste at batch {batch_size} ({label}): {(1 - capped.sum() / padded) * 100:.1f}%")
+
+        width = options['bucket']
+        histogram = np.bincount(lengths // width)
+        peak = histogram.max()
+        for bucket, count in enumerate(histogram):
+            if count:
+                bar = '#' * max(1, int(40 * count / peak))
+                self.stdout.write(f"{bucket * width:5d}-{(bucket + 1) * width - 1:<5d} {count:7d} {bar}")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from app.ml_services.answer_cache import get_answer_cache
+
+
+class Command(BaseCommand):
+    help = "Prints answer cache hit rate and size; --evict drops expired and least recently used entries first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evict', action='store_true')
+        parser.add_argument('--paper', help="Invalidate the cached answers of one paper")
+
+    def handle(self, *args, **options):
+        cache = get_answer_cache()
+        if cache is None:
+            self.stderr.write("Answer cache is disabled (ANSWER_CACHE_ENABLED)")
+            return
+
+        if options['paper']:
+            self.stdout.write(f"Invalidated {cache.invalidate_paper(options['paper'])} answers")
+        if options['evict']:
+            self.stdout.write(f"Evicted {cache.evict()} answers")
+
+        stats = cache.stats()
+        self.stdout.write(
+            f"hits {stats['hits']} | misses {stats['misses']} | hit rate {stats['hit_rate']:.3f} | "
+            f"entries {stats['entries']}/{stats['max_entries']}"
+        )
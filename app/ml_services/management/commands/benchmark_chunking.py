@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.ml_services.management.commands._synthetic import PARAGRAPH
+from app.ml_services.text_chunker import PAGE_HEADER, TextChunker
+from app.papers.models import Paper
+
+
+class Command(BaseCommand):
+    help = "Chunking throughput on whole-paper text: RecursiveCharacterTextSplitter vs TextChunker's single-pass splitter"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--papers', type=int, default=10,
+                            help="Ready papers to chunk; synthetic papers are added when there are fewer")
+        parser.add_argument('--pages', type=int, default=30, help="Pages per synthetic paper")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        chunk_size = settings.ML_CONFIG['CHUNK_SIZE']
+        chunk_overlap = settings.ML_CONFIG['CHUNK_OVERLAP']
+
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        chunker = TextChunker(chunk_size, chunk_overlap)
+
+        papers = self._papers(options['papers'], options['pages'], options['seed'])
+        texts = ["".join(PAGE_HEADER.format(page_number=page['page_number']) + page['text'] for page in pages)
+                 for pages in papers]
+        megabytes = sum(len(text) for text in texts) * options['repeat'] / 1e6
+
+        runs = {
+            'recursive splitter': lambda: sum(len(splitter.split_text(text)) for text in texts),
+            'native split_text': lambda: sum(len(chunker.split_text(text)) for text in texts),
+            'native chunk_pages': lambda: sum(len(chunker.chunk_pages(pages)) for pages in papers),
+        }
+
+        self.stdout.write(f"{len(texts)} papers, {megabytes / options['repeat']:.2f} MB of text")
+        baseline = None
+        for name, run in runs.items():
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                num_chunks = run()
+            elapsed = time.perf_counter() - started
+            baseline = baseline or elapsed
+            self.stdout.write(
+                f"{name:<20} | {num_chunks:6d} chunks | {megabytes / elapsed:8.2f} MB/s | "
+                f"{baseline / elapsed:5.1f}x"
+            )
+
+    def _papers(self, count: int, pages_per_paper: int, seed: int):
+
+        papers = []
+        for paper in Paper.objects.filter(status='ready').exclude(full_text='')[:count]:
+            # re-split stored full_text on the page headers PDFProcessor wrote
+            pieces = paper.full_text.split("\n\n[Page ")[1:]
+            papers.append([
+                {'page_number': int(piece.split(']', 1)[0]), 'text': piece.split(']\n', 1)[-1]}
+                for piece in pieces
+            ])
+
+        rng = random.Random(seed)
+        words = PARAGRAPH.split()
+        while len(papers) < count:
+            papers.append([
+                {
+                    'page_number': page_number,
+                    'text': "\n\n".join(
+                        " ".join(rng.choice(words) for _ in range(rng.randint(20, 150)))
+                        for _ in range(rng.randint(4, 10))
+                    ),
+                }
+                for page_number in range(1, pages_per_paper + 1)
+            ])
+        return papers
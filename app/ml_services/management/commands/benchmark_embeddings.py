@@ -0,0 +1,51 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.ml_services.embedding_service import encode_bucketed
+from app.ml_services.management.commands._synthetic import PARAGRAPH
+from app.ml_services.model_registry import get_embedding_model
+
+
+class Command(BaseCommand):
+    help = "Measure CPU embedding throughput (chunks/sec) of plain encode vs length-bucketed batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=2000)
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[8, 16, 32, 64, 128])
+        parser.add_argument('--model', default=settings.ML_CONFIG['EMBEDDING_MODEL'])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        model = get_embedding_model(options['model'])
+        texts = self._synthetic_chunks(options['chunks'], options['seed'])
+
+        # warm up so the first measurement does not include lazy initialisation
+        model.encode(texts[:16], show_progress_bar=False)
+
+        for batch_size in options['batch_sizes']:
+            started = time.perf_counter()
+            model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+            plain = time.perf_counter() - started
+
+            started = time.perf_counter()
+            encode_bucketed(model, texts, batch_size)
+            bucketed = time.perf_counter() - started
+
+            self.stdout.write(
+                f"batch {batch_size:>4} | "
+                f"encode {len(texts) / plain:8.1f} chunks/s | "
+                f"bucketed {len(texts) / bucketed:8.1f} chunks/s"
+            )
+
+    def _synthetic_chunks(self, count: int, seed: int):
+
+        # chunk lengths vary widely in real papers (captions vs. full paragraphs)
+        rng = random.Random(seed)
+        words = PARAGRAPH.split()
+        return [
+            " ".join(rng.choice(words) for _ in range(rng.randint(8, 220)))
+            for _ in range(count)
+        ]
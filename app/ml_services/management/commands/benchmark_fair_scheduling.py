@@ -0,0 +1,142 @@
+from collections import deque
+import heapq
+import itertools
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.ml_services.fair_scheduler import FairQueue, wait_percentiles
+
+
+class _FifoQueue:
+    """
+    Baseline: one shared FIFO queue, as with plain Celery.
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.queue = deque()
+        self.in_flight = 0
+
+    def submit(self, user, job, weight: float = 1.0, lane=None) -> str:
+        self.queue.append((user, job))
+        return 'fifo'
+
+    def dispatch(self):
+        started = []
+        while self.queue and self.in_flight < self.max_in_flight:
+            user, job = self.queue.popleft()
+            self.in_flight += 1
+            started.append((user, job, 'fifo'))
+        return started
+
+    def finish(self, user, lane: str):
+        self.in_flight -= 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Discrete-event simulation of paper-processing queue wait under synthetic load: bulk uploaders "
+        "plus many single-paper users, shared FIFO vs. FairScheduler's lanes and fair queuing."
+    )
+
+    def add_arguments(self, parser):
+        ml_config = settings.ML_CONFIG
+        parser.add_argument('--workers', type=int, default=ml_config.get('SCHEDULER_MAX_IN_FLIGHT', 8),
+                            help="Pipelines processed concurrently")
+        parser.add_argument('--bulk-users', type=int, default=2)
+        parser.add_argument('--bulk-papers', type=int, default=300, help="Papers per bulk upload")
+        parser.add_argument('--users', type=int, default=100, help="Users uploading one or two papers")
+        parser.add_argument('--hours', type=float, default=4, help="Window in which uploads arrive")
+        parser.add_argument('--service-seconds', type=float, default=90, help="Median pipeline duration")
+        parser.add_argument('--reserved', type=int, default=ml_config.get('SCHEDULER_INTERACTIVE_RESERVED', 2),
+                            help="Slots bulk work may not use; 0 makes the fair policy work-conserving")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        ml_config = settings.ML_CONFIG
+        arrivals, service = self._workload(options)
+        self.stdout.write(
+            f"{len(arrivals)} papers from {options['bulk_users']} bulk and {options['users']} other users, "
+            f"{options['workers']} workers, median pipeline {options['service_seconds']:.0f}s"
+        )
+
+        policies = {
+            'fifo': lambda: _FifoQueue(options['workers']),
+            'fair': lambda: FairQueue(
+                options['workers'],
+                options['reserved'],
+                ml_config.get('SCHEDULER_INTERACTIVE_PER_USER', 2),
+            ),
+        }
+
+        results = {}
+        for name, make_queue in policies.items():
+            waits, makespan = self._simulate(make_queue(), arrivals, service)
+            results[name] = waits
+            for group in ('single', 'bulk'):
+                stats = wait_percentiles(waits[group])
+                self.stdout.write(
+                    f"{name:<5} {group:<7} | {stats['count']:5d} papers | p50 {stats['p50'] / 60:7.1f} min | "
+                    f"p95 {stats['p95'] / 60:7.1f} min | max {stats['max'] / 60:7.1f} min"
+                )
+            self.stdout.write(f"{name:<5} all papers processed after {makespan / 3600:.2f} h")
+
+        fifo_p95 = wait_percentiles(results['fifo']['single'])['p95']
+        fair_p95 = wait_percentiles(results['fair']['single'])['p95']
+        self.stdout.write(self.style.SUCCESS(
+            f"p95 wait of single-paper users: {fifo_p95 / 60:.1f} min -> {fair_p95 / 60:.1f} min "
+            f"({fifo_p95 / max(fair_p95, 1e-9):.1f}x lower)"
+        ))
+
+    def _workload(self, options):
+        """
+        [(arrival seconds, user, group)] sorted by time and the service time of every paper.
+        Both policies replay the same workload.
+        """
+        rng = random.Random(options['seed'])
+        horizon = options['hours'] * 3600
+
+        arrivals = []
+        for number in range(options['bulk_users']):
+            # bulk uploads land within a minute, at random points of the first half of the window
+            start = rng.uniform(0, horizon / 2)
+            arrivals.extend(
+                (start + rng.uniform(0, 60), f'bulk-{number}', 'bulk')
+                for _ in range(options['bulk_papers'])
+            )
+        for number in range(options['users']):
+            arrivals.extend(
+                (rng.uniform(0, horizon), f'user-{number}', 'single')
+                for _ in range(rng.choice((1, 1, 1, 2)))
+            )
+        arrivals.sort()
+
+        service = [rng.lognormvariate(0, 0.5) * options['service_seconds'] for _ in arrivals]
+        return arrivals, service
+
+    def _simulate(self, queue, arrivals, service):
+
+        events = []
+        sequence = itertools.count()
+        for job, (time, user, group) in enumerate(arrivals):
+            heapq.heappush(events, (time, next(sequence), 'arrive', job))
+
+        waits = {'single': [], 'bulk': []}
+        now = 0.0
+        while events:
+            now, _, kind, payload = heapq.heappop(events)
+            if kind == 'arrive':
+                _, user, _ = arrivals[payload]
+                queue.submit(user, payload)
+            else:
+                user, lane = payload
+                queue.finish(user, lane)
+
+            for user, job, lane in queue.dispatch():
+                arrived, _, group = arrivals[job]
+                waits[group].append(now - arrived)
+                heapq.heappush(events, (now + service[job], next(sequence), 'finish', (user, lane)))
+
+        return waits, now
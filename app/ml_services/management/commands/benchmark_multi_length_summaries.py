@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rouge_score import rouge_scorer
+
+from app.ml_services.management.commands._synthetic import PARAGRAPH
+from app.ml_services.summarization_service import MULTI_LENGTH_MODES, SummarizationService
+from app.papers.models import Paper
+
+
+class Command(BaseCommand):
+    help = (
+        "Wall time and ROUGE of multi-length summary modes. ROUGE is measured against the "
+        "'independent' mode (three full generations), i.e. how closely a cheaper mode reproduces it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--papers', type=int, default=5,
+                            help="Ready papers to summarize; synthetic text is used when there are none")
+        parser.add_argument('--model', default=settings.ML_CONFIG['SUMMARIZATION_MODEL'])
+
+    def handle(self, *args, **options):
+        service = SummarizationService(options['model'])
+        if service.summarizer is None:
+            self.stderr.write(f"Could not load {options['model']}")
+            return
+
+        texts = list(
+            Paper.objects.filter(status='ready').exclude(full_text='')
+            .values_list('full_text', flat=True)[:options['papers']]
+        )
+        if not texts:
+            texts = [PARAGRAPH * 40]
+
+        # warm up so the first measurement does not include lazy initialisation
+        service.summarize(PARAGRAPH, max_length=40, min_length=10)
+
+        scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+        outputs = {mode: [] for mode in MULTI_LENGTH_MODES}
+        seconds = {mode: [] for mode in MULTI_LENGTH_MODES}
+
+        for text in texts:
+            for mode in MULTI_LENGTH_MODES:
+                started = time.perf_counter()
+                outputs[mode].append(service.generate_multi_length_summaries(text, mode=mode))
+                seconds[mode].append(time.perf_counter() - started)
+
+        baseline = np.mean(seconds['independent'])
+        self.stdout.write(f"{len(texts)} texts")
+        for mode in MULTI_LENGTH_MODES:
+            scores = {'rouge1': [], 'rouge2': [], 'rougeL': []}
+            for reference, candidate in zip(outputs['independent'], outputs[mode]):
+                for length in ('short', 'medium', 'long'):
+                    for name, score in scorer.score(reference[length], candidate[length]).items():
+                        scores[name].append(score.fmeasure)
+
+            mean_seconds = np.mean(seconds[mode])
+            self.stdout.write(
+                f"{mode:<15} | {mean_seconds:7.2f} s/paper ({mean_seconds / baseline:5.2f}x) | "
+                + " | ".join(f"{name} {np.mean(values):.3f}" for name, values in scores.items())
+            )
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.ml_services.management.commands._synthetic import build_synthetic_pdf
+from app.ml_services.pdf_processor import PDFProcessor
+
+
+class Command(BaseCommand):
+    help = "Compare serial and parallel PDFProcessor.extract_text throughput (pages/sec) on synthetic PDFs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[200, 400, 800])
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        processor = PDFProcessor(max_workers=options['workers'])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for num_pages in options['pages']:
+                pdf_path = os.path.join(tmp_dir, f'synthetic_{num_pages}.pdf')
+                build_synthetic_pdf(pdf_path, num_pages)
+
+                serial = self._measure(processor, pdf_path, False, options['repeat'])
+                parallel = self._measure(processor, pdf_path, True, options['repeat'])
+
+                self.stdout.write(
+                    f"{num_pages:>5} pages | "
+                    f"serial {num_pages / serial:8.1f} pages/s | "
+                    f"parallel ({options['workers']} workers) {num_pages / parallel:8.1f} pages/s | "
+                    f"speedup {serial / parallel:4.2f}x"
+                )
+
+    def _measure(self, processor: PDFProcessor, pdf_path: str, parallel: bool, repeat: int) -> float:
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            processor.extract_text(pdf_path, parallel=parallel)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from app.ml_services.management.commands._synthetic import build_synthetic_pdf
+
+
+def _run_mode(mode: str, pdf_path: str, queue):
+    # runs in a freshly spawned interpreter so ru_maxrss only reflects this mode
+    from app.ml_services.pdf_processor import PDFProcessor
+    from app.ml_services.text_chunker import TextChunker
+
+    processor = PDFProcessor(max_workers=1)
+    chunker = TextChunker()
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if mode == 'eager':
+        result = processor.extract_text(pdf_path, parallel=False)
+        num_chunks = len(chunker.chunk_text(result['full_text']))
+    else:
+        num_chunks = sum(1 for _ in chunker.iter_chunks(processor.iter_pages(pdf_path)))
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((baseline_kb, peak_kb, num_chunks))
+
+
+class Command(BaseCommand):
+    help = "Compare peak RSS of eager extract_text + chunk_text against the iter_pages/iter_chunks pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[250, 1000])
+
+    def handle(self, *args, **options):
+        ctx = multiprocessing.get_context('spawn')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for num_pages in options['pages']:
+                pdf_path = os.path.join(tmp_dir, f'synthetic_{num_pages}.pdf')
+                build_synthetic_pdf(pdf_path, num_pages)
+
+                for mode in ('eager', 'streaming'):
+                    queue = ctx.Queue()
+                    process = ctx.Process(target=_run_mode, args=(mode, pdf_path, queue))
+                    process.start()
+                    baseline_kb, peak_kb, num_chunks = queue.get()
+                    process.join()
+
+                    self.stdout.write(
+                        f"{num_pages:>5} pages | {mode:<9} | "
+                        f"peak RSS {peak_kb / 1024:8.1f} MiB "
+                        f"(+{(peak_kb - baseline_kb) / 1024:7.1f} MiB over imports) | "
+                        f"{num_chunks} chunks"
+                    )
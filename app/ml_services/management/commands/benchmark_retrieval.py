@@ -0,0 +1,83 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from app.ml_services.retrieval import HybridRetriever, reciprocal_rank_fusion
+from app.papers.models import Paper, PaperChunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline retrieval benchmark: recall@k and latency of dense, lexical and hybrid (RRF) search. "
+        "Queries are sentences sampled from stored chunks; the source chunk is the relevant answer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--papers', type=int, default=20)
+        parser.add_argument('--queries-per-paper', type=int, default=10)
+        parser.add_argument('--ks', type=int, nargs='+', default=[1, 3, 5, 10])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        retriever = HybridRetriever()
+        depth = max(retriever.candidates, max(options['ks']))
+
+        papers = list(Paper.objects.filter(status='ready').exclude(collection_name='')[:options['papers']])
+        queries = []
+        for paper in papers:
+            chunks = list(PaperChunk.objects.filter(paper=paper).only('content', 'embedding_id'))
+            for chunk in rng.sample(chunks, min(options['queries_per_paper'], len(chunks))):
+                query = self._sample_query(chunk.content, rng)
+                if query:
+                    queries.append((paper, query, chunk.embedding_id))
+
+        if not queries:
+            self.stderr.write("No ready papers with chunks to benchmark")
+            return
+
+        modes = {'dense': [], 'lexical': [], 'hybrid': []}
+        latencies = {mode: [] for mode in modes}
+
+        for paper, query, relevant_id in queries:
+            started = time.perf_counter()
+            dense = retriever.dense_search(paper, query, depth)
+            dense_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            lexical = retriever.lexical.search(query, top_k=depth, paper_id=paper.pk)
+            lexical_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            hybrid = reciprocal_rank_fusion([dense, lexical], k=retriever.rrf_k)
+            fusion_ms = (time.perf_counter() - started) * 1000
+
+            for mode, results in (('dense', dense), ('lexical', lexical), ('hybrid', hybrid)):
+                ranked_ids = [result['id'] for result in results]
+                modes[mode].append(ranked_ids.index(relevant_id) + 1 if relevant_id in ranked_ids else None)
+
+            latencies['dense'].append(dense_ms)
+            latencies['lexical'].append(lexical_ms)
+            latencies['hybrid'].append(dense_ms + lexical_ms + fusion_ms)
+
+        self.stdout.write(f"{len(queries)} queries over {len(papers)} papers")
+        for mode, ranks in modes.items():
+            recalls = " | ".join(
+                f"recall@{k} {np.mean([rank is not None and rank <= k for rank in ranks]):.3f}"
+                for k in options['ks']
+            )
+            self.stdout.write(
+                f"{mode:<8} | {recalls} | "
+                f"p50 {np.percentile(latencies[mode], 50):7.2f} ms | "
+                f"p95 {np.percentile(latencies[mode], 95):7.2f} ms"
+            )
+
+    def _sample_query(self, content: str, rng: random.Random) -> str:
+
+        words = content.split()
+        if len(words) < 12:
+            return ""
+        start = rng.randint(0, len(words) - 10)
+        return " ".join(words[start:start + rng.randint(6, 10)])
@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.ml_services.hierarchical_summarizer import HierarchicalSummarizer
+from app.ml_services.management.commands._synthetic import PARAGRAPH
+from app.papers.models import Paper
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarization throughput in papers/hour on a fixed number of CPU threads: "
+        "one paper at a time vs. papers batched together as summarize_pending_papers does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--papers', type=int, default=16)
+        parser.add_argument('--batch-papers', type=int, nargs='+', default=[4, 8, 16])
+        parser.add_argument('--threads', type=int, default=4, help="torch.set_num_threads for every run")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        import torch
+
+        torch.set_num_threads(options['threads'])
+        summarizer = HierarchicalSummarizer()
+        texts = self._texts(options['papers'], options['seed'])
+
+        # warm up so the first measurement does not include lazy initialisation
+        summarizer.summarize(PARAGRAPH * 4)
+
+        started = time.perf_counter()
+        for text in texts:
+            summarizer.summarize(text)
+        sequential = time.perf_counter() - started
+        self.stdout.write(
+            f"{len(texts)} papers, {options['threads']} threads | "
+            f"one at a time {len(texts) * 3600 / sequential:8.1f} papers/h"
+        )
+
+        for batch_papers in options['batch_papers']:
+            started = time.perf_counter()
+            for start in range(0, len(texts), batch_papers):
+                summarizer.summarize_many(texts[start:start + batch_papers])
+            batched = time.perf_counter() - started
+            self.stdout.write(
+                f"batch of {batch_papers:>3} papers | {len(texts) * 3600 / batched:8.1f} papers/h "
+                f"({sequential / batched:4.2f}x)"
+            )
+
+    def _texts(self, count: int, seed: int):
+
+        texts = list(
+            Paper.objects.filter(status='ready').exclude(full_text='')
+            .values_list('full_text', flat=True)[:count]
+        )
+        # pad with synthetic papers of varying length so padding effects show up
+        rng = random.Random(seed)
+        while len(texts) < count:
+            texts.append(PARAGRAPH * rng.randint(20, 120))
+        return texts
@@ -0,0 +1,82 @@
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from app.ml_services.vector_stores import ChromaVectorStore, FaissVectorStore
+
+
+class Command(BaseCommand):
+    help = "Compare Chroma and FAISS (flat / IVF / HNSW) recall@k and query latency on the same vectors"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=100_000)
+        parser.add_argument('--dimension', type=int, default=384)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--top-k', type=int, default=10)
+        parser.add_argument('--backends', nargs='+', default=['chroma', 'flat', 'ivf', 'hnsw'])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        vectors, queries = self._synthetic_vectors(options)
+        top_k = options['top_k']
+
+        # exact cosine top-k as ground truth
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        normalized_queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        truth = np.argsort(-normalized_queries @ normalized.T, axis=1)[:, :top_k]
+
+        ids = [str(uuid.uuid4()) for _ in range(len(vectors))]
+        id_positions = {chunk_id: position for position, chunk_id in enumerate(ids)}
+
+        for backend in options['backends']:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                store = self._build_store(backend, tmp_dir, options['vectors'])
+                store.create_collection('benchmark')
+
+                started = time.perf_counter()
+                for start in range(0, len(vectors), 5000):
+                    end = start + 5000
+                    store.add(
+                        'benchmark',
+                        ids=ids[start:end],
+                        embeddings=vectors[start:end],
+                        documents=[''] * len(ids[start:end]),
+                        metadatas=[{'position': position} for position in range(start, min(end, len(ids)))],
+                    )
+                build_seconds = time.perf_counter() - started
+
+                latencies = []
+                recalls = []
+                for query, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    results = store.query('benchmark', query, top_k=top_k)
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+                    found = {id_positions[result['id']] for result in results}
+                    recalls.append(len(found & set(expected.tolist())) / top_k)
+
+                self.stdout.write(
+                    f"{backend:<7} | build {build_seconds:7.1f}s | "
+                    f"recall@{top_k} {np.mean(recalls):.3f} | "
+                    f"p50 {np.percentile(latencies, 50):7.2f} ms | "
+                    f"p95 {np.percentile(latencies, 95):7.2f} ms"
+                )
+
+    def _build_store(self, backend: str, root: str, num_vectors: int):
+
+        if backend == 'chroma':
+            return ChromaVectorStore(root)
+        nlist = max(16, int(np.sqrt(num_vectors)))
+        return FaissVectorStore(root, index_type=backend, nlist=nlist)
+
+    def _synthetic_vectors(self, options):
+
+        # clustered data behaves more like sentence embeddings than uniform noise
+        rng = np.random.default_rng(options['seed'])
+        centers = rng.normal(size=(256, options['dimension'])).astype(np.float32)
+        assignment = rng.integers(0, len(centers), size=options['vectors'] + options['queries'])
+        data = centers[assignment] + 0.3 * rng.normal(size=(len(assignment), options['dimension'])).astype(np.float32)
+        return data[:options['vectors']], data[options['vectors']:]
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from app.ml_services.global_index import GlobalVectorIndex
+from app.papers.models import Paper
+
+
+class Command(BaseCommand):
+    help = "Move per-paper vector collections into the sharded global index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--keep-old', action='store_true', help="Do not delete the per-paper collections")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        index = GlobalVectorIndex()
+        store = index.vector_store
+
+        papers = (
+            Paper.objects
+            .exclude(collection_name='')
+            .only('id', 'user_id', 'collection_name')
+        )
+
+        migrated = 0
+        for paper in papers.iterator():
+            if index.is_global_collection(paper.collection_name):
+                continue
+
+            old_collection = paper.collection_name
+            try:
+                data = store.get(old_collection, include_embeddings=True)
+            except Exception as e:
+                self.stderr.write(f"Skipping paper {paper.pk}: cannot read {old_collection} ({e})")
+                continue
+
+            shard = index.shard_for(paper.pk)
+            self.stdout.write(f"{paper.pk}: {len(data['ids'])} vectors {old_collection} -> {shard}")
+            if options['dry_run']:
+                continue
+
+            # vector ids are kept, so PaperChunk.embedding_id stays valid
+            store.delete(shard, {'paper_id': str(paper.pk)})
+            paper_metadata = index.paper_metadata(paper)
+            for start in range(0, len(data['ids']), options['batch_size']):
+                end = start + options['batch_size']
+                store.add(
+                    shard,
+                    ids=data['ids'][start:end],
+                    embeddings=data['embeddings'][start:end],
+                    documents=data['documents'][start:end],
+                    metadatas=[{**metadata, **paper_metadata} for metadata in data['metadatas'][start:end]],
+                )
+
+            Paper.objects.filter(pk=paper.pk).update(collection_name=shard)
+            if not options['keep_old']:
+                store.delete_collection(old_collection)
+            migrated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Migrated {migrated} papers into the global index"))
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from app.ml_services.reindex import IncrementalReindexer, RateLimiter
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-chunk and re-embed papers whose index was built with other chunker settings or another "
+        "embedding model. Unchanged chunk text reuses its vectors, and each paper's new index version is "
+        "swapped in once built while the old version keeps serving queries."
+    )
+
+    def add_arguments(self, parser):
+        ml_config = settings.ML_CONFIG
+        parser.add_argument('--paper', nargs='+', help="Only these paper ids")
+        parser.add_argument('--limit', type=int, default=0, help="Re-index at most this many papers (0 = all)")
+        parser.add_argument('--concurrency', type=int, default=ml_config.get('REINDEX_CONCURRENCY', 2),
+                            help="Papers re-indexed in parallel")
+        parser.add_argument('--max-per-minute', type=float,
+                            default=ml_config.get('REINDEX_MAX_PAPERS_PER_MINUTE', 0),
+                            help="Start at most this many papers per minute (0 = unthrottled)")
+        parser.add_argument('--threads', type=int, default=0,
+                            help="torch.set_num_threads for the encoder (0 = leave the default)")
+        parser.add_argument('--grace', type=int, default=ml_config.get('REINDEX_RETIRED_GRACE_SECONDS', 300),
+                            help="Seconds a retired version keeps its vectors before they are purged")
+        parser.add_argument('--no-purge', action='store_true', help="Keep the vectors of retired versions")
+        parser.add_argument('--dry-run', action='store_true', help="Only report stale papers")
+
+    def handle(self, *args, **options):
+        if options['threads']:
+            import torch
+            torch.set_num_threads(options['threads'])
+
+        reindexer = IncrementalReindexer()
+        self.stdout.write(f"Index {reindexer.fingerprint[:12]}: {reindexer.config}")
+
+        if not options['dry_run']:
+            adopted = reindexer.adopt_current()
+            if adopted:
+                self.stdout.write(f"Recorded manifests for {adopted} papers already up to date")
+
+        stale = reindexer.stale_papers()
+        if options['paper']:
+            stale = stale.filter(pk__in=options['paper'])
+        paper_ids = list(stale.values_list('pk', flat=True))
+        if options['limit']:
+            paper_ids = paper_ids[:options['limit']]
+
+        self.stdout.write(f"{len(paper_ids)} stale papers")
+        if options['dry_run'] or not paper_ids:
+            return
+
+        limiter = RateLimiter(options['max_per_minute'])
+        totals = {'done': 0, 'skipped': 0, 'failed': 0, 'reused': 0, 'embedded': 0}
+        lock = threading.Lock()
+
+        def run(paper_id):
+            limiter.acquire()
+            try:
+                manifest = reindexer.reindex(paper_id)
+            except Exception as e:
+                self.stderr.write(f"{paper_id}: {e}")
+                with lock:
+                    totals['failed'] += 1
+                return
+            finally:
+                # every worker thread has its own database connection
+                connection.close()
+
+            with lock:
+                if manifest is None:
+                    totals['skipped'] += 1
+                    return
+                totals['done'] += 1
+                totals['reused'] += manifest.reused_vectors
+                totals['embedded'] += manifest.embedded_vectors
+                if totals['done'] % 100 == 0:
+                    self.stdout.write(f"{totals['done']}/{len(paper_ids)} papers re-indexed")
+
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            list(executor.map(run, paper_ids))
+
+        vectors = totals['reused'] + totals['embedded']
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-indexed {totals['done']} papers ({totals['skipped']} skipped, {totals['failed']} failed): "
+            f"{totals['reused']}/{vectors} vectors reused, {totals['embedded']} embedded"
+        ))
+
+        if not options['no_purge']:
+            purged = reindexer.purge_retired(options['grace'])
+            self.stdout.write(f"Purged {purged} retired index versions older than {options['grace']}s")
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from app.ml_services.fair_scheduler import FairScheduler
+
+
+class Command(BaseCommand):
+    help = "Prints FairScheduler queue depth and queue wait percentiles per lane and per user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help="Wait times of jobs dispatched in this window")
+        parser.add_argument('--top', type=int, default=10, help="Users listed, longest p95 wait first")
+        parser.add_argument('--json', action='store_true', help="Print the raw stats for a metrics collector")
+        parser.add_argument('--dispatch', action='store_true', help="Run one dispatch first")
+
+    def handle(self, *args, **options):
+        scheduler = FairScheduler()
+        if options['dispatch']:
+            self.stdout.write(f"Dispatched {scheduler.dispatch()} jobs")
+
+        stats = scheduler.stats(options['hours'])
+        if options['json']:
+            self.stdout.write(json.dumps(stats))
+            return
+
+        self.stdout.write(
+            f"queued interactive {stats['queued']['interactive']} | bulk {stats['queued']['bulk']} | "
+            f"in flight {stats['in_flight']}/{scheduler.max_in_flight} | "
+            f"oldest queued {stats['oldest_queued_seconds']:.0f}s"
+        )
+        for lane, waits in stats['wait_seconds'].items():
+            self.stdout.write(
+                f"{lane:<12} wait | {waits['count']:6d} jobs | p50 {waits['p50']:8.1f}s | "
+                f"p95 {waits['p95']:8.1f}s | max {waits['max']:8.1f}s"
+            )
+
+        users = sorted(stats['wait_seconds_by_user'].items(), key=lambda item: item[1]['p95'], reverse=True)
+        for user_id, waits in users[:options['top']]:
+            self.stdout.write(
+                f"user {user_id} | {waits['count']:6d} jobs | p50 {waits['p50']:8.1f}s | p95 {waits['p95']:8.1f}s"
+            )
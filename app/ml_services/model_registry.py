@@ -0,0 +1,172 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from django.conf import settings
+import logging
+import resource
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _current_rss_bytes() -> int:
+
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # peak RSS is the best portable approximation (KiB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of heavy ML objects (transformers, pipelines, clients).
+
+    Each key is loaded at most once per process, on first use, and then shared by
+    every service instance. Load time and RSS growth are recorded per key.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock_for(key):
+            model = self._models.get(key)
+            if model is not None:
+                return model
+
+            rss_before = _current_rss_bytes()
+            started = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - started
+            rss_delta_mb = (_current_rss_bytes() - rss_before) / (1024 * 1024)
+
+            self._models[key] = model
+            self._stats[key] = {
+                'load_seconds': round(load_seconds, 3),
+                'rss_delta_mb': round(rss_delta_mb, 1),
+                'loaded_at': time.time(),
+            }
+            logger.info(f"Loaded {key} in {load_seconds:.2f}s (+{rss_delta_mb:.0f} MiB RSS)")
+            return model
+
+    def is_loaded(self, key: str) -> bool:
+        return key in self._models
+
+    def unload(self, key: str):
+
+        with self._lock_for(key):
+            self._models.pop(key, None)
+            self._stats.pop(key, None)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {key: dict(value) for key, value in self._stats.items()}
+
+    def _lock_for(self, key: str) -> threading.Lock:
+
+        with self._registry_lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+
+registry = ModelRegistry()
+
+
+def get_embedding_model(model_name: Optional[str] = None):
+
+    model_name = model_name or settings.ML_CONFIG['EMBEDDING_MODEL']
+
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    return registry.get(f'embedding:{model_name}', load)
+
+
+def get_summarization_pipeline(model_name: Optional[str] = None):
+
+    model_name = model_name or settings.ML_CONFIG['SUMMARIZATION_MODEL']
+
+    def load():
+        from transformers import pipeline
+        return pipeline("summarization", model=model_name, device=-1)
+
+    return registry.get(f'summarization:{model_name}', load)
+
+
+def get_cross_encoder(model_name: Optional[str] = None):
+
+    model_name = model_name or settings.ML_CONFIG['RERANK_MODEL']
+
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device='cpu')
+
+    return registry.get(f'cross_encoder:{model_name}', load)
+
+
+def get_ollama_client():
+
+    # imported lazily, like the model loaders above: httpx is only needed once an LLM is called
+    from app.ml_services.ollama_client import OllamaClient
+
+    base_url = settings.ML_CONFIG['OLLAMA_BASE_URL']
+    model = settings.ML_CONFIG['OLLAMA_MODEL']
+    return registry.get(f'ollama_client:{base_url}:{model}', OllamaClient)
+
+
+def get_vector_store():
+
+    # imported lazily: vector_stores itself depends on this registry
+    from app.ml_services.vector_stores import get_vector_store as get_store
+    return get_store()
+
+
+def models_for_queues(queues: Iterable[str]) -> List[str]:
+
+    by_queue = settings.ML_CONFIG.get('PRELOAD_MODELS_BY_QUEUE', {})
+    names = []
+    for queue in queues:
+        names.extend(name for name in by_queue.get(queue, []) if name not in names)
+    return names
+
+
+PRELOADERS = {
+    'embedding': get_embedding_model,
+    'summarization': get_summarization_pipeline,
+    'reranker': get_cross_encoder,
+    'llm': get_ollama_client,
+    'vector_store': get_vector_store,
+}
+
+
+def preload_models(names: Optional[Iterable[str]] = None, queues: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+    """
+    Eagerly loads the given models, e.g. at worker boot. The default is ML_CONFIG['PRELOAD_MODELS'],
+    or when that is empty the PRELOAD_MODELS_BY_QUEUE entries of the worker's `queues`, so an
+    `llm` worker does not load BART. A model that fails to load is logged and left to load
+    lazily on first use.
+    """
+    if names is None:
+        names = settings.ML_CONFIG.get('PRELOAD_MODELS') or models_for_queues(queues or [])
+
+    for name in names:
+        preloader = PRELOADERS.get(name)
+        if preloader is None:
+            logger.warning(f"Unknown model to preload: {name}")
+            continue
+        try:
+            preloader()
+        except Exception as e:
+            logger.error(f"Failed to preload {name}: {e}")
+
+    return registry.stats()
@@ -9,6 +9,7 @@ class ProcessingTask(models.Model):
 
     TASK_TYPES = [
         ('pdf_extraction', 'PDF Text Extraction'),
+        ('chunking', 'Chunking Text'),
         ('summarization', 'Summarization'),
         ('embedding', 'Creating Embeddings'),
         ('key_insight', 'Extract Key Insight'),
@@ -17,6 +18,7 @@ class ProcessingTask(models.Model):
 
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('queued', 'Queued for batch'),
         ('processing', 'Processing'),
         ('complete', 'Complete'),
         ('failed', 'Failed'),
@@ -66,4 +68,104 @@ class ModelsUsageStats(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['user', '-created_at']),
-        ]
\ No newline at end of file
+        ]
+
+    @classmethod
+    def record(cls, user, operation_type: str, model_name: str, prompt_tokens: int, completion_tokens: int):
+
+        return cls.objects.create(
+            user=user,
+            operation_type=operation_type,
+            model_name=model_name,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+
+class PaperIndexManifest(models.Model):
+    """
+    One version of a paper's vector index: the chunker parameters and embedding model it
+    was built with and the collection holding its vectors. Exactly one version per paper
+    is active (the one Paper.collection_name points at); the reindexer builds the next
+    version next to it and swaps it in.
+    """
+
+    STATUS_CHOICES = [
+        ('building', 'Building'),
+        ('active', 'Active'),
+        ('retired', 'Retired'),
+        ('purged', 'Purged'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    paper = models.ForeignKey('papers.Paper', on_delete=models.CASCADE, related_name='index_manifests')
+    version = models.IntegerField()
+    status = models.CharField(choices=STATUS_CHOICES, max_length=16, default='building')
+
+    fingerprint = models.CharField(max_length=64, help_text="Hash of the chunker parameters and embedding model")
+    chunker = models.JSONField(default=dict)
+    embedding_model = models.CharField(max_length=256)
+    collection_name = models.CharField(max_length=512, blank=True)
+
+    num_chunks = models.IntegerField(default=0)
+    reused_vectors = models.IntegerField(default=0)
+    embedded_vectors = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    retired_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['paper', '-version']
+        unique_together = ['paper', 'version']
+        indexes = [
+            models.Index(fields=['status', 'fingerprint']),
+        ]
+
+    def __str__(self):
+        return f'{self.paper_id} v{self.version} - {self.status}'
+
+
+class ScheduledJob(models.Model):
+    """
+    A paper waiting in (or dispatched from) FairScheduler. Queued jobs are dispatched in
+    virtual_finish order, interactive lane first; dispatched_at - enqueued_at is the
+    queue wait reported per user and lane.
+    """
+
+    LANE_CHOICES = [
+        ('interactive', 'Interactive'),
+        ('bulk', 'Bulk'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('dispatched', 'Dispatched'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='scheduled_jobs')
+    paper = models.ForeignKey('papers.Paper', on_delete=models.CASCADE, related_name='scheduled_jobs')
+
+    lane = models.CharField(choices=LANE_CHOICES, max_length=16)
+    status = models.CharField(choices=STATUS_CHOICES, max_length=16, default='queued')
+    virtual_finish = models.FloatField(help_text="Weighted fair queuing tag; the lowest queued tag dispatches first")
+
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-enqueued_at']
+        indexes = [
+            models.Index(fields=['status', 'lane', 'virtual_finish']),
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['-dispatched_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.paper_id} ({self.lane}) - {self.status}'
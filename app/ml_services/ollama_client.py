@@ -0,0 +1,440 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from django.conf import settings
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+# lower value = served first
+INTERACTIVE = 0
+BATCH = 10
+
+PRIORITIES = {
+    'interactive': INTERACTIVE,
+    'batch': BATCH,
+}
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class OllamaError(Exception):
+    pass
+
+
+class PrioritySemaphore:
+    """
+    asyncio semaphore whose waiters are woken by priority, then arrival order.
+    """
+
+    def __init__(self, value: int):
+        self.available = value
+        self._waiters: List = []
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int):
+
+        if self.available > 0 and not self._waiters:
+            self.available -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._counter), future]
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just before cancellation; pass it on
+                self.release()
+            elif entry in self._waiters:
+                # release() may already have popped and skipped the cancelled future
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.available += 1
+
+
+# KEYS: holders, waiting   ARGV: token, lease seconds, limit, 1 if interactive
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local lease = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    if ARGV[4] == '1' or redis.call('ZCARD', KEYS[2]) == 0 then
+        redis.call('ZADD', KEYS[1], now + lease, ARGV[1])
+        redis.call('ZREM', KEYS[2], ARGV[1])
+        return 1
+    end
+end
+if ARGV[4] == '1' then
+    redis.call('ZADD', KEYS[2], now + lease, ARGV[1])
+end
+return 0
+"""
+
+# KEYS: holders   ARGV: token, lease seconds
+RENEW_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+return redis.call('ZADD', KEYS[1], 'XX', now + tonumber(ARGV[2]), ARGV[1])
+"""
+
+
+class GlobalSlots:
+    """
+    Generation slots shared by every process that talks to one Ollama server, in Redis.
+
+    Holders are a sorted set scored by lease deadline, renewed while the generation runs,
+    so the slot of a crashed process frees itself after `lease_seconds`. An interactive
+    request that has to wait registers in a waiting set. A batch request only takes a
+    free slot while no interactive request waits anywhere, so chat in the web process
+    goes ahead of Celery batch work. If Redis is unreachable, requests proceed and only
+    the per-process limit applies.
+    """
+
+    def __init__(self, url: str, name: str, limit: int, lease_seconds: float = 30):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.holders = f'ollama:slots:{name}:holders'
+        self.waiting = f'ollama:slots:{name}:waiting'
+        self.limit = limit
+        self.lease_seconds = lease_seconds
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+        self._renew = self.client.register_script(RENEW_SCRIPT)
+
+    @asynccontextmanager
+    async def hold(self, priority: int):
+
+        token = uuid.uuid4().hex
+        held = await self._wait_for_slot(token, priority)
+        renewer = asyncio.ensure_future(self._keep_alive(token)) if held else None
+        try:
+            yield
+        finally:
+            if held:
+                renewer.cancel()
+                try:
+                    await self.client.zrem(self.holders, token)
+                except Exception as e:
+                    logger.warning(f"Failed to release Ollama slot (it expires with its lease): {e}")
+
+    async def _wait_for_slot(self, token: str, priority: int) -> bool:
+
+        interactive = '1' if priority == INTERACTIVE else '0'
+        delay = 0.02
+        try:
+            while not await self._acquire(
+                keys=[self.holders, self.waiting], args=[token, self.lease_seconds, self.limit, interactive],
+            ):
+                await asyncio.sleep(delay * (1 + random.random()))
+                delay = min(delay * 2, 0.25)
+            return True
+
+        except asyncio.CancelledError:
+            await self._forget_waiter(token)
+            raise
+        except Exception as e:
+            logger.warning(f"Shared Ollama slots unavailable, using the per-process limit only: {e}")
+            await self._forget_waiter(token)
+            return False
+
+    async def _forget_waiter(self, token: str):
+
+        try:
+            await self.client.zrem(self.waiting, token)
+        except Exception:
+            pass
+
+    async def _keep_alive(self, token: str):
+
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._renew(keys=[self.holders], args=[token, self.lease_seconds])
+            except Exception as e:
+                logger.warning(f"Failed to renew Ollama slot lease: {e}")
+
+
+class OllamaClient:
+    """
+    Process-wide Ollama client shared by QA, summarization and insight extraction.
+
+    All requests run on one background event loop that owns a keep-alive httpx connection
+    pool, so sync callers (Celery tasks, DRF views) and async callers (ASGI streaming views)
+    share the pool and the concurrency limit. At most `max_concurrency` generations are in
+    flight; queued requests are served by priority (INTERACTIVE before BATCH). With
+    `slots_url` (OLLAMA_SLOTS_URL, a Redis URL) the limit and the priority hold across the
+    web and worker processes through GlobalSlots. Connection errors, timeouts and 429/5xx
+    responses are retried with exponential backoff. A stream is only retried until its
+    first piece has arrived.
+    """
+
+    def __init__(self,
+                 base_url: Optional[str] = None,
+                 model: Optional[str] = None,
+                 max_concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None,
+                 backoff: Optional[float] = None,
+                 pool_size: Optional[int] = None,
+                 slots_url: Optional[str] = None):
+        ml_config = settings.ML_CONFIG
+        self.base_url = (base_url or ml_config['OLLAMA_BASE_URL']).rstrip('/')
+        self.model = model or ml_config['OLLAMA_MODEL']
+        self.max_concurrency = max_concurrency or ml_config.get('OLLAMA_MAX_CONCURRENCY', 2)
+        self.timeout = timeout or ml_config.get('OLLAMA_TIMEOUT', 120)
+        self.max_retries = max_retries if max_retries is not None else ml_config.get('OLLAMA_MAX_RETRIES', 3)
+        self.backoff = backoff or ml_config.get('OLLAMA_RETRY_BACKOFF', 0.5)
+        self.pool_size = pool_size or ml_config.get('OLLAMA_POOL_SIZE', 10)
+        self.slots_url = slots_url if slots_url is not None else ml_config.get('OLLAMA_SLOTS_URL', '')
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[PrioritySemaphore] = None
+        self._slots: Optional[GlobalSlots] = None
+
+        self._in_flight = 0
+        self._counts = {'requests': 0, 'retries': 0, 'errors': 0}
+        self._latencies = {name: deque(maxlen=1000) for name in PRIORITIES}
+        self._waits = {name: deque(maxlen=1000) for name in PRIORITIES}
+
+    def generate_sync(self, prompt: str, priority: str = 'interactive', **kwargs) -> Dict:
+        """
+        Blocking generate() for sync code; must not be called from the client's own loop.
+        """
+        return asyncio.run_coroutine_threadsafe(self._generate(prompt, priority, **kwargs), self._ensure_loop()).result()
+
+    async def generate(self, prompt: str, priority: str = 'interactive', **kwargs) -> Dict:
+        """
+        Returns Ollama's final /api/generate message: 'response' plus prompt_eval_count,
+        eval_count and durations. kwargs: temperature, options, format, system, model.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._generate(prompt, priority, **kwargs), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    async def stream(self, prompt: str, priority: str = 'interactive', **kwargs) -> AsyncIterator[Dict]:
+        """
+        Yields /api/generate messages as they arrive; the last one has 'done': True.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def produce():
+            try:
+                async for message in self._stream(prompt, priority, **kwargs):
+                    loop.call_soon_threadsafe(queue.put_nowait, message)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+                if not isinstance(e, Exception):
+                    raise
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        producer = asyncio.run_coroutine_threadsafe(produce(), self._ensure_loop())
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # client disconnected or consumer stopped early: free the generation slot
+            producer.cancel()
+
+    def stats(self) -> Dict:
+
+        stats = {
+            **self._counts,
+            'in_flight': self._in_flight,
+            'queue_depth': self._semaphore.waiting if self._semaphore else 0,
+            'max_concurrency': self.max_concurrency,
+            'shared_slots': self._slots is not None,
+        }
+        for name in PRIORITIES:
+            latencies = sorted(self._latencies[name])
+            waits = sorted(self._waits[name])
+            stats[name] = {
+                'requests': len(latencies),
+                'p50_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+                'p95_ms': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                'p95_wait_ms': waits[int(len(waits) * 0.95)] if waits else 0.0,
+            }
+        return stats
+
+    def _payload(self, prompt: str, stream: bool, temperature: Optional[float] = None,
+                 options: Optional[Dict] = None, format: Optional[str] = None,
+                 system: Optional[str] = None, model: Optional[str] = None) -> Dict:
+
+        payload = {
+            'model': model or self.model,
+            'prompt': prompt,
+            'stream': stream,
+        }
+        options = dict(options or {})
+        if temperature is not None:
+            options['temperature'] = temperature
+        if options:
+            payload['options'] = options
+        if format:
+            payload['format'] = format
+        if system:
+            payload['system'] = system
+        return payload
+
+    async def _generate(self, prompt: str, priority: str, **kwargs) -> Dict:
+
+        payload = self._payload(prompt, stream=False, **kwargs)
+        async with self._slot(priority):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self._http.post('/api/generate', json=payload)
+                    if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                        raise httpx.HTTPStatusError(
+                            f"Ollama returned {response.status_code}", request=response.request, response=response
+                        )
+                    response.raise_for_status()
+                    message = response.json()
+                    if 'error' in message:
+                        raise OllamaError(message['error'])
+                    return message
+
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if not self._retryable(e) or attempt >= self.max_retries:
+                        self._counts['errors'] += 1
+                        raise OllamaError(f"Ollama request failed: {e}") from e
+                    await self._sleep_before_retry(attempt, e)
+
+    async def _stream(self, prompt: str, priority: str, **kwargs) -> AsyncIterator[Dict]:
+
+        payload = self._payload(prompt, stream=True, **kwargs)
+        async with self._slot(priority):
+            for attempt in range(self.max_retries + 1):
+                started_streaming = False
+                try:
+                    async with self._http.stream('POST', '/api/generate', json=payload) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.strip():
+                                continue
+                            message = json.loads(line)
+                            if 'error' in message:
+                                raise OllamaError(message['error'])
+                            started_streaming = True
+                            yield message
+                            if message.get('done'):
+                                return
+                    return
+
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if started_streaming or not self._retryable(e) or attempt >= self.max_retries:
+                        self._counts['errors'] += 1
+                        raise OllamaError(f"Ollama stream failed: {e}") from e
+                    await self._sleep_before_retry(attempt, e)
+
+    @asynccontextmanager
+    async def _slot(self, priority: str):
+
+        queued = time.perf_counter()
+        await self._semaphore.acquire(PRIORITIES[priority])
+        try:
+            async with self._shared_slot(priority):
+                self._waits[priority].append((time.perf_counter() - queued) * 1000)
+                self._in_flight += 1
+                self._counts['requests'] += 1
+                try:
+                    yield
+                finally:
+                    self._in_flight -= 1
+                    self._latencies[priority].append((time.perf_counter() - queued) * 1000)
+        finally:
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def _shared_slot(self, priority: str):
+
+        if self._slots is None:
+            yield
+            return
+        async with self._slots.hold(PRIORITIES[priority]):
+            yield
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUS_CODES
+        return True
+
+    async def _sleep_before_retry(self, attempt: int, error: Exception):
+
+        self._counts['retries'] += 1
+        delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+        logger.warning(f"Ollama request failed ({error}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+
+        with self._lock:
+            # a forked Celery child inherits the object but not the loop thread
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._http = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    timeout=httpx.Timeout(self.timeout, connect=10.0),
+                    limits=httpx.Limits(max_connections=self.pool_size,
+                                        max_keepalive_connections=self.pool_size),
+                )
+                self._semaphore = PrioritySemaphore(self.max_concurrency)
+                if self.slots_url:
+                    self._slots = GlobalSlots(
+                        self.slots_url, f'{self.base_url}', self.max_concurrency,
+                        lease_seconds=max(30, self.timeout / 4),
+                    )
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name='ollama-client', daemon=True).start()
+            ready.wait()
+
+            self._loop = loop
+            self._pid = os.getpid()
+            return loop
@@ -1,56 +1,149 @@
-import PyMuPDF
+import fitz  # PyMuPDF
 import pdfplumber
-from typing import Dict, List, Tuple
-import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from collections import Counter
+from django.conf import settings
+import multiprocessing
+import os
 import logging
 
+from app.ml_services.section_detector import SectionDetector
+from app.ml_services.text_chunker import PAGE_HEADER
+
 logger = logging.getLogger(__name__)
 
+
+def _extract_page_range(pdf_path: str, start: int, end: int, with_fonts: bool = False) -> List[Dict]:
+    """
+    Process pool worker: opens its own document handle and extracts pages [start, end).
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        return [_extract_page(doc[page_index], page_index + 1, with_fonts) for page_index in range(start, end)]
+    finally:
+        doc.close()
+
+
+def _extract_page(page, page_number: int, with_fonts: bool) -> Dict:
+
+    record = {
+        'page_number': page_number,
+        'text': page.get_text(),
+    }
+    if with_fonts:
+        record['font_lines'], record['font_sizes'] = SectionDetector.collect_font_lines(page.get_text('dict'))
+    return record
+
+
 class PDFProcessor:
 
-    def __init__(self):
-        self.section_patterns = {
-            'abstract': r'(?i)abstract',
-            'introduction': r'(?i)introduction',
-            'methodology': r'(?i)(methodology|methods|materials)',
-            'results': r'(?i)results',
-            'discussion': r'(?i)discussion',
-            'conclusion': r'(?i)conclusion',
-            'references': r'(?i)references',
-        }
+    # bump whenever a change alters extracted text or section spans
+    VERSION = '2'
+
+    def __init__(self,
+                 max_workers: Optional[int] = None,
+                 parallel_min_pages: Optional[int] = None,
+                 use_font_hints: Optional[bool] = None):
+        ml_config = getattr(settings, 'ML_CONFIG', {})
+        self.max_workers = max_workers or ml_config.get('PDF_EXTRACTION_WORKERS') or os.cpu_count() or 1
+        self.parallel_min_pages = parallel_min_pages or ml_config.get('PDF_PARALLEL_MIN_PAGES', 64)
+
+        self.use_font_hints = (
+            use_font_hints if use_font_hints is not None
+            else ml_config.get('SECTION_FONT_HINTS', True)
+        )
 
-    def extract_text(self, pdf_path: str) -> Dict:
+        self.section_detector = SectionDetector()
 
+    def extract_text(self, pdf_path: str, parallel: Optional[bool] = None) -> Dict:
+        """
+        parallel=None picks the process pool automatically for documents
+        with at least `parallel_min_pages` pages.
+        """
         try:
-            doc = PyMuPDF.open(pdf_path)
-
-            result = {
-                'full_text': '',
-                'pages': [],
-                'metadata': {},
-                'num_pages': len(doc),
-                'section': {},
-            }
+            doc = fitz.open(pdf_path)
+            try:
+                num_pages = len(doc)
+                metadata = self._extract_metadata(doc)
 
-            result['metadata'] = self._extract_metadata(doc)
+                if parallel is None:
+                    parallel = num_pages >= self.parallel_min_pages
+                if parallel and not self._can_use_process_pool():
+                    logger.warning(
+                        "Running inside a daemon process (a prefork worker?), extracting serially; "
+                        "consume the `pdf` queue with a thread pool worker to extract in parallel"
+                    )
+                    parallel = False
 
-            for page_num, page in enumerate(doc, 1):
-                text = page.get_text()
-                result['pages'].append({
-                    'page_number': page_num,
-                    'text': text,
-                })
-                result['full_text'] += f"\n\n[Page {page_num}]\n{text}"
+                if parallel and num_pages > 1:
+                    pages = self._extract_pages_parallel(pdf_path, num_pages)
+                else:
+                    pages = [
+                        _extract_page(page, page_num, self.use_font_hints)
+                        for page_num, page in enumerate(doc, 1)
+                    ]
+            finally:
+                doc.close()
 
-            result['section'] = self._identify_sections(result['full_text'])
+            heading_lines = self._collect_heading_lines(pages)
+            full_text = self._join_pages(pages)
 
-            doc.close()
-            return result
+            return {
+                'full_text': full_text,
+                'pages': pages,
+                'metadata': metadata,
+                'num_pages': num_pages,
+                'section': self._identify_sections(full_text, heading_lines),
+            }
 
         except Exception as e:
             logger.error(f'Error extracting text from {pdf_path}: {e}')
             raise
 
+    def iter_pages(self, pdf_path: str, engine: str = 'pymupdf', with_tables: bool = False) -> Iterator[Dict]:
+        """
+        Yields one page record at a time so callers never hold the whole document.
+        Tables are only available with the pdfplumber engine.
+        """
+        if engine == 'pdfplumber':
+            yield from self._iter_pages_pdfplumber(pdf_path, with_tables)
+            return
+
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            logger.error(f'Error opening {pdf_path}: {e}')
+            raise
+
+        try:
+            num_pages = len(doc)
+            for page_index in range(num_pages):
+                yield {
+                    'page_number': page_index + 1,
+                    'num_pages': num_pages,
+                    'text': doc[page_index].get_text(),
+                }
+        finally:
+            doc.close()
+
+    def _iter_pages_pdfplumber(self, pdf_path: str, with_tables: bool) -> Iterator[Dict]:
+
+        with pdfplumber.open(pdf_path) as pdf:
+            num_pages = len(pdf.pages)
+            for page_num, page in enumerate(pdf.pages, 1):
+                record = {
+                    'page_number': page_num,
+                    'num_pages': num_pages,
+                    'text': page.extract_text() or '',
+                }
+                if with_tables:
+                    record['tables'] = page.extract_tables() or []
+
+                # pdfplumber keeps parsed layout objects on every page it has touched
+                page.flush_cache()
+                yield record
+
     def extract_with_pdfplumber(self, pdf_path: str) -> Dict:
         """
         Alternative using pdfplumber
@@ -65,12 +158,11 @@ class PDFProcessor:
                 }
 
                 for page_num, page in enumerate(pdf.pages, 1 ):
-                    text = page.extract_text()
+                    text = page.extract_text() or ''
                     result['pages'].append({
                         'page_number': page_num,
                         'text': text,
                     })
-                    result['full_text'] += f"\n\n[Page {page_num}]\n{text}"
 
                     tables = page.extract_tables()
                     if tables:
@@ -80,47 +172,95 @@ class PDFProcessor:
                                 'data': table,
                             })
 
+                result['full_text'] = self._join_pages(result['pages'])
                 return result
 
         except Exception as e:
             logger.error(f'Error extracting text from {pdf_path}: {e}')
             raise
 
+    def _extract_pages_parallel(self, pdf_path: str, num_pages: int) -> List[Dict]:
+
+        ranges = self._split_page_ranges(num_pages)
+        workers = min(self.max_workers, len(ranges))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_extract_page_range, pdf_path, start, end, self.use_font_hints)
+                for start, end in ranges
+            ]
+            # futures are consumed in submission order, so pages stay in document order
+            pages = []
+            for future in futures:
+                pages.extend(future.result())
+
+        logger.info(f"Extracted {num_pages} pages from {pdf_path} using {workers} workers")
+        return pages
+
+    def _split_page_ranges(self, num_pages: int) -> List[Tuple[int, int]]:
+
+        # a few ranges per worker keeps the pool busy when some pages are much heavier than others
+        range_size = max(1, -(-num_pages // (self.max_workers * 4)))
+        return [
+            (start, min(start + range_size, num_pages))
+            for start in range(0, num_pages, range_size)
+        ]
+
+    @staticmethod
+    def _can_use_process_pool() -> bool:
+        # Celery prefork children are daemonic and are not allowed to spawn processes;
+        # thread pool workers (the `pdf` queue, -P threads) run tasks in the main process
+        return not multiprocessing.current_process().daemon
+
+    @staticmethod
+    def _collect_heading_lines(pages: List[Dict]) -> Optional[Set[str]]:
+        """
+        Pops per-page font data off the page records and returns the normalized
+        lines set noticeably larger (or bolder) than the body font.
+        """
+        font_lines = []
+        font_sizes = Counter()
+        has_fonts = False
+
+        for page in pages:
+            if 'font_lines' in page:
+                has_fonts = True
+                font_lines.extend(page.pop('font_lines'))
+                font_sizes.update(page.pop('font_sizes'))
+
+        if not has_fonts:
+            return None
+        return SectionDetector.heading_lines_from_fonts(font_lines, font_sizes)
+
+    @staticmethod
+    def _join_pages(pages: List[Dict]) -> str:
+
+        return "".join(
+            PAGE_HEADER.format(page_number=page['page_number']) + page['text']
+            for page in pages
+        )
+
     def _extract_metadata(self, doc) -> Dict:
 
-        metadata = doc.metadata
+        metadata = doc.metadata or {}
         return {
-            'title': metadata.get['title'],
-            'author': metadata.get['author'],
-            'subject': metadata.get['subject'],
-            'keywords': metadata.get['keywords'],
-            'creator': metadata.get['creator'],
-            'producer': metadata.get['producer'],
-            'creation_date': metadata.get['creation_date'],
+            'title': metadata.get('title'),
+            'author': metadata.get('author'),
+            'subject': metadata.get('subject'),
+            'keywords': metadata.get('keywords'),
+            'creator': metadata.get('creator'),
+            'producer': metadata.get('producer'),
+            'creation_date': metadata.get('creationDate'),
         }
 
-    def _identify_sections(self, text: str) -> Dict:
-
-        sections = {}
+    def _identify_sections(self, text: str, heading_lines: Optional[Set[str]] = None) -> Dict:
 
-        for section_name, pattern in self.section_patterns.items():
-            matches = list(re.finditer(pattern, text, re.MULTILINE))
-            if matches:
-                sections[section_name] = matches[0].start()
-
-        return sections
+        return self.section_detector.detect(text, heading_lines)
 
     def extract_section_text(self, full_text: str, sections: Dict, section_name: str) -> str:
 
-        if section_name not in sections:
+        span = sections.get(section_name)
+        if not span:
             return ""
 
-        start = sections[section_name]
-
-        next_sections = {k: v for k, v in sections.items() if v > start}
-        if next_sections:
-            end = min(next_sections.values())
-            return full_text[start:end]
-        else:
-            return full_text[start:]
-
+        return full_text[span['start']:span['end']]
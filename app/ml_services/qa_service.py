@@ -1,20 +1,39 @@
-from typing import List, Dict, Optional
-from langchain_community.llms import Ollama
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from asgiref.sync import sync_to_async
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 from django.conf import settings
 import logging
+import time
+
+import numpy as np
+
+from app.ml_services.answer_cache import AnswerCache, get_answer_cache, normalize_question
+from app.ml_services.context_packer import ContextPacker
+from app.ml_services.embedding_service import EmbeddingService
+from app.ml_services.model_registry import get_ollama_client
+from app.ml_services.models import ModelsUsageStats
+from app.ml_services.reranker import Reranker
 
 logger = logging.getLogger(__name__)
 
 class QAService:
 
-    def __init__(self):
-        self.llm = Ollama(
-            base_url=settings.ML_CONFIG['OLLAMA_BASE_URL'],
-            model=settings.ML_CONFIG['OLLAMA_MODEL'],
-            temperatue=0.1,
-        )
+    # bump whenever qa_prompt changes so cached answers from the old prompt are not served
+    PROMPT_VERSION = '1'
+
+    def __init__(self,
+                 reranker: Optional[Reranker] = None,
+                 context_packer: Optional[ContextPacker] = None,
+                 answer_cache: Optional[AnswerCache] = None):
+        self.llm = get_ollama_client()
+        self.model_name = settings.ML_CONFIG['OLLAMA_MODEL']
+        self.answer_cache = answer_cache or get_answer_cache()
+        self._embedding_service = None
+
+        self.context_packer = context_packer or ContextPacker()
+        if reranker is None and settings.ML_CONFIG.get('RERANK_ENABLED', False):
+            reranker = Reranker(token_counter=self.context_packer.token_counter)
+        self.reranker = reranker
 
         self.qa_prompt = PromptTemplate(
             input_variables=['context', 'question', 'chat_history'],
@@ -36,66 +55,226 @@ class QAService:
             """
         )
 
-        self.qa_chain = LLMChain(llm=self.llm, prompt=self.qa_prompt)
-
     def answer_question(self,
                         question: str,
                         retrieved_chunks: List[Dict],
                         chat_history: Optional[List[Dict]] = None) -> Dict:
 
         try:
-            context = self._format_context(retrieved_chunks)
+            prepared = self.prepare_prompt(question, retrieved_chunks, chat_history)
 
-            history_text = self._format_chat_history(chat_history or [])
+            generation = self.llm.generate_sync(prepared['prompt'], priority='interactive', temperature=0.1)
 
-            response = self.qa_chain.invoke({
-                'context': context,
-                'question': question,
-                'chat_history': history_text
-            })
-
-            answer = response['text'].strip()
-
-            confidence = self._calculate_confidence(retrieved_chunks)
+            answer = generation['response'].strip()
 
             return {
                 'answer': answer,
-                'sources': [
-                    {
-                        "chunk_id": chunk["id"],
-                        "content": chunk["content"][:200] + "...",
-                        "page": chunk['metadata'].get('page_number'),
-                        "section": chunk['metadata'].get('section'),
-                        "similarity_score": chunk['similarity_score'],
-                    }
-                    for chunk in retrieved_chunks
-                ],
-                'confidence': confidence,
-                "tokens_used": {
-                    "prompt": len(context) + len(question),
-                    "completion": len(answer)
-                }
+                'sources': prepared['sources'],
+                'confidence': prepared['confidence'],
+                "tokens_used": self._token_usage(prepared['prompt'], answer, generation),
+                'rerank': prepared['rerank'],
+                'context': prepared['context'],
             }
 
         except Exception as e:
             logger.error(f"Failed to answer question: {e}")
             raise
 
-    def _format_context(self, chunks: List[Dict]) -> str:
+    async def astream_answer(self,
+                             question: str,
+                             retrieved_chunks: List[Dict],
+                             chat_history: Optional[List[Dict]] = None) -> AsyncIterator[Dict]:
+        """
+        Streams an answer from Ollama. Yields {'event': 'sources', ...} before generation
+        starts, one {'event': 'token', 'text'} per streamed piece and a final
+        {'event': 'done'} carrying the same fields as answer_question() plus timings.
+        """
+        started = time.perf_counter()
+
+        # reranking and tokenization are CPU-bound; keep them off the event loop
+        prepared = await sync_to_async(self.prepare_prompt, thread_sensitive=False)(
+            question, retrieved_chunks, chat_history
+        )
+        yield {
+            'event': 'sources',
+            'sources': prepared['sources'],
+            'confidence': prepared['confidence'],
+        }
+
+        pieces = []
+        info: Dict = {}
+        first_token_ms = None
+        try:
+            async for message in self.llm.stream(prepared['prompt'], priority='interactive', temperature=0.1):
+                piece = message.get('response', '')
+                if piece:
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                    pieces.append(piece)
+                    yield {'event': 'token', 'text': piece}
+                if message.get('done'):
+                    info = message
 
-        context_parts = []
+        except Exception as e:
+            logger.error(f"Failed to stream answer: {e}")
+            raise
 
-        for idx, chunk in enumerate(chunks, 1):
-            metadata = chunk['metadata']
-            section = metadata.get('section','Unknown')
-            page = metadata.get('page_number', 'Unknown')
+        answer = "".join(pieces).strip()
+        total_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"Streamed answer: first token after {first_token_ms} ms, complete after {total_ms} ms")
 
-            context_parts.append(
-                f"[Source {idx} - {section}, Page {page}]:\n{chunk['content']}\n"
+        tokens_used = await sync_to_async(self._token_usage, thread_sensitive=False)(
+            prepared['prompt'], answer, info
+        )
+        yield {
+            'event': 'done',
+            'answer': answer,
+            'sources': prepared['sources'],
+            'confidence': prepared['confidence'],
+            'tokens_used': tokens_used,
+            'rerank': prepared['rerank'],
+            'context': prepared['context'],
+            'timings': {
+                'first_token_ms': first_token_ms,
+                'total_ms': total_ms,
+            },
+        }
+
+    def prepare_prompt(self,
+                       question: str,
+                       retrieved_chunks: List[Dict],
+                       chat_history: Optional[List[Dict]] = None) -> Dict:
+        """
+        Reranks and packs the retrieved chunks and renders the QA prompt.
+        """
+        rerank_stats = None
+        if self.reranker is not None:
+            retrieved_chunks, rerank_stats = self.reranker.rerank(question, retrieved_chunks)
+
+        packed = self.context_packer.pack(retrieved_chunks)
+        used_chunks = packed['blocks']
+
+        history_text = self._format_chat_history(chat_history or [])
+
+        prompt = self.qa_prompt.format(
+            context=packed['text'],
+            question=question,
+            chat_history=history_text,
+        )
 
+        return {
+            'prompt': prompt,
+            'sources': [
+                {
+                    "chunk_id": chunk["id"],
+                    "chunk_ids": chunk["source_ids"],
+                    "content": chunk["content"][:200] + "...",
+                    "page": chunk['metadata'].get('page_number'),
+                    "section": chunk['metadata'].get('section'),
+                    "similarity_score": chunk.get('similarity_score', 0.0),
+                }
+                for chunk in used_chunks
+            ],
+            'confidence': self._calculate_confidence(used_chunks),
+            'rerank': rerank_stats,
+            'context': {
+                'tokens': packed['tokens'],
+                'budget': self.context_packer.token_budget,
+                'merged': packed['merged'],
+                'dropped_duplicates': packed['dropped_duplicates'],
+                'dropped_budget': packed['dropped_budget'],
+            },
+        }
+
+    def candidate_pool_size(self) -> int:
+        """
+        How many chunks callers should retrieve: the rerank stage over-fetches.
+        """
+        if self.reranker is not None:
+            return self.reranker.candidates
+        return settings.ML_CONFIG['TOP_K_RESULTS']
+
+    def cached_answer(self,
+                      paper_id,
+                      question: str,
+                      chat_history: Optional[List[Dict]] = None) -> Tuple[Optional[Dict], Optional[np.ndarray]]:
+        """
+        Looks the question up in the answer cache. Returns (result or None, question vector);
+        pass the vector to cache_answer() after a miss. Follow-up questions depend on the
+        conversation, so with chat history the cache is bypassed and (None, None) returned.
+        """
+        if self.answer_cache is None or chat_history:
+            return None, None
+
+        vector = self._question_vector(question)
+        result = self.answer_cache.get(paper_id, self.model_name, self.PROMPT_VERSION, question, vector)
+        if result is not None:
+            logger.info(
+                f"Answer cache hit for paper {paper_id} "
+                f"(similarity {result['cache']['similarity']}, hit rate {self.answer_cache.stats()['hit_rate']:.2f})"
             )
+            result['tokens_used'] = {'prompt': 0, 'completion': 0}
+        return result, vector
+
+    def cache_answer(self, paper_id, question: str, vector: Optional[np.ndarray], result: Dict):
+
+        if self.answer_cache is None or vector is None or not result.get('answer'):
+            return
+
+        cached = {key: result[key] for key in ('answer', 'sources', 'confidence') if key in result}
+        self.answer_cache.put(paper_id, self.model_name, self.PROMPT_VERSION, question, vector, cached)
+
+    def save_answer(self, conversation, question: str, result: Dict):
+        """
+        Stores the question and answer as Message rows and records token usage.
+        """
+        from app.chat.models import Message
+
+        tokens = result['tokens_used']
+        Message.objects.create(conversation=conversation, role='user', content=question)
+        message = Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=result['answer'],
+            cited_chunks=result['sources'],
+            confidence_score=result['confidence'],
+            prompt_tokens=tokens['prompt'],
+            completion_tokens=tokens['completion'],
+        )
+        if 'cache' not in result:
+            ModelsUsageStats.record(
+                user=conversation.user,
+                operation_type='qa',
+                model_name=self.model_name,
+                prompt_tokens=tokens['prompt'],
+                completion_tokens=tokens['completion'],
+            )
+        return message
+
+    def _question_vector(self, question: str) -> np.ndarray:
+
+        if self._embedding_service is None:
+            self._embedding_service = EmbeddingService(settings.ML_CONFIG['EMBEDDING_MODEL'])
+        return self._embedding_service.create_embeddings([normalize_question(question)])[0]
+
+    def _token_usage(self, prompt: str, answer: str, generation_info: Optional[Dict]) -> Dict:
+        """
+        Ollama reports exact counts (prompt_eval_count / eval_count); when they are missing,
+        e.g. for a prompt served from Ollama's cache, count with the tokenizer instead.
+        """
+        info = generation_info or {}
+        prompt_tokens = info.get('prompt_eval_count')
+        completion_tokens = info.get('eval_count')
+
+        if prompt_tokens is None or completion_tokens is None:
+            counted = self.context_packer.token_counter.count_many([prompt, answer])
+            prompt_tokens = prompt_tokens if prompt_tokens is not None else counted[0]
+            completion_tokens = completion_tokens if completion_tokens is not None else counted[1]
 
-        return "\n".join(context_parts)
+        return {
+            'prompt': prompt_tokens,
+            'completion': completion_tokens,
+        }
 
     def _format_chat_history(self, history: List[Dict]) -> str:
 
@@ -117,7 +296,7 @@ class QAService:
             return 0.0
 
         top_scores = sorted(
-            [chunk['similarity_score'] for chunk in chunks],
+            [chunk.get('similarity_score', 0.0) for chunk in chunks],
             reverse=True,
         )[:3]
 
@@ -138,11 +317,10 @@ class QAService:
                     Questions (one per line):
                     """
             )
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            response = chain.invoke({"summary": paper_summary})
+            response = self.llm.generate_sync(prompt.format(summary=paper_summary), priority='interactive')
 
             question = [
-                q.strip("- ").strip() for q in response['text'].strip().split("\n")
+                q.strip("- ").strip() for q in response['response'].strip().split("\n")
                         if q.strip()
             ]
 
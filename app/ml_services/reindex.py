@@ -0,0 +1,533 @@
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.ml_services.answer_cache import invalidate_paper_answers
+from app.ml_services.content_cache import pipeline_fingerprint
+from app.ml_services.embedding_cache import text_hash
+from app.ml_services.embedding_service import EmbeddingService
+from app.ml_services.global_index import GlobalVectorIndex
+from app.ml_services.models import PaperIndexManifest
+from app.ml_services.retrieval import update_search_vectors
+from app.ml_services.section_detector import SectionDetector
+from app.ml_services.text_chunker import PAGE_HEADER, TextChunker, split_pages
+from app.papers.models import Paper, PaperChunk
+
+logger = logging.getLogger(__name__)
+
+
+# a build older than this was abandoned by a crashed worker and may be retried
+BUILD_TIMEOUT = timedelta(hours=1)
+
+CHUNK_TYPES = {choice for choice, _ in PaperChunk._meta.get_field('chunk_type').choices}
+
+
+def index_config(chunker: Optional[TextChunker] = None) -> Dict:
+    """
+    Everything that decides a paper's chunks and vectors, as recorded in its manifest.
+    Token chunk sizes are resolved, so CHUNK_TOKENS=0 and an explicit equal value match.
+    """
+    chunker = chunker or TextChunker.from_config()
+    return {
+        'chunker': {
+            'version': TextChunker.VERSION,
+            'unit': chunker.unit,
+            'size': chunker.chunk_size,
+            'overlap': chunker.chunk_overlap,
+        },
+        'embedding_model': settings.ML_CONFIG['EMBEDDING_MODEL'],
+    }
+
+
+def index_fingerprint(config: Dict) -> str:
+
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def index_generation(fingerprint: str) -> str:
+    """
+    Shard-name suffix of the global index generation built with `fingerprint`.
+    """
+    return fingerprint[:12]
+
+
+class RateLimiter:
+    """
+    Spaces acquire() calls at least 60 / per_minute seconds apart across threads; 0 disables it.
+    """
+
+    def __init__(self, per_minute: float):
+        self.interval = 60 / per_minute if per_minute else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class IncrementalReindexer:
+    """
+    Brings papers' vector indexes up to the current chunker settings and embedding model.
+
+    Each paper has versioned PaperIndexManifest rows. A paper is stale when its active
+    manifest's fingerprint differs from the current configuration. Re-indexing re-chunks
+    the stored full_text. Chunks whose text is unchanged reuse the vectors of the serving
+    version when the embedding model is the same, and the rest go through EmbeddingService
+    and its embedding cache. The new vectors are written to this configuration's generation
+    of the global index while the old version keeps answering queries. One transaction then
+    swaps the PaperChunk rows, Paper.collection_name and the manifests. Vectors of retired
+    versions are purged after a grace period so in-flight queries can finish.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None):
+        ml_config = settings.ML_CONFIG
+        self.chunker = TextChunker.from_config()
+        self.config = index_config(self.chunker)
+        self.fingerprint = index_fingerprint(self.config)
+
+        self.embedding_service = EmbeddingService(self.config['embedding_model'])
+        self.index = GlobalVectorIndex(self.embedding_service, generation=index_generation(self.fingerprint))
+        self.vector_store = self.index.vector_store
+        self.section_detector = SectionDetector()
+        self.batch_size = batch_size or ml_config.get('REINDEX_BATCH_SIZE', 64)
+        self._related_finder = None
+
+    def stale_papers(self):
+        """
+        Ready papers without an active manifest for the current configuration.
+        """
+        current = PaperIndexManifest.objects.filter(status='active', fingerprint=self.fingerprint)
+        return (
+            Paper.objects
+            .filter(status='ready')
+            .exclude(full_text='')
+            .exclude(pk__in=current.values('paper_id'))
+            .order_by('created_at')
+        )
+
+    def adopt_current(self) -> int:
+        """
+        Records manifests for papers indexed before manifests existed whose
+        pipeline_fingerprint shows they were built with the current configuration.
+        Papers that borrow another paper's vectors are left stale for reindex().
+        """
+        papers = (
+            Paper.objects
+            .filter(status='ready', pipeline_fingerprint=pipeline_fingerprint(), index_manifests__isnull=True)
+            .exclude(collection_name='')
+            .exclude(pk__in=borrowing_chunks().values('paper_id'))
+            .only('id', 'collection_name', 'num_chunks')
+        )
+
+        now = timezone.now()
+        manifests = [self._manifest(paper, version=1, status='active', activated_at=now) for paper in papers.iterator()]
+        PaperIndexManifest.objects.bulk_create(manifests, batch_size=500)
+
+        logger.info(f"Adopted {len(manifests)} up-to-date papers into the index manifest")
+        return len(manifests)
+
+    def reindex(self, paper_id) -> Optional[PaperIndexManifest]:
+        """
+        Builds and activates a new index version of one paper. Returns None when there
+        is nothing to do or another worker is already building it.
+        """
+        manifest = self._start(paper_id)
+        if manifest is None:
+            return None
+
+        try:
+            self._build(manifest)
+            return manifest
+
+        except Exception as e:
+            logger.error(f"Re-indexing paper {paper_id} failed: {e}")
+            manifest.status = 'failed'
+            manifest.error_message = str(e)
+            manifest.save(update_fields=['status', 'error_message'])
+            if manifest.collection_name != manifest.paper.collection_name:
+                # drop the partial build; the serving version lives in another collection
+                self.index.delete_paper(paper_id, manifest.collection_name)
+            raise
+
+    def purge_retired(self, grace_seconds: Optional[int] = None) -> int:
+        """
+        Deletes the vectors of versions retired more than `grace_seconds` ago.
+        """
+        if grace_seconds is None:
+            grace_seconds = settings.ML_CONFIG.get('REINDEX_RETIRED_GRACE_SECONDS', 300)
+
+        retired = (
+            PaperIndexManifest.objects
+            .filter(status='retired', retired_at__lt=timezone.now() - timedelta(seconds=grace_seconds))
+            .select_related('paper')
+        )
+
+        purged = 0
+        for manifest in retired.iterator():
+            self._drop_vectors(manifest)
+            manifest.status = 'purged'
+            manifest.save(update_fields=['status'])
+            purged += 1
+
+        logger.info(f"Purged vectors of {purged} retired index versions")
+        return purged
+
+    def _start(self, paper_id) -> Optional[PaperIndexManifest]:
+
+        with transaction.atomic():
+            paper = Paper.objects.select_for_update().get(pk=paper_id)
+            manifests = PaperIndexManifest.objects.filter(paper=paper)
+
+            manifests.filter(status='building', created_at__lt=timezone.now() - BUILD_TIMEOUT).update(
+                status='failed', error_message='Build abandoned',
+            )
+            if manifests.filter(status='building').exists():
+                logger.info(f"Paper {paper_id} is already being re-indexed")
+                return None
+            if manifests.filter(status='active', fingerprint=self.fingerprint).exists():
+                return None
+
+            version = (manifests.aggregate(Max('version'))['version__max'] or 0) + 1
+            if (paper.collection_name == self.index.shard_for(paper.pk) and not manifests.exists()
+                    and not borrowing_chunks().filter(paper=paper).exists()):
+                # indexed into this generation before it had a manifest
+                self._manifest(paper, version, status='active', activated_at=timezone.now()).save()
+                return None
+
+            manifest = self._manifest(paper, version)
+            manifest.collection_name = self.index.shard_for(paper.pk)
+            manifest.save()
+            return manifest
+
+    def _build(self, manifest: PaperIndexManifest):
+
+        paper = manifest.paper
+        shard = manifest.collection_name
+        source_hash = hashlib.sha256(paper.full_text.encode()).hexdigest()
+
+        # vectors left behind by an earlier failed build of this generation
+        self.index.delete_paper(paper.pk, shard)
+
+        pages = split_pages(paper.full_text)
+        text = "".join(PAGE_HEADER.format(page_number=page['page_number']) + page['text'] for page in pages)
+        chunks = self.chunker.chunk_pages(pages, self.section_detector.detect(text))
+
+        previous = self._previous_vectors(paper)
+        dimension = self.embedding_service.model.get_sentence_embedding_dimension()
+        embeddings = np.empty((len(chunks), dimension), dtype=np.float32)
+        missing = []
+        for index, chunk in enumerate(chunks):
+            vector = previous.get(text_hash(chunk['content']))
+            if vector is not None and len(vector) == dimension:
+                embeddings[index] = vector
+            else:
+                missing.append(index)
+        if missing:
+            embeddings[missing] = self.embedding_service.create_embeddings([chunks[i]['content'] for i in missing])
+
+        ids = []
+        paper_metadata = self.index.paper_metadata(paper)
+        for start in range(0, len(chunks), self.batch_size):
+            end = start + self.batch_size
+            ids.extend(self.embedding_service.add_embedded_chunks(
+                shard, chunks[start:end], embeddings[start:end], paper_metadata,
+            ))
+
+        manifest.num_chunks = len(chunks)
+        manifest.reused_vectors = len(chunks) - len(missing)
+        manifest.embedded_vectors = len(missing)
+        self._activate(manifest, chunks, ids, source_hash)
+        self._refresh_related(paper)
+
+        logger.info(
+            f"Re-indexed paper {paper.pk} as v{manifest.version}: {len(chunks)} chunks, "
+            f"{manifest.reused_vectors} vectors reused, {manifest.embedded_vectors} embedded"
+        )
+
+    def _previous_vectors(self, paper: Paper) -> Dict[str, np.ndarray]:
+        """
+        {text hash: vector} of the serving version, when it used the same embedding model.
+        """
+        active = PaperIndexManifest.objects.filter(paper=paper, status='active').first()
+        if active is None or active.embedding_model != self.config['embedding_model'] or not paper.collection_name:
+            return {}
+
+        where = {'paper_id': str(paper.pk)} if self.index.is_global_collection(paper.collection_name) else None
+        try:
+            stored = self.vector_store.get(paper.collection_name, where=where, include_embeddings=True)
+        except Exception as e:
+            logger.warning(f"Cannot read the serving vectors of paper {paper.pk}, re-embedding: {e}")
+            return {}
+
+        return {
+            text_hash(document): embedding
+            for document, embedding in zip(stored['documents'], stored['embeddings'])
+        }
+
+    def _activate(self, manifest: PaperIndexManifest, chunks, ids, source_hash: str):
+
+        now = timezone.now()
+        with transaction.atomic():
+            paper = Paper.objects.select_for_update().get(pk=manifest.paper_id)
+            if hashlib.sha256(paper.full_text.encode()).hexdigest() != source_hash:
+                raise RuntimeError("Paper text changed while re-indexing")
+
+            PaperChunk.objects.filter(paper=paper).delete()
+            PaperChunk.objects.bulk_create(paper_chunk_rows(paper, chunks, ids), batch_size=500)
+            update_search_vectors(paper)
+
+            retire_serving_versions(paper, now)
+
+            paper.collection_name = manifest.collection_name
+            paper.num_chunks = len(chunks)
+            paper.save(update_fields=['collection_name', 'num_chunks', 'updated_at'])
+
+            manifest.status = 'active'
+            manifest.activated_at = now
+            manifest.save()
+
+            # cached answers cite chunks of the retired version
+            transaction.on_commit(lambda: invalidate_paper_answers(paper.pk))
+
+    def _refresh_related(self, paper: Paper):
+        """
+        Moves the paper's centroid into the centroid collection of the new embedding
+        model and recomputes its related papers there.
+        """
+        from app.ml_services.related_papers import RelatedPaperFinder
+
+        if self._related_finder is None:
+            self._related_finder = RelatedPaperFinder(self.index)
+        try:
+            self._related_finder.refresh(Paper.objects.get(pk=paper.pk))
+        except Exception as e:
+            # the index swap stands; refresh_stale_related_papers catches up
+            logger.warning(f"Failed to refresh related papers of re-indexed paper {paper.pk}: {e}")
+
+    def _drop_vectors(self, manifest: PaperIndexManifest):
+
+        paper = manifest.paper
+        collection = manifest.collection_name
+        if not collection or collection == paper.collection_name:
+            return
+
+        # papers reused through the content cache point at the vectors of their source paper
+        sharing = Paper.objects.filter(collection_name=collection).exclude(pk=paper.pk)
+        is_global = self.index.is_global_collection(collection)
+        if is_global:
+            sharing = sharing.filter(content_hash=paper.content_hash)
+        if sharing.exists():
+            logger.info(f"Keeping {collection} of paper {paper.pk}: still used by other papers")
+            return
+
+        try:
+            if is_global:
+                self.vector_store.delete(collection, {'paper_id': str(paper.pk)})
+            else:
+                self.vector_store.delete_collection(collection)
+        except Exception as e:
+            logger.warning(f"Failed to purge {collection} of paper {paper.pk}: {e}")
+
+    def _manifest(self, paper: Paper, version: int, status: str = 'building', activated_at=None) -> PaperIndexManifest:
+
+        return PaperIndexManifest(
+            paper=paper,
+            version=version,
+            status=status,
+            fingerprint=self.fingerprint,
+            chunker=self.config['chunker'],
+            embedding_model=self.config['embedding_model'],
+            collection_name=paper.collection_name,
+            num_chunks=paper.num_chunks,
+            activated_at=activated_at,
+        )
+
+
+def paper_chunk_rows(paper: Paper, chunks: List[Dict], embedding_ids: Optional[List[str]] = None) -> List[PaperChunk]:
+    """
+    PaperChunk rows for TextChunker.chunk_pages output; embedding ids are filled in by
+    index_paper_chunks when the chunks are embedded later.
+    """
+    embedding_ids = embedding_ids or [''] * len(chunks)
+    return [
+        PaperChunk(
+            paper=paper,
+            content=chunk['content'],
+            chunk_index=chunk['chunk_index'],
+            page_number=chunk['page_number'],
+            section_title=chunk['section'] or '',
+            embedding_id=embedding_id,
+            chunk_type=chunk['section'] if chunk['section'] in CHUNK_TYPES else 'other',
+        )
+        for chunk, embedding_id in zip(chunks, embedding_ids)
+    ]
+
+
+def retire_serving_versions(paper: Paper, now):
+    """
+    Retires the paper's active index version; call inside the transaction that repoints
+    Paper.collection_name. A paper indexed before manifests existed gets a retired
+    version 0 for its old collection, so purge_retired can drop those vectors too.
+    """
+    serving = PaperIndexManifest.objects.filter(paper=paper, status='active')
+    if not serving.exists() and paper.collection_name:
+        PaperIndexManifest.objects.get_or_create(
+            paper=paper,
+            version=0,
+            defaults={
+                'status': 'retired',
+                'collection_name': paper.collection_name,
+                'num_chunks': paper.num_chunks,
+                'retired_at': now,
+            },
+        )
+    serving.update(status='retired', retired_at=now)
+
+
+def index_paper_chunks(paper: Paper, batch_size: Optional[int] = None) -> Dict:
+    """
+    Embeds a freshly chunked paper's PaperChunk rows into the current generation of the
+    global index, fills their embedding ids and records the paper's active manifest.
+    Re-running replaces the vectors an interrupted run left in the shard.
+    """
+    config = index_config()
+    fingerprint = index_fingerprint(config)
+    index = GlobalVectorIndex(EmbeddingService(config['embedding_model']), generation=index_generation(fingerprint))
+    batch_size = batch_size or settings.ML_CONFIG.get('REINDEX_BATCH_SIZE', 64)
+
+    shard = index.shard_for(paper.pk)
+    index.delete_paper(paper.pk, shard)
+
+    chunks = list(PaperChunk.objects.filter(paper=paper).order_by('chunk_index'))
+    ids = index.add_paper_chunks(paper, (
+        {
+            'content': chunk.content,
+            'chunk_index': chunk.chunk_index,
+            'page_number': chunk.page_number,
+            'section': chunk.section_title,
+        }
+        for chunk in chunks
+    ), batch_size=batch_size)
+
+    return _activate_paper_vectors(paper, chunks, ids, shard, config, fingerprint, embedded_vectors=len(chunks))
+
+
+def index_reused_paper(paper: Paper, source: Paper, batch_size: Optional[int] = None) -> Dict:
+    """
+    index_paper_chunks for a paper whose PaperChunk rows the content cache cloned from
+    `source`: the source's vectors are added again under this paper's id, so paper-filtered
+    searches find them and each paper owns (and may purge) its own copy. Falls back to
+    embedding the chunks when the source vectors cannot be read in full.
+    """
+    config = index_config()
+    fingerprint = index_fingerprint(config)
+    index = GlobalVectorIndex(EmbeddingService(config['embedding_model']), generation=index_generation(fingerprint))
+    batch_size = batch_size or settings.ML_CONFIG.get('REINDEX_BATCH_SIZE', 64)
+
+    chunks = list(PaperChunk.objects.filter(paper=paper).order_by('chunk_index'))
+    stored = {'ids': []}
+    if source.collection_name:
+        where = {'paper_id': str(source.pk)} if index.is_global_collection(source.collection_name) else None
+        try:
+            stored = index.vector_store.get(source.collection_name, where=where, include_embeddings=True)
+        except Exception as e:
+            logger.warning(f"Cannot read the vectors of paper {source.pk}: {e}")
+
+    positions = {embedding_id: position for position, embedding_id in enumerate(stored['ids'])}
+    if any(chunk.embedding_id not in positions for chunk in chunks):
+        logger.warning(f"Vectors of paper {source.pk} are incomplete, embedding reused paper {paper.pk} afresh")
+        return index_paper_chunks(paper, batch_size)
+
+    shard = index.shard_for(paper.pk)
+    index.delete_paper(paper.pk, shard)
+
+    embeddings = np.asarray(stored['embeddings'], dtype=np.float32)[[positions[chunk.embedding_id] for chunk in chunks]]
+    paper_metadata = index.paper_metadata(paper)
+    ids = []
+    for start in range(0, len(chunks), batch_size):
+        end = start + batch_size
+        ids.extend(index.embedding_service.add_embedded_chunks(shard, [
+            {
+                'content': chunk.content,
+                'chunk_index': chunk.chunk_index,
+                'page_number': chunk.page_number,
+                'section': chunk.section_title,
+            }
+            for chunk in chunks[start:end]
+        ], embeddings[start:end], paper_metadata))
+
+    return _activate_paper_vectors(paper, chunks, ids, shard, config, fingerprint, reused_vectors=len(chunks))
+
+
+def _activate_paper_vectors(paper: Paper, chunks: List[PaperChunk], ids: List[str], shard: str, config: Dict,
+                            fingerprint: str, embedded_vectors: int = 0, reused_vectors: int = 0) -> Dict:
+    """
+    Points the paper's chunks at their new vectors and records its active manifest.
+    """
+    for chunk, embedding_id in zip(chunks, ids):
+        chunk.embedding_id = embedding_id
+
+    now = timezone.now()
+    with transaction.atomic():
+        locked = Paper.objects.select_for_update().get(pk=paper.pk)
+        PaperChunk.objects.bulk_update(chunks, ['embedding_id'], batch_size=500)
+        if locked.collection_name != shard:
+            retire_serving_versions(locked, now)
+        else:
+            # re-processing into the same shard: the old vectors were replaced above
+            PaperIndexManifest.objects.filter(paper=locked, status='active').update(status='purged', retired_at=now)
+
+        version = PaperIndexManifest.objects.filter(paper=locked).aggregate(Max('version'))['version__max'] or 0
+        PaperIndexManifest.objects.create(
+            paper=locked,
+            version=version + 1,
+            status='active',
+            fingerprint=fingerprint,
+            chunker=config['chunker'],
+            embedding_model=config['embedding_model'],
+            collection_name=shard,
+            num_chunks=len(chunks),
+            embedded_vectors=embedded_vectors,
+            reused_vectors=reused_vectors,
+            activated_at=now,
+        )
+        locked.collection_name = shard
+        locked.num_chunks = len(chunks)
+        locked.save(update_fields=['collection_name', 'num_chunks', 'updated_at'])
+        transaction.on_commit(lambda: invalidate_paper_answers(paper.pk))
+
+    paper.collection_name = shard
+    paper.num_chunks = len(chunks)
+    return {'collection_name': shard, 'num_chunks': len(chunks), 'index_version': version + 1}
+
+
+def borrowing_chunks():
+    """
+    PaperChunk rows pointing at a vector an earlier paper's chunk also points at. The content
+    cache used to reuse a paper this way, leaving vectors tagged with the source's paper_id,
+    so such a paper does not own an index version until it is re-indexed.
+    """
+    earlier = PaperChunk.objects.filter(
+        embedding_id=OuterRef('embedding_id'), paper__created_at__lt=OuterRef('paper__created_at'),
+    )
+    return PaperChunk.objects.exclude(embedding_id='').filter(Exists(earlier))
+
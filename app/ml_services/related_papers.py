@@ -0,0 +1,300 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from django.conf import settings
+from django.db import transaction
+import logging
+
+import numpy as np
+
+from app.ml_services.global_index import GlobalVectorIndex
+from app.ml_services.models import PaperIndexManifest
+from app.ml_services.reindex import index_fingerprint, index_generation
+from app.papers.models import Paper, RelatedPaper
+
+logger = logging.getLogger(__name__)
+
+
+# section vectors kept next to the whole-paper centroid, with their weight in the final score
+VECTOR_KINDS = {
+    'centroid': 0.6,
+    'abstract': 0.25,
+    'conclusion': 0.15,
+}
+
+
+def centroid_collection(embedding_model: str) -> str:
+    """
+    The centroid collection of one embedding model, so vectors of different models
+    (possibly of different dimensions) never share a collection.
+    """
+    base = settings.ML_CONFIG.get('CENTROID_COLLECTION', 'paper_centroids')
+    return f"{base}_{index_generation(index_fingerprint({'embedding_model': embedding_model}))}"
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class RelatedPaperFinder:
+    """
+    Fills RelatedPaper from compact per-paper vectors instead of chunk-to-chunk comparisons.
+
+    Each paper is reduced to a mean (centroid) embedding plus a few section means
+    stored in a dedicated centroid collection of the vector store. Related papers
+    are an ANN top-k over those vectors, so refreshing one paper costs a handful of
+    searches regardless of corpus size.
+
+    The centroid collection is versioned by embedding model. While a re-index moves
+    the corpus to a new model, papers still served by the old one are left out until
+    IncrementalReindexer refreshes them on activation.
+    """
+
+    def __init__(self, index: Optional[GlobalVectorIndex] = None):
+        ml_config = settings.ML_CONFIG
+        self.index = index or GlobalVectorIndex()
+        self.vector_store = self.index.vector_store
+        self.embedding_model = self.index.embedding_service.model_name
+        self.collection = centroid_collection(self.embedding_model)
+        self.top_n = ml_config.get('RELATED_PAPERS_TOP_N', 10)
+        self.candidates = ml_config.get('RELATED_PAPERS_CANDIDATES', 50)
+        self.min_score = ml_config.get('RELATED_PAPERS_MIN_SCORE', 0.3)
+
+        self.vector_store.ensure_collection(self.collection)
+
+    def update_paper_vectors(self, paper: Paper) -> Dict[str, np.ndarray]:
+        """
+        Recomputes and upserts the centroid and section vectors of one paper.
+        """
+        vectors = self.paper_vectors(paper)
+        self._store_vectors([(paper, vectors)])
+        return vectors
+
+    def paper_vectors(self, paper: Paper) -> Dict[str, np.ndarray]:
+        """
+        The centroid and section vectors of one paper, computed from its chunk embeddings.
+        Empty when the paper's serving index was built with another embedding model.
+        """
+        if not self._same_model(paper):
+            return {}
+
+        data = self._chunk_vectors(paper)
+        embeddings = data['embeddings']
+        if embeddings is None or len(embeddings) == 0:
+            return {}
+
+        normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        sections = np.array([metadata.get('section', 'other') for metadata in data['metadatas']])
+
+        vectors = {'centroid': _normalize(normalized.mean(axis=0))}
+        for kind in VECTOR_KINDS:
+            if kind == 'centroid':
+                continue
+            mask = sections == kind
+            if mask.any():
+                vectors[kind] = _normalize(normalized[mask].mean(axis=0))
+        return vectors
+
+    def find_related(self, paper: Paper, vectors: Optional[Dict[str, np.ndarray]] = None) -> List[tuple]:
+        """
+        Returns [(related_paper_id, score)] best first, scored as a weighted sum of
+        per-kind cosine similarities.
+        """
+        vectors = vectors if vectors is not None else self._stored_vectors(paper)
+        if not vectors:
+            return []
+
+        paper_id = str(paper.pk)
+        scores = defaultdict(float)
+        total_weight = sum(VECTOR_KINDS[kind] for kind in vectors)
+
+        for kind, vector in vectors.items():
+            hits = self.vector_store.query(
+                self.collection,
+                vector,
+                top_k=self.candidates + 1,
+                where={'kind': kind},
+            )
+            for hit in hits:
+                other_id = hit['metadata']['paper_id']
+                if other_id != paper_id:
+                    scores[other_id] += VECTOR_KINDS[kind] * (1 - hit['distance'])
+
+        ranked = sorted(
+            ((other_id, score / total_weight) for other_id, score in scores.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return [(other_id, score) for other_id, score in ranked[:self.top_n] if score >= self.min_score]
+
+    def refresh(self, paper: Paper, symmetric: bool = True,
+                vectors: Optional[Dict[str, np.ndarray]] = None) -> int:
+        """
+        Incremental mode: recompute one paper's vectors and its RelatedPaper rows.
+        With symmetric=True the new paper is also offered to its neighbours' lists.
+        Pass `vectors` when they were already stored (see refresh_many).
+        """
+        if vectors is None:
+            vectors = self.update_paper_vectors(paper)
+        related = self.find_related(paper, vectors)
+
+        existing_ids = set(
+            Paper.objects.filter(pk__in=[other_id for other_id, _ in related]).values_list('pk', flat=True)
+        )
+        related = [(other_id, score) for other_id, score in related if self._to_pk(other_id) in existing_ids]
+
+        with transaction.atomic():
+            self._upsert([(paper.pk, other_id, score) for other_id, score in related])
+            RelatedPaper.objects.filter(paper=paper, relationship_type='semantic').exclude(
+                related_paper_id__in=[other_id for other_id, _ in related]
+            ).delete()
+
+            if symmetric and related:
+                self._upsert([(other_id, paper.pk, score) for other_id, score in related])
+                for other_id, _ in related:
+                    self._trim(other_id)
+
+        logger.info(f"Stored {len(related)} related papers for paper {paper.pk}")
+        return len(related)
+
+    def stale_papers(self) -> List:
+        """
+        Ready papers whose stored vectors are missing or older than the paper itself.
+        """
+        stored = self.vector_store.get(self.collection, where={'kind': 'centroid'})
+        stored_at = {
+            metadata['paper_id']: metadata['source_updated_at']
+            for metadata in stored['metadatas']
+        }
+
+        other_model = PaperIndexManifest.objects.filter(status='active').exclude(embedding_model=self.embedding_model)
+        papers = Paper.objects.filter(status='ready').exclude(pk__in=other_model.values('paper_id'))
+        return [
+            paper_id
+            for paper_id, updated_at in papers.values_list('pk', 'updated_at').iterator()
+            if stored_at.get(str(paper_id)) != updated_at.isoformat()
+        ]
+
+    def refresh_many(self, paper_ids: Iterable) -> int:
+        """
+        Batch mode: stores the vectors of every paper with one write to the centroid
+        collection, then finds each paper's neighbours among the updated vectors.
+        """
+        computed = []
+        for paper in Paper.objects.filter(pk__in=list(paper_ids), status='ready').iterator():
+            try:
+                computed.append((paper, self.paper_vectors(paper)))
+            except Exception as e:
+                logger.error(f"Failed to compute the vectors of paper {paper.pk}: {e}")
+        self._store_vectors(computed)
+
+        refreshed = 0
+        for paper, vectors in computed:
+            try:
+                self.refresh(paper, vectors=vectors)
+                refreshed += 1
+            except Exception as e:
+                logger.error(f"Failed to refresh related papers for {paper.pk}: {e}")
+        return refreshed
+
+    def _store_vectors(self, computed: List[tuple]):
+        """
+        Upserts [(paper, vectors)] into the centroid collection: one delete, which the
+        FAISS store turns into tombstones, and one add for the whole batch.
+        """
+        paper_ids = [str(paper.pk) for paper, _ in computed]
+        if not paper_ids:
+            return
+        self.vector_store.delete(self.collection, {'paper_id': {'$in': paper_ids}})
+
+        rows = [(paper, kind, vector) for paper, vectors in computed for kind, vector in vectors.items()]
+        if not rows:
+            return
+        self.vector_store.add(
+            self.collection,
+            ids=[f'{paper.pk}:{kind}' for paper, kind, _ in rows],
+            embeddings=np.vstack([vector for _, _, vector in rows]).astype(np.float32),
+            documents=[''] * len(rows),
+            metadatas=[
+                {
+                    'paper_id': str(paper.pk),
+                    'user_id': str(paper.user_id),
+                    'kind': kind,
+                    'source_updated_at': paper.updated_at.isoformat(),
+                }
+                for paper, kind, _ in rows
+            ],
+        )
+
+    def _same_model(self, paper: Paper) -> bool:
+
+        # papers indexed before manifests existed are assumed to use the current model
+        models = set(
+            PaperIndexManifest.objects.filter(paper=paper, status='active').values_list('embedding_model', flat=True)
+        )
+        return not models or self.embedding_model in models
+
+    def _chunk_vectors(self, paper: Paper) -> Dict:
+
+        if self.index.is_global_collection(paper.collection_name or ''):
+            return self.vector_store.get(
+                paper.collection_name, where={'paper_id': str(paper.pk)}, include_embeddings=True,
+            )
+        return self.vector_store.get(paper.collection_name, include_embeddings=True)
+
+    def _stored_vectors(self, paper: Paper) -> Dict[str, np.ndarray]:
+
+        stored = self.vector_store.get(self.collection, where={'paper_id': str(paper.pk)}, include_embeddings=True)
+        return {
+            metadata['kind']: embedding
+            for metadata, embedding in zip(stored['metadatas'], stored['embeddings'])
+        }
+
+    def _upsert(self, rows: List[tuple]):
+        """
+        Creates or rescores semantic rows; pairs already related as a citation, topic or
+        author match are left alone.
+        """
+        pairs = {(self._to_pk(paper_id), self._to_pk(related_id)) for paper_id, related_id, _ in rows}
+        other = set(
+            RelatedPaper.objects
+            .filter(paper_id__in={paper_id for paper_id, _ in pairs},
+                    related_paper_id__in={related_id for _, related_id in pairs})
+            .exclude(relationship_type='semantic')
+            .values_list('paper_id', 'related_paper_id')
+        )
+        rows = [row for row in rows if (self._to_pk(row[0]), self._to_pk(row[1])) not in other]
+
+        RelatedPaper.objects.bulk_create(
+            [
+                RelatedPaper(
+                    paper_id=self._to_pk(paper_id),
+                    related_paper_id=self._to_pk(related_id),
+                    similarity_score=score,
+                    relationship_type='semantic',
+                )
+                for paper_id, related_id, score in rows
+            ],
+            update_conflicts=True,
+            unique_fields=['paper', 'related_paper'],
+            update_fields=['similarity_score'],
+        )
+
+    def _trim(self, paper_id):
+        """
+        Keeps only the top_n semantic neighbours of a paper.
+        """
+        keep = list(
+            RelatedPaper.objects
+            .filter(paper_id=self._to_pk(paper_id), relationship_type='semantic')
+            .order_by('-similarity_score')
+            .values_list('pk', flat=True)[:self.top_n]
+        )
+        RelatedPaper.objects.filter(
+            paper_id=self._to_pk(paper_id), relationship_type='semantic'
+        ).exclude(pk__in=keep).delete()
+
+    @staticmethod
+    def _to_pk(paper_id):
+        return Paper._meta.pk.to_python(paper_id)
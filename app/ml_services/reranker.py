@@ -0,0 +1,118 @@
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+import logging
+import time
+
+from app.ml_services.context_packer import TokenCounter
+from app.ml_services.model_registry import get_cross_encoder
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """
+    Cross-encoder rerank stage between retrieval and QAService.
+
+    Candidates are scored in batches in their retrieval order until the latency budget
+    would be exceeded. Scored candidates are sorted by cross-encoder score and any
+    unscored tail keeps its retrieval order, so an exhausted budget degrades to pure
+    vector order instead of failing. The best chunks are then kept up to `max_chunks`
+    and `token_budget`.
+    """
+
+    def __init__(self,
+                 model_name: Optional[str] = None,
+                 batch_size: Optional[int] = None,
+                 budget_ms: Optional[float] = None,
+                 max_chunks: Optional[int] = None,
+                 token_budget: Optional[int] = None,
+                 token_counter: Optional[TokenCounter] = None):
+        ml_config = settings.ML_CONFIG
+        self.model_name = model_name or ml_config['RERANK_MODEL']
+        self.batch_size = batch_size or ml_config.get('RERANK_BATCH_SIZE', 16)
+        self.budget_ms = budget_ms or ml_config.get('RERANK_BUDGET_MS', 300)
+        self.max_chunks = max_chunks or ml_config['TOP_K_RESULTS']
+        self.token_budget = token_budget or ml_config.get('RERANK_TOKEN_BUDGET', 1500)
+        self.candidates = ml_config.get('RERANK_CANDIDATES', 20)
+        self.token_counter = token_counter or TokenCounter()
+
+    def rerank(self, query: str, chunks: List[Dict]) -> Tuple[List[Dict], Dict]:
+
+        started = time.perf_counter()
+        stats = {
+            'candidates': len(chunks),
+            'scored': 0,
+            'fallback': False,
+        }
+        if not chunks:
+            stats['rerank_ms'] = 0.0
+            return [], stats
+
+        scores: List[float] = []
+        batch_ms = 0.0
+        try:
+            model = get_cross_encoder(self.model_name)
+
+            for start in range(0, len(chunks), self.batch_size):
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                # stop before a batch that would likely overrun the budget
+                if scores and elapsed_ms + batch_ms > self.budget_ms:
+                    break
+
+                batch_started = time.perf_counter()
+                batch = chunks[start:start + self.batch_size]
+                scores.extend(
+                    float(score)
+                    for score in model.predict([(query, chunk['content']) for chunk in batch],
+                                               batch_size=len(batch),
+                                               show_progress_bar=False)
+                )
+                batch_ms = (time.perf_counter() - batch_started) * 1000
+
+        except Exception as e:
+            logger.error(f"Reranking failed, keeping retrieval order: {e}")
+            scores = []
+
+        stats['scored'] = len(scores)
+        stats['fallback'] = len(scores) < len(chunks)
+
+        scored = sorted(
+            ((score, position) for position, score in enumerate(scores)),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        order = [position for _, position in scored] + list(range(len(scores), len(chunks)))
+
+        token_counts = self.token_counter.count_many([chunk['content'] for chunk in chunks])
+
+        selected = []
+        used_tokens = 0
+        for new_rank, position in enumerate(order):
+            if len(selected) >= self.max_chunks:
+                break
+            chunk = chunks[position]
+            tokens = token_counts[position]
+            if selected and used_tokens + tokens > self.token_budget:
+                continue
+
+            used_tokens += tokens
+            selected.append({
+                **chunk,
+                'rerank_score': scores[position] if position < len(scores) else None,
+                'retrieval_rank': position + 1,
+            })
+
+        shifts = [abs(chunk['retrieval_rank'] - rank) for rank, chunk in enumerate(selected, 1)]
+        stats.update({
+            'kept': len(selected),
+            'context_tokens': used_tokens,
+            'rank_shifts': [(chunk['retrieval_rank'], rank) for rank, chunk in enumerate(selected, 1)],
+            'mean_rank_shift': sum(shifts) / len(shifts) if shifts else 0.0,
+            'rerank_ms': round((time.perf_counter() - started) * 1000, 2),
+        })
+
+        logger.info(
+            f"Reranked {stats['scored']}/{stats['candidates']} candidates in {stats['rerank_ms']} ms, "
+            f"kept {stats['kept']} (mean rank shift {stats['mean_rank_shift']:.1f})"
+        )
+        return selected, stats
@@ -0,0 +1,163 @@
+from typing import Dict, List, Optional, Sequence
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F
+import logging
+import re
+
+from app.ml_services.embedding_service import EmbeddingService
+from app.ml_services.global_index import GlobalVectorIndex
+from app.ml_services.models import PaperIndexManifest
+from app.papers.models import Paper, PaperChunk
+
+logger = logging.getLogger(__name__)
+
+
+def update_search_vectors(paper: Paper):
+    """
+    Fills PaperChunk.search_vector for a paper's chunks; call after the chunks are saved.
+    """
+    config = settings.ML_CONFIG.get('SEARCH_CONFIG', 'english')
+    PaperChunk.objects.filter(paper=paper).update(search_vector=SearchVector('content', config=config))
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Dict]],
+                           k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> List[Dict]:
+    """
+    Merges ranked lists by sum(weight / (k + rank)). Results are matched on 'id'; the
+    first list a result appears in provides its fields.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    fused: Dict[str, Dict] = {}
+
+    for weight, results in zip(weights, result_lists):
+        for rank, result in enumerate(results, 1):
+            entry = fused.get(result['id'])
+            if entry is None:
+                entry = fused[result['id']] = {**result, 'rrf_score': 0.0}
+            entry['rrf_score'] += weight / (k + rank)
+
+    return sorted(fused.values(), key=lambda result: result['rrf_score'], reverse=True)
+
+
+class LexicalRetriever:
+    """
+    Postgres full-text search over PaperChunk.content (GIN-indexed search_vector).
+    Query terms are OR-ed so a question does not need every word to match,
+    and ts_rank_cd orders chunks by term density.
+    """
+
+    def __init__(self, config: Optional[str] = None):
+        self.config = config or settings.ML_CONFIG.get('SEARCH_CONFIG', 'english')
+
+    def search(self,
+               query: str,
+               top_k: int = 20,
+               paper_id=None,
+               user_id=None) -> List[Dict]:
+
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+
+        search_query = SearchQuery(' | '.join(terms), search_type='raw', config=self.config)
+        chunks = PaperChunk.objects.filter(search_vector=search_query)
+        if paper_id is not None:
+            chunks = chunks.filter(paper_id=paper_id)
+        if user_id is not None:
+            chunks = chunks.filter(paper__user_id=user_id)
+
+        chunks = (
+            chunks
+            .annotate(rank=SearchRank(F('search_vector'), search_query, cover_density=True))
+            .order_by('-rank')
+            .only('embedding_id', 'content', 'chunk_index', 'page_number', 'chunk_type', 'paper_id')
+            [:top_k]
+        )
+
+        return [
+            {
+                'id': chunk.embedding_id,
+                'content': chunk.content,
+                'metadata': {
+                    'chunk_index': chunk.chunk_index,
+                    'page_number': chunk.page_number or 0,
+                    'section': chunk.chunk_type,
+                    'paper_id': str(chunk.paper_id),
+                },
+                'lexical_rank': chunk.rank,
+            }
+            for chunk in chunks
+        ]
+
+
+class HybridRetriever:
+    """
+    Dense vector search fused with lexical search by reciprocal-rank fusion.
+
+    Lexical matches recover exact terms (dataset names, equation labels) that dense
+    retrieval misses. Target recall is then reached with a smaller TOP_K_RESULTS,
+    which keeps QA prompts short.
+    """
+
+    def __init__(self,
+                 embedding_service: Optional[EmbeddingService] = None,
+                 global_index: Optional[GlobalVectorIndex] = None,
+                 lexical: Optional[LexicalRetriever] = None):
+        ml_config = settings.ML_CONFIG
+        self.embedding_service = embedding_service or EmbeddingService(ml_config['EMBEDDING_MODEL'])
+        self.global_index = global_index or GlobalVectorIndex(self.embedding_service)
+        self.lexical = lexical or LexicalRetriever()
+        self.enabled = ml_config.get('HYBRID_RETRIEVAL', True)
+        self.candidates = ml_config.get('HYBRID_CANDIDATES', 20)
+        self.rrf_k = ml_config.get('RRF_K', 60)
+        self.top_k = ml_config['TOP_K_RESULTS']
+
+    def dense_search(self, paper: Paper, query: str, top_k: int) -> List[Dict]:
+
+        embedding_service = self._embedding_service_for(paper)
+        if self.global_index.is_global_collection(paper.collection_name or ''):
+            query_embedding = embedding_service.create_embeddings([query])[0]
+            return self.global_index.search_by_vector(
+                query_embedding, top_k=top_k, paper_id=paper.pk, shard=paper.collection_name,
+            )
+        return embedding_service.search(paper.collection_name, query, top_k=top_k)
+
+    def _embedding_service_for(self, paper: Paper) -> EmbeddingService:
+        """
+        Queries are embedded with the model the paper's serving index was built with,
+        which differs from EMBEDDING_MODEL until a re-index reaches the paper.
+        """
+        model_name = (
+            PaperIndexManifest.objects
+            .filter(paper=paper, status='active')
+            .values_list('embedding_model', flat=True)
+            .first()
+        )
+        if not model_name or model_name == self.embedding_service.model_name:
+            return self.embedding_service
+        return EmbeddingService(model_name, vector_store=self.embedding_service.vector_store)
+
+    def retrieve(self, paper: Paper, query: str, top_k: Optional[int] = None) -> List[Dict]:
+
+        top_k = top_k or self.top_k
+        if not self.enabled:
+            return self.dense_search(paper, query, top_k)
+
+        depth = max(self.candidates, top_k)
+        dense = self.dense_search(paper, query, depth)
+        lexical = self.lexical.search(query, top_k=depth, paper_id=paper.pk)
+
+        fused = reciprocal_rank_fusion([dense, lexical], k=self.rrf_k)[:top_k]
+
+        dense_ids = {result['id'] for result in dense}
+        lexical_ids = {result['id'] for result in lexical}
+        for result in fused:
+            # lexical-only hits carry no cosine score; keep the field QAService expects
+            result.setdefault('similarity_score', 0.0)
+            result['retrieved_by'] = [
+                name for name, ids in (('dense', dense_ids), ('lexical', lexical_ids)) if result['id'] in ids
+            ]
+
+        return fused
@@ -0,0 +1,130 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+SECTION_HEADINGS = {
+    'abstract': r'abstract',
+    'introduction': r'introduction',
+    'methodology': r'methodology|methods|materials(?:\s+and\s+methods)?',
+    'results': r'results(?:\s+and\s+discussion)?',
+    'discussion': r'discussion',
+    'conclusion': r'conclusions?(?:\s+and\s+future\s+work)?',
+    'references': r'references|bibliography',
+}
+
+# "3", "3.1", "III" with an optional dot, or "A." / "A)": a bare letter would match prose ("A results-driven...")
+NUMBER = r'(?:(?:\d+(?:\.\d+)*|[IVXLC]+)\.?|[A-H][.)])'
+NUMBERING = rf'(?P<numbering>{NUMBER}[ \t]+)?'
+
+FONT_SIZE_RATIO = 1.15
+BOLD_FLAG = 1 << 4
+
+
+def normalize_heading(line: str) -> str:
+
+    line = re.sub(rf'^\s*{NUMBER}\s+', '', line)
+    return re.sub(r'\s+', ' ', line).strip(' \t.:').lower()
+
+
+class SectionDetector:
+    """
+    Finds section headings with one compiled alternation in a single pass over the text.
+
+    A match must start a line (optionally after numbering such as "3." or "IV.")
+    and either end it or be followed by a run-in separator ("Abstract—...").
+    A hyphen only separates when it does not join words ("Results-driven").
+    When font hints are available, headings set in a larger or bold font win
+    over plain-text lines with the same wording (e.g. a table of contents).
+    """
+
+    def __init__(self, headings: Optional[Dict[str, str]] = None):
+        self.headings = headings or SECTION_HEADINGS
+
+        alternation = '|'.join(
+            f'(?P<{name}>{pattern})' for name, pattern in self.headings.items()
+        )
+        self.pattern = re.compile(
+            rf'^[ \t]*{NUMBERING}(?:{alternation})[ \t]*(?:$|[:.—–]|-(?!\w))',
+            re.IGNORECASE | re.MULTILINE,
+        )
+
+    def find_headings(self, text: str) -> List[Tuple[str, int, bool]]:
+        """
+        Returns (section_name, offset, numbered) for every heading-like line, in text order.
+        """
+        headings = []
+        for match in self.pattern.finditer(text):
+            headings.append((match.lastgroup, match.start(), match.group('numbering') is not None))
+        return headings
+
+    def detect(self, text: str, heading_lines: Optional[Set[str]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Returns {section_name: {'start': offset, 'end': offset}} where end is the start
+        of the next detected section (or the end of the text).
+        """
+        chosen: Dict[str, Tuple[int, int]] = {}
+
+        for name, offset, numbered in self.find_headings(text):
+            score = 1 if numbered else 0
+            if heading_lines:
+                line_end = text.find('\n', offset)
+                line = text[offset:line_end if line_end != -1 else len(text)]
+                if normalize_heading(line) in heading_lines:
+                    score += 2
+
+            # first occurrence wins unless a later one looks more like a real heading
+            if name not in chosen or score > chosen[name][1]:
+                chosen[name] = (offset, score)
+
+        ordered = sorted((offset, name) for name, (offset, _) in chosen.items())
+
+        sections = {}
+        for position, (start, name) in enumerate(ordered):
+            end = ordered[position + 1][0] if position + 1 < len(ordered) else len(text)
+            sections[name] = {'start': start, 'end': end}
+
+        return sections
+
+    @staticmethod
+    def collect_font_lines(page_dict: Dict) -> Tuple[List[Tuple[str, float, bool]], Counter]:
+        """
+        Reduces a PyMuPDF page.get_text('dict') to short candidate lines with their
+        largest span size, plus a histogram of characters per font size.
+        """
+        lines = []
+        size_histogram = Counter()
+
+        for block in page_dict.get('blocks', []):
+            for line in block.get('lines', []):
+                spans = line.get('spans', [])
+                text = ''.join(span['text'] for span in spans).strip()
+                if not text:
+                    continue
+
+                for span in spans:
+                    size_histogram[round(span['size'], 1)] += len(span['text'])
+
+                if len(text) <= 80:
+                    size = max(span['size'] for span in spans)
+                    bold = all(span['flags'] & BOLD_FLAG for span in spans if span['text'].strip())
+                    lines.append((text, size, bold))
+
+        return lines, size_histogram
+
+    @staticmethod
+    def heading_lines_from_fonts(font_lines: Iterable[Tuple[str, float, bool]],
+                                 size_histogram: Counter) -> Set[str]:
+
+        if not size_histogram:
+            return set()
+
+        body_size = size_histogram.most_common(1)[0][0]
+        return {
+            normalize_heading(text)
+            for text, size, bold in font_lines
+            if size >= body_size * FONT_SIZE_RATIO or bold
+        }
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from app.papers.models import Paper
+
+
+@receiver(post_init, sender=Paper)
+def remember_status(sender, instance, **kwargs):
+
+    # read from __dict__: a deferred status must not cost a query per loaded paper
+    instance._saved_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Paper)
+def queue_related_papers(sender, instance, created=False, update_fields=None, **kwargs):
+
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    # only a transition to ready; metadata edits of a ready paper keep its related papers
+    became_ready = instance.status == 'ready' and (created or instance._saved_status != 'ready')
+    instance._saved_status = instance.status
+    if not became_ready:
+        return
+
+    from app.ml_services.tasks import refresh_related_papers
+    transaction.on_commit(lambda: refresh_related_papers.delay(str(instance.pk)))
+
+
+@receiver(post_delete, sender=Paper)
+def drop_cached_answers(sender, instance, **kwargs):
+
+    from app.ml_services.answer_cache import invalidate_paper_answers
+    invalidate_paper_answers(instance.pk)
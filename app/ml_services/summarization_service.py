@@ -1,21 +1,44 @@
-from transformers import pipeline
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import logging
 from django.conf import settings
 
+from app.ml_services.extractive_summarizer import ExtractiveSummarizer
+from app.ml_services.model_registry import get_ollama_client, get_summarization_pipeline
+
 logger = logging.getLogger(__name__)
 
+
+# name -> (max_length, min_length) in model tokens
+SUMMARY_LENGTHS = {
+    'short': (200, 100),
+    'medium': (500, 200),
+    'long': (1000, 400),
+}
+
+MULTI_LENGTH_MODES = ('independent', 'shared_encoder', 'extractive')
+
 class SummarizationService:
 
     def __init__(self, model_name: str = "facebook/bart-large-cnn"):
-        try:
-            self.summarizer = pipeline("summarization",
-                                       model=model_name,
-                                       device=-1)
-            logger.info(f"Summarization service is ready.")
-        except Exception as e:
-            logger.error(f"Failed to summarization service: {e}")
-            self.summarizer = None
+        self.model_name = model_name
+        self.extractive = ExtractiveSummarizer()
+        self._summarizer = None
+        self._summarizer_loaded = False
+
+    @property
+    def summarizer(self):
+        """
+        The BART pipeline, loaded on first use so LLM-only work such as extract_key_insights
+        never loads it. None when it cannot be loaded.
+        """
+        if not self._summarizer_loaded:
+            self._summarizer_loaded = True
+            try:
+                self._summarizer = get_summarization_pipeline(self.model_name)
+                logger.info(f"Summarization service is ready.")
+            except Exception as e:
+                logger.error(f"Failed to summarization service: {e}")
+        return self._summarizer
 
     def summarize(self,
                   text: str,
@@ -27,15 +50,14 @@ class SummarizationService:
             return self._fallback_summarize(text, max_length)
 
         try:
-            max_input_length = 1024
-            if len(text) > max_input_length:
-                text = text[:max_input_length]
-
+            # truncation cuts the input at the model's token limit; use
+            # HierarchicalSummarizer to cover a whole paper
             summary = self.summarizer(
                 text,
                 max_length=max_length,
                 min_length=min_length,
                 do_sample=False,
+                truncation=True,
             )[0]['summary_text']
 
             return summary
@@ -44,24 +66,140 @@ class SummarizationService:
             logger.error(f"Failed to summarization service: {e}")
             return self._fallback_summarize(text, max_length)
 
-    def generate_multi_length_summaries(self, text: str) -> Dict[str, str]:
+    def summarize_batch(self,
+                        texts: List[str],
+                        max_length: int = 500,
+                        min_length: int = 100,
+                        batch_size: int = 8) -> List[str]:
+        """
+        Summarizes several texts through the pipeline as padded batches. Texts are
+        ordered by length first so each batch pads to similar lengths.
+        """
+        if not texts:
+            return []
+        if not self.summarizer:
+            return [self._fallback_summarize(text, max_length) for text in texts]
 
-        return {
-            'short': self.summarize(text, max_length=200, min_length=100),
-            'medium': self.summarize(text, max_length=500, min_length=200),
-            'long': self.summarize(text, max_length=1000, min_length=400),
+        try:
+            order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+            outputs = self.summarizer(
+                [texts[index] for index in order],
+                max_length=max_length,
+                min_length=min_length,
+                do_sample=False,
+                truncation=True,
+                batch_size=batch_size,
+            )
+            summaries = [''] * len(texts)
+            for index, output in zip(order, outputs):
+                summaries[index] = output['summary_text']
+            return summaries
+
+        except Exception as e:
+            logger.error(f"Batch summarization failed: {e}")
+            return [self._fallback_summarize(text, max_length) for text in texts]
+
+    def generate_multi_length_summaries(self, text: str, mode: Optional[str] = None) -> Dict[str, str]:
+        """
+        mode (default ML_CONFIG['SUMMARY_MULTI_LENGTH_MODE']):
+          independent    - three full pipeline calls, one per length
+          shared_encoder - the input is encoded once and each length only runs the decoder
+          extractive     - one long summary; medium and short keep its most central sentences
+        """
+        return self.generate_multi_length_summaries_batch([text], mode=mode)[0]
+
+    def generate_multi_length_summaries_batch(self,
+                                              texts: List[str],
+                                              mode: Optional[str] = None,
+                                              batch_size: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        generate_multi_length_summaries for several texts (e.g. different papers) at once,
+        run as padded batches.
+        """
+        if not texts:
+            return []
+        mode = mode or settings.ML_CONFIG.get('SUMMARY_MULTI_LENGTH_MODE', 'shared_encoder')
+        batch_size = batch_size or settings.ML_CONFIG.get('SUMMARY_BATCH_SIZE', 8)
+
+        if not self.summarizer:
+            # one sentence ranking per text serves every length
+            lengths = {name: max_length for name, (max_length, _) in SUMMARY_LENGTHS.items()}
+            return [self.extractive.summarize_lengths(text, lengths) for text in texts]
+
+        if mode == 'shared_encoder' and self.summarizer:
+            try:
+                return self._generate_with_shared_encoder(texts, batch_size)
+            except Exception as e:
+                logger.error(f"Shared-encoder summarization failed, generating independently: {e}")
+                mode = 'independent'
+
+        if mode == 'extractive':
+            long_max, long_min = SUMMARY_LENGTHS['long']
+            long_summaries = self.summarize_batch(texts, max_length=long_max, min_length=long_min, batch_size=batch_size)
+            return [
+                {
+                    'short': self.extractive.summarize(long_summary, SUMMARY_LENGTHS['short'][0]),
+                    'medium': self.extractive.summarize(long_summary, SUMMARY_LENGTHS['medium'][0]),
+                    'long': long_summary,
+                }
+                for long_summary in long_summaries
+            ]
+
+        by_length = {
+            name: self.summarize_batch(texts, max_length=max_length, min_length=min_length, batch_size=batch_size)
+            for name, (max_length, min_length) in SUMMARY_LENGTHS.items()
         }
+        return [
+            {name: by_length[name][index] for name in SUMMARY_LENGTHS}
+            for index in range(len(texts))
+        ]
+
+    def _generate_with_shared_encoder(self, texts: List[str], batch_size: int) -> List[Dict[str, str]]:
+
+        import torch
+        from transformers.modeling_outputs import BaseModelOutput
+
+        model = self.summarizer.model
+        tokenizer = self.summarizer.tokenizer
+
+        summaries: List[Dict[str, str]] = [{} for _ in texts]
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+
+        with torch.no_grad():
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                inputs = tokenizer(
+                    [texts[index] for index in batch],
+                    return_tensors='pt',
+                    padding=True,
+                    truncation=True,
+                    max_length=tokenizer.model_max_length,
+                )
+                hidden_state = model.get_encoder()(**inputs).last_hidden_state
+
+                for name, (max_length, min_length) in SUMMARY_LENGTHS.items():
+                    # generate() expands encoder outputs for beam search in place, so each call gets a fresh wrapper
+                    output_ids = model.generate(
+                        encoder_outputs=BaseModelOutput(last_hidden_state=hidden_state),
+                        attention_mask=inputs['attention_mask'],
+                        max_length=max_length,
+                        min_length=min_length,
+                        do_sample=False,
+                    )
+                    decoded = tokenizer.batch_decode(
+                        output_ids, skip_special_tokens=True, clean_up_tokenization_spaces=True
+                    )
+                    for index, summary in zip(batch, decoded):
+                        summaries[index][name] = summary.strip()
+
+        return summaries
 
     def summarize_with_llm(self, text: str, length: str = 'medium') -> str:
 
         try:
-            from langchain.community.llms import Ollama
             from langchain.prompts import PromptTemplate
 
-            llm = Ollama(
-                base_url = settings.ML_CONFIG['OLLAMA_BASE_URL'],
-                model=settings.ML_CONFIG['OLLAMA_MODEL'],
-            )
+            llm = get_ollama_client()
 
             length_instructions = {
                 'short': '2-3 sentences (about 100-200 words)',
@@ -81,13 +219,12 @@ class SummarizationService:
                 """
             )
 
-            chain = prompt | llm
-            summary = chain.invoke({
-                'text': text[:8000],
-                'length': length_instructions[length],
-            })
+            response = llm.generate_sync(
+                prompt.format(text=text[:8000], length=length_instructions[length]),
+                priority='batch',
+            )
 
-            return summary.strip()
+            return response['response'].strip()
 
         except Exception as e:
             logger.error(f"Error with LLM summarization: {e}")
@@ -96,35 +233,15 @@ class SummarizationService:
 
     def _fallback_summarize(self, text: str, max_length: int) -> str:
 
-        sentences = text.split('. ')
-
-        avg_sentence_length = len(text) / len(sentences) if sentences else 0
-        num_sentences = int(max_length / avg_sentence_length) if avg_sentence_length > 0 else 3
-        num_sentences = max(2, min(num_sentences, len(sentences)))
-
-        if len(sentences) <= num_sentences:
-            return '. '.join(sentences)
-
-        summary_sentences = [sentences[0]]
-
-        middle_indices = [len(sentences) // 2]
-        summary_sentences.extend([sentences[i] for i in middle_indices])
-
-        summary_sentences.append(sentences[-1])
-
-        return '. '.join(summary_sentences) + "."
+        return self.extractive.summarize(text, max_tokens=max_length)
 
     def extract_key_insights(self, text: str) -> Dict:
 
         try:
-            from langchain_community.llms import Ollama
             from langchain.prompts import PromptTemplate
             import json
 
-            llm = Ollama(
-                base_url = settings.ML_CONFIG['OLLAMA_BASE_URL'],
-                model = settings.ML_CONFIG['OLLAMA_MODEL'],
-            )
+            llm = get_ollama_client()
 
             prompt = PromptTemplate(
                 input_variables=['text'],
@@ -146,10 +263,10 @@ class SummarizationService:
                 """
             )
 
-            chain = prompt | llm
-            response = chain.invoke({'text': text[:8000]})
+            # format='json' constrains Ollama to emit valid JSON
+            response = llm.generate_sync(prompt.format(text=text[:8000]), priority='batch', format='json')
 
-            insights = json.loads(response.strip())
+            insights = json.loads(response['response'].strip())
             return insights
 
         except Exception as e:
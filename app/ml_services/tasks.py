@@ -0,0 +1,583 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def refresh_related_papers(paper_id: str):
+    """
+    Incremental mode, queued when a paper reaches `ready`.
+    """
+    from app.ml_services.related_papers import RelatedPaperFinder
+
+    RelatedPaperFinder().refresh_many([paper_id])
+
+
+@shared_task(ignore_result=True)
+def refresh_stale_related_papers(batch_size: int = 500):
+    """
+    Batch mode: refreshes every ready paper whose centroid is missing or out of date.
+    """
+    from app.ml_services.related_papers import RelatedPaperFinder
+
+    finder = RelatedPaperFinder()
+    stale = finder.stale_papers()
+    logger.info(f"Refreshing related papers for {len(stale)} stale papers")
+
+    for start in range(0, len(stale), batch_size):
+        finder.refresh_many(stale[start:start + batch_size])
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=None)
+def summarize_paper(self, paper_id: str):
+    """
+    Pipeline stage: hands the paper to the batched summarizer and polls its ProcessingTask
+    rather than holding a worker while the batch window fills. Once summarize_pending_papers
+    has stored the summaries the task returns, and the chord continues.
+    """
+    from django.conf import settings
+
+    stage = _latest_stage(paper_id, 'summarization')
+    if stage is not None and stage.status == 'complete':
+        return paper_id
+
+    if stage is None or stage.status == 'pending' or (stage.status == 'failed' and not self.request.retries):
+        queue_summarization(paper_id, self.request.id or '')
+    elif stage.status == 'failed':
+        error = RuntimeError(stage.error_message or 'batch summarization failed')
+        _fail_paper(paper_id, 'summarization', error)
+        raise error
+    elif stage.status == 'queued':
+        # the consumer scheduled for this window was lost; start another
+        summarize_pending_papers.delay()
+
+    raise self.retry(countdown=settings.ML_CONFIG.get('SUMMARY_BATCH_POLL_SECONDS', 10))
+
+
+def queue_summarization(paper_id: str, celery_task_id: str = '') -> None:
+    """
+    Marks the paper's summarization stage `queued` for the batched consumer.
+    summarize_pending_papers runs after SUMMARY_BATCH_WINDOW_SECONDS and picks up every
+    paper queued in the meantime. The `pending` rows start_pipeline creates up front are
+    never claimed: the paper's text may not be extracted yet.
+    """
+    from django.conf import settings
+    from django.db import transaction
+
+    from app.ml_services.models import ProcessingTask
+    from app.papers.models import Paper
+
+    with transaction.atomic():
+        stage = _latest_stage(paper_id, 'summarization', for_update=True)
+        stage = stage or ProcessingTask(paper_id=paper_id, task_type='summarization')
+        stage.status = 'queued'
+        stage.celery_task_id = celery_task_id
+        stage.progress_percentage = 0
+        stage.error_message = ''
+        stage.started_at = None
+        stage.completed_at = None
+        stage.save()
+
+        Paper.objects.filter(pk=paper_id).update(status=STAGE_STATUS['summarization'])
+
+        window = settings.ML_CONFIG.get('SUMMARY_BATCH_WINDOW_SECONDS', 5)
+        transaction.on_commit(lambda: summarize_pending_papers.apply_async(countdown=window))
+
+
+@shared_task(bind=True, ignore_result=True, acks_late=True, reject_on_worker_lost=True)
+def summarize_pending_papers(self, max_papers: int = None):
+    """
+    Batch consumer: claims queued summarization tasks (skip_locked, so concurrent consumers
+    never share work) and summarizes their papers together in padded batches. Rows left
+    `processing` by a consumer that died are claimed again: at once by its redelivered
+    message, otherwise after SUMMARY_BATCH_RECLAIM_SECONDS. Consumers scheduled for an
+    already drained window find nothing and return.
+    """
+    from datetime import timedelta
+
+    from django.conf import settings
+    from django.db import transaction
+    from django.db.models import Q
+    from django.utils import timezone
+
+    from app.ml_services.hierarchical_summarizer import HierarchicalSummarizer
+    from app.ml_services.models import ProcessingTask
+
+    ml_config = settings.ML_CONFIG
+    max_papers = max_papers or ml_config.get('SUMMARY_BATCH_MAX_PAPERS', 16)
+    celery_task_id = self.request.id or ''
+    now = timezone.now()
+    reclaim_before = now - timedelta(seconds=ml_config.get('SUMMARY_BATCH_RECLAIM_SECONDS', 1800))
+
+    claimable = Q(status='queued') | Q(status='processing', started_at__lt=reclaim_before)
+    if celery_task_id:
+        claimable |= Q(status='processing', celery_task_id=celery_task_id)
+
+    with transaction.atomic():
+        task_ids = list(
+            ProcessingTask.objects
+            .select_for_update(skip_locked=True)
+            .filter(claimable, task_type='summarization')
+            .order_by('created_at')
+            .values_list('pk', flat=True)[:max_papers]
+        )
+        ProcessingTask.objects.filter(pk__in=task_ids).update(
+            status='processing',
+            started_at=now,
+            celery_task_id=celery_task_id,
+        )
+
+    if not task_ids:
+        return
+
+    tasks = list(ProcessingTask.objects.filter(pk__in=task_ids).select_related('paper'))
+    logger.info(f"Summarizing a batch of {len(tasks)} papers")
+
+    try:
+        results = HierarchicalSummarizer().summarize_many(
+            [task.paper.full_text for task in tasks],
+            [_paper_sections(task.paper) for task in tasks],
+        )
+    except Exception as e:
+        logger.error(f"Batch summarization of {len(tasks)} papers failed: {e}")
+        _fail_tasks(tasks, e)
+        raise
+
+    for task, result in zip(tasks, results):
+        _store_summaries(task, result)
+
+    if len(task_ids) == max_papers:
+        # the window filled up; keep draining without waiting
+        summarize_pending_papers.delay(max_papers)
+
+
+def _store_summaries(task, result):
+
+    from django.utils import timezone
+
+    _save_summaries(task.paper, result['summaries'])
+
+    task.status = 'complete'
+    task.progress_percentage = 100
+    task.result = {
+        'timings_ms': result['timings_ms'],
+        **result['stats'],
+    }
+    task.completed_at = timezone.now()
+    task.save()
+
+
+def _save_summaries(paper, summaries):
+
+    paper.short_summary = summaries['short']
+    paper.medium_summary = summaries['medium']
+    paper.long_summary = summaries['long']
+    paper.save(update_fields=['short_summary', 'medium_summary', 'long_summary', 'updated_at'])
+
+
+def _fail_tasks(tasks, error: Exception):
+
+    from django.utils import timezone
+
+    for task in tasks:
+        task.status = 'failed'
+        task.error_message = str(error)
+        task.completed_at = timezone.now()
+        task.save()
+
+
+# Paper processing pipeline
+#
+#   extract_paper_text -> chunk_paper_text -> chord(summarize_paper,
+#                                                   extract_paper_insights,
+#                                                   embed_paper_chunks) -> find_related_papers
+#
+# Every stage owns the latest ProcessingTask row of its type for the paper. A stage that
+# finds its row complete returns at once, so re-queuing the pipeline after a worker
+# crash resumes at the first unfinished stage. Stages ack late, so a message whose
+# worker died is redelivered, and each stage overwrites its own output when re-run.
+# summarize_paper only queues the paper for summarize_pending_papers, which summarizes
+# the papers of one window together, and retries until its row is complete.
+# pipeline_failed is the canvas's error callback and frees the paper's scheduler slot.
+# CELERY_TASK_ROUTES sends the LLM-bound stage to the `llm` queue and the rest to `cpu`.
+
+PIPELINE_STAGES = ['pdf_extraction', 'chunking', 'summarization', 'key_insight', 'embedding', 'related_papers']
+
+# Paper.status while a stage runs
+STAGE_STATUS = {
+    'pdf_extraction': 'processing',
+    'chunking': 'processing',
+    'summarization': 'summarizing',
+    'key_insight': 'summarizing',
+    'embedding': 'embedding',
+    'related_papers': 'embedding',
+}
+
+IN_PROGRESS_STATUSES = ['uploading', 'processing', 'summarizing', 'embedding']
+
+
+def paper_pipeline(paper_id: str):
+    """
+    The processing canvas of one paper. Signatures are immutable: stages pass nothing but
+    the paper id and read their inputs from the database.
+    """
+    from celery import chain, chord, group
+
+    return chain(
+        extract_paper_text.si(paper_id),
+        chunk_paper_text.si(paper_id),
+        chord(
+            group(
+                summarize_paper.si(paper_id),
+                extract_paper_insights.si(paper_id),
+                embed_paper_chunks.si(paper_id),
+            ),
+            find_related_papers.si(paper_id),
+        ),
+    )
+
+
+def process_paper(paper, restart: bool = False, lane: str = None):
+    """
+    Submits a saved paper to FairScheduler, which starts its pipeline when a slot is free.
+    Completed stages are skipped, so calling this again resumes; restart=True re-runs every
+    stage. Raises QueueFull (HTTP 429 with Retry-After in DRF views) under back-pressure.
+    """
+    from app.ml_services.fair_scheduler import FairScheduler
+    from app.ml_services.models import ProcessingTask
+
+    if restart:
+        ProcessingTask.objects.filter(paper=paper, task_type__in=PIPELINE_STAGES).update(
+            status='pending', progress_percentage=0, error_message='', result=None,
+        )
+    return FairScheduler().submit(paper, lane)
+
+
+def start_pipeline(paper) -> None:
+    """
+    Queues the pipeline of a dispatched paper once the current transaction commits.
+    Only FairScheduler.dispatch and resume_stalled_papers call this directly.
+    """
+    from django.db import transaction
+
+    from app.ml_services.models import ProcessingTask
+
+    tasks = ProcessingTask.objects.filter(paper=paper, task_type__in=PIPELINE_STAGES)
+
+    # pending rows let clients show every stage before the workers reach it
+    existing = set(tasks.values_list('task_type', flat=True))
+    ProcessingTask.objects.bulk_create([
+        ProcessingTask(paper=paper, task_type=task_type)
+        for task_type in PIPELINE_STAGES if task_type not in existing
+    ])
+
+    paper_id = str(paper.pk)
+    transaction.on_commit(lambda: paper_pipeline(paper_id).apply_async(link_error=pipeline_failed.si(paper_id)))
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def extract_paper_text(self, paper_id: str):
+
+    return _run_stage(self, paper_id, 'pdf_extraction', _extract_text)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def chunk_paper_text(self, paper_id: str):
+
+    return _run_stage(self, paper_id, 'chunking', _chunk_text)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def extract_paper_insights(self, paper_id: str):
+
+    return _run_stage(self, paper_id, 'key_insight', _extract_insights)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def embed_paper_chunks(self, paper_id: str):
+
+    return _run_stage(self, paper_id, 'embedding', _embed_chunks)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def find_related_papers(self, paper_id: str):
+    """
+    Chord callback: runs once every parallel stage is complete and marks the paper ready.
+    """
+    from app.ml_services.content_cache import pipeline_fingerprint
+    from app.papers.models import Paper
+
+    _run_stage(self, paper_id, 'related_papers', _find_related)
+
+    # a queryset update: post_save would queue refresh_related_papers for work just done
+    Paper.objects.filter(pk=paper_id).update(
+        status='ready',
+        processing_error='',
+        pipeline_fingerprint=pipeline_fingerprint(),
+    )
+    logger.info(f"Paper {paper_id} is ready")
+    _release_slot(paper_id)
+    return paper_id
+
+
+@shared_task(ignore_result=True)
+def pipeline_failed(paper_id: str):
+    """
+    Error callback of the pipeline canvas. Celery calls it once per failed run: from the
+    failing chain stage, or for the chord only after every parallel stage has finished,
+    so the scheduler slot is never freed while a sibling stage still runs.
+    """
+    from app.papers.models import Paper
+
+    # a stage that died before its own error handling leaves the paper in progress
+    Paper.objects.filter(pk=paper_id, status__in=IN_PROGRESS_STATUSES).update(
+        status='failed',
+        processing_error='pipeline failed',
+    )
+    _release_slot(paper_id, failed=True)
+
+
+@shared_task(ignore_result=True)
+def resume_stalled_papers(stalled_minutes: int = 30):
+    """
+    Re-queues the pipeline of papers whose stages have shown no activity for
+    `stalled_minutes`, e.g. after a crash lost the chord state. Completed stages are skipped.
+    """
+    from datetime import timedelta
+
+    from django.db.models import Max
+    from django.utils import timezone
+
+    from app.papers.models import Paper
+
+    cutoff = timezone.now() - timedelta(minutes=stalled_minutes)
+    papers = (
+        Paper.objects
+        .filter(status__in=IN_PROGRESS_STATUSES, tasks__task_type__in=PIPELINE_STAGES)
+        .annotate(
+            last_created=Max('tasks__created_at'),
+            last_started=Max('tasks__started_at'),
+            last_completed=Max('tasks__completed_at'),
+        )
+    )
+
+    resumed = 0
+    for paper in papers:
+        last_activity = max(filter(None, [paper.last_created, paper.last_started, paper.last_completed]))
+        if last_activity < cutoff:
+            # already dispatched: resume without queueing behind other users' papers
+            start_pipeline(paper)
+            resumed += 1
+
+    logger.info(f"Resumed the pipeline of {resumed} stalled papers")
+
+
+@shared_task(ignore_result=True)
+def dispatch_scheduled_jobs():
+    """
+    Periodic safety net for FairScheduler: dispatching normally happens on submit and
+    whenever a pipeline finishes.
+    """
+    from app.ml_services.fair_scheduler import FairScheduler
+
+    FairScheduler().dispatch()
+
+
+def _release_slot(paper_id: str, failed: bool = False):
+
+    from app.ml_services.fair_scheduler import FairScheduler
+
+    try:
+        FairScheduler().job_finished(paper_id, failed=failed)
+    except Exception as e:
+        # a scheduler hiccup must not fail the paper; dispatch_scheduled_jobs catches up
+        logger.error(f"Failed to release the scheduler slot of paper {paper_id}: {e}")
+
+
+def _run_stage(task, paper_id: str, task_type: str, work):
+    """
+    Claims the stage's ProcessingTask, runs work(paper) and stores its result dict.
+    A stage completed by an earlier run is skipped.
+    """
+    from django.utils import timezone
+
+    from app.papers.models import Paper
+
+    stage = _claim_stage(paper_id, task_type, task.request.id or '')
+    if stage is None:
+        logger.info(f"Skipping {task_type} of paper {paper_id}: already complete")
+        return paper_id
+
+    try:
+        result = work(Paper.objects.get(pk=paper_id))
+
+    except Exception as e:
+        logger.error(f"{task_type} of paper {paper_id} failed: {e}")
+        _fail_tasks([stage], e)
+        _fail_paper(paper_id, task_type, e)
+        raise
+
+    stage.status = 'complete'
+    stage.progress_percentage = 100
+    stage.result = result
+    stage.completed_at = timezone.now()
+    stage.save()
+    return paper_id
+
+
+def _fail_paper(paper_id: str, task_type: str, error: Exception):
+
+    from app.papers.models import Paper
+
+    # the slot is released by pipeline_failed once the whole canvas has stopped
+    Paper.objects.filter(pk=paper_id).update(status='failed', processing_error=f"{task_type}: {error}")
+
+
+def _claim_stage(paper_id: str, task_type: str, celery_task_id: str):
+
+    from django.db import transaction
+    from django.utils import timezone
+
+    from app.ml_services.models import ProcessingTask
+    from app.papers.models import Paper
+
+    with transaction.atomic():
+        stage = _latest_stage(paper_id, task_type, for_update=True)
+        if stage is not None and stage.status == 'complete':
+            return None
+
+        stage = stage or ProcessingTask(paper_id=paper_id, task_type=task_type)
+        stage.status = 'processing'
+        stage.celery_task_id = celery_task_id
+        stage.progress_percentage = 0
+        stage.error_message = ''
+        stage.started_at = timezone.now()
+        stage.completed_at = None
+        stage.save()
+
+        Paper.objects.filter(pk=paper_id).update(status=STAGE_STATUS[task_type])
+    return stage
+
+
+def _latest_stage(paper_id, task_type: str, for_update: bool = False):
+
+    from app.ml_services.models import ProcessingTask
+
+    stages = ProcessingTask.objects.filter(paper_id=paper_id, task_type=task_type).order_by('-created_at')
+    if for_update:
+        stages = stages.select_for_update()
+    return stages.first()
+
+
+def _stage_result(paper_id, task_type: str) -> dict:
+
+    from app.ml_services.models import ProcessingTask
+
+    stage = (
+        ProcessingTask.objects
+        .filter(paper_id=paper_id, task_type=task_type, status='complete')
+        .order_by('-created_at')
+        .first()
+    )
+    return (stage.result or {}) if stage else {}
+
+
+def _extract_text(paper) -> dict:
+
+    from django.db import transaction
+    from django.utils import timezone
+
+    from app.ml_services.content_cache import PaperContentCache
+    from app.ml_services.models import ProcessingTask
+    from app.ml_services.pdf_processor import PDFProcessor
+
+    if PaperContentCache().reuse(paper):
+        # an identical PDF was processed before: every later stage is done too
+        later_stages = PIPELINE_STAGES[1:]
+        with transaction.atomic():
+            existing = set(
+                ProcessingTask.objects.filter(paper=paper, task_type__in=later_stages)
+                .values_list('task_type', flat=True)
+            )
+            ProcessingTask.objects.bulk_create([
+                ProcessingTask(paper=paper, task_type=task_type)
+                for task_type in later_stages if task_type not in existing
+            ])
+            ProcessingTask.objects.filter(paper=paper, task_type__in=later_stages).exclude(
+                status='complete'
+            ).update(status='complete', progress_percentage=100, result={'reused': True},
+                     completed_at=timezone.now())
+        return {'reused': True, 'num_pages': paper.num_pages}
+
+    extracted = PDFProcessor().extract_text(paper.pdf_file.path)
+    paper.full_text = extracted['full_text']
+    paper.full_text_length = len(extracted['full_text'])
+    paper.num_pages = extracted['num_pages']
+    paper.status = 'processing'
+    paper.save(update_fields=['full_text', 'full_text_length', 'num_pages', 'status', 'updated_at'])
+
+    # sections found with font hints are kept for chunking and summarization
+    return {'num_pages': extracted['num_pages'], 'sections': extracted['section']}
+
+
+def _paper_sections(paper):
+
+    return _stage_result(paper.pk, 'pdf_extraction').get('sections')
+
+
+def _chunk_text(paper) -> dict:
+
+    from django.db import transaction
+
+    from app.ml_services.answer_cache import invalidate_paper_answers
+    from app.ml_services.reindex import paper_chunk_rows
+    from app.ml_services.retrieval import update_search_vectors
+    from app.ml_services.section_detector import SectionDetector
+    from app.ml_services.text_chunker import TextChunker, split_pages
+    from app.papers.models import PaperChunk
+
+    pages = split_pages(paper.full_text)
+    sections = _paper_sections(paper)
+    if sections is None:
+        sections = SectionDetector().detect(paper.full_text)
+    chunks = TextChunker.from_config().chunk_pages(pages, sections)
+
+    with transaction.atomic():
+        PaperChunk.objects.filter(paper=paper).delete()
+        PaperChunk.objects.bulk_create(paper_chunk_rows(paper, chunks), batch_size=500)
+        update_search_vectors(paper)
+        paper.num_chunks = len(chunks)
+        paper.save(update_fields=['num_chunks', 'updated_at'])
+        # cached answers cite the replaced chunks
+        transaction.on_commit(lambda: invalidate_paper_answers(paper.pk))
+
+    return {'num_chunks': len(chunks)}
+
+
+def _extract_insights(paper) -> dict:
+
+    from django.conf import settings
+
+    from app.ml_services.summarization_service import SummarizationService
+
+    insights = SummarizationService(settings.ML_CONFIG['SUMMARIZATION_MODEL']).extract_key_insights(paper.full_text)
+    paper.key_findings = insights.get('key_findings') or []
+    paper.methodology = insights.get('methodology') or ''
+    paper.conclusion = insights.get('conclusions') or ''
+    paper.save(update_fields=['key_findings', 'methodology', 'conclusion', 'updated_at'])
+    return {'key_findings': len(paper.key_findings)}
+
+
+def _embed_chunks(paper) -> dict:
+
+    from app.ml_services.reindex import index_paper_chunks
+
+    return index_paper_chunks(paper)
+
+
+def _find_related(paper) -> dict:
+
+    from app.ml_services.related_papers import RelatedPaperFinder
+
+    return {'related_papers': RelatedPaperFinder().refresh(paper)}
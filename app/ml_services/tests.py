@@ -1,3 +1,1112 @@
-from django.test import TestCase
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+import asyncio
+import json
+import re
+import tempfile
+import threading
+import time
+import zlib
 
-# Create your tests here.
+from celery.signals import task_prerun
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.views import exception_handler
+
+from app.config import celery_app
+from app.ml_services import tasks
+from app.ml_services.content_cache import PaperContentCache, pipeline_fingerprint
+from app.ml_services.context_packer import ContextPacker, TokenCounter
+from app.ml_services.embedding_service import EmbeddingService
+from app.ml_services.fair_scheduler import (
+    BULK, INTERACTIVE as INTERACTIVE_LANE, FairQueue, FairScheduler, QueueFull, choose_lane, dispatch_slots, finish_tag,
+)
+from app.ml_services.models import PaperIndexManifest, ProcessingTask, ScheduledJob
+from app.ml_services.ollama_client import BATCH, INTERACTIVE, OllamaClient, PrioritySemaphore
+from app.ml_services.reindex import IncrementalReindexer, index_paper_chunks
+from app.ml_services.retrieval import HybridRetriever
+from app.ml_services.section_detector import SectionDetector, normalize_heading
+from app.ml_services.text_chunker import PAGE_HEADER, TextChunker
+from app.ml_services.vector_stores import DELTA, MAIN, FaissVectorStore
+from app.papers.models import Paper, PaperChunk
+
+
+class StubOllama:
+    """
+    Minimal /api/generate server: echoes the prompt, streams one NDJSON line per word.
+
+    `fail_first` answers that many requests with 503; while `hold` is set, a request whose
+    prompt is "hold" blocks until `release` is set.
+    """
+
+    def __init__(self, fail_first: int = 0):
+        self.fail_first = fail_first
+        self.prompts = []
+        self.release = threading.Event()
+        self.holding = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.prompts.append(payload['prompt'])
+
+                if stub.fail_first > 0:
+                    stub.fail_first -= 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                if payload['prompt'] == 'hold':
+                    stub.holding.set()
+                    stub.release.wait(10)
+
+                if payload['stream']:
+                    lines = [{'response': f'{word} ', 'done': False} for word in payload['prompt'].split()]
+                    lines.append({'response': '', 'done': True, 'eval_count': len(lines)})
+                    body = ''.join(json.dumps(line) + '\n' for line in lines).encode()
+                    content_type = 'application/x-ndjson'
+                else:
+                    body = json.dumps({'response': payload['prompt'], 'done': True}).encode()
+                    content_type = 'application/json'
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OllamaClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.stub = StubOllama()
+        self.addCleanup(self.stub.close)
+
+    def ollama(self, **kwargs):
+        return OllamaClient(
+            base_url=self.stub.url, model='stub', max_retries=2, backoff=0.01, timeout=10, slots_url='', **kwargs
+        )
+
+    def test_generate_retries_unavailable_server(self):
+        self.stub.fail_first = 2
+        client = self.ollama()
+
+        message = client.generate_sync('hello world', priority='batch')
+
+        self.assertEqual(message['response'], 'hello world')
+        self.assertEqual(self.stub.prompts, ['hello world'] * 3)
+        self.assertEqual(client.stats()['retries'], 2)
+
+    def test_stream_yields_lines_until_done(self):
+        client = self.ollama()
+
+        async def collect():
+            return [message async for message in client.stream('one two three')]
+
+        messages = asyncio.run(collect())
+
+        self.assertEqual(''.join(message['response'] for message in messages), 'one two three ')
+        self.assertTrue(messages[-1]['done'])
+        self.assertEqual(client.stats()['in_flight'], 0)
+
+    def test_interactive_request_is_served_before_queued_batch_work(self):
+        client = self.ollama(max_concurrency=1)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            executor.submit(client.generate_sync, 'hold', priority='batch')
+            self.assertTrue(self.stub.holding.wait(5))
+
+            batch = executor.submit(client.generate_sync, 'batch', priority='batch')
+            self._wait_for_queue(client, 1)
+            interactive = executor.submit(client.generate_sync, 'interactive', priority='interactive')
+            self._wait_for_queue(client, 2)
+
+            self.stub.release.set()
+            batch.result(5)
+            interactive.result(5)
+
+        self.assertEqual(self.stub.prompts, ['hold', 'interactive', 'batch'])
+
+    @staticmethod
+    def _wait_for_queue(client, depth):
+
+        deadline = time.monotonic() + 5
+        while client.stats()['queue_depth'] < depth:
+            if time.monotonic() > deadline:
+                raise AssertionError(f"queue never reached {depth} waiters")
+            time.sleep(0.01)
+
+
+class PrioritySemaphoreTests(SimpleTestCase):
+
+    def test_wakes_waiters_by_priority_then_arrival(self):
+
+        async def run():
+            semaphore = PrioritySemaphore(1)
+            await semaphore.acquire(BATCH)
+            order = []
+
+            async def waiter(name, priority):
+                await semaphore.acquire(priority)
+                order.append(name)
+                semaphore.release()
+
+            tasks = [
+                asyncio.ensure_future(waiter('batch-1', BATCH)),
+                asyncio.ensure_future(waiter('batch-2', BATCH)),
+                asyncio.ensure_future(waiter('interactive', INTERACTIVE)),
+            ]
+            await asyncio.sleep(0)
+            semaphore.release()
+            await asyncio.gather(*tasks)
+            return order, semaphore.available
+
+        order, available = asyncio.run(run())
+
+        self.assertEqual(order, ['interactive', 'batch-1', 'batch-2'])
+        self.assertEqual(available, 1)
+
+    def test_cancelled_waiter_popped_by_release_does_not_leak_or_raise(self):
+
+        async def run():
+            semaphore = PrioritySemaphore(1)
+            await semaphore.acquire(BATCH)
+
+            waiter = asyncio.ensure_future(semaphore.acquire(BATCH))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            # release() pops the cancelled future before the waiter gets to clean up
+            semaphore.release()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            return semaphore.available, semaphore.waiting
+
+        self.assertEqual(asyncio.run(run()), (1, 0))
+
+
+PAPER_TEXT = """
+[Page 1]
+Abstract
+We study attention.
+
+1. Introduction
+Attention lets every token look at every other token. """ + "It scales quadratically. " * 40
+
+
+@skipUnless(connection.vendor == 'postgresql', 'the pipeline uses Postgres full-text search and advisory locks')
+class PipelineTests(TestCase):
+    """
+    Runs the Celery canvas in-process (always eager, in-memory broker) with the PDF,
+    summarization and embedding services stubbed, and records every stage as it runs.
+    """
+
+    def setUp(self):
+        eager = {'task_always_eager': True, 'task_eager_propagates': False, 'broker_url': 'memory://'}
+        previous = {key: celery_app.conf[key] for key in eager}
+        celery_app.conf.update(eager)
+        self.addCleanup(celery_app.conf.update, previous)
+
+        overrider = override_settings(ML_CONFIG={
+            **settings.ML_CONFIG,
+            'CHUNK_UNIT': 'chars',
+            'ANSWER_CACHE_ENABLED': False,
+            'SUMMARY_BATCH_WINDOW_SECONDS': 0,
+            'SUMMARY_BATCH_POLL_SECONDS': 0,
+        })
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+        user = get_user_model().objects.create_user(username='author', password='secret')
+        self.paper = Paper.objects.create(
+            user=user, title='Attention', pdf_file='pdfs/attention.pdf', file_size=1, content_hash='a' * 64,
+        )
+
+        self.started = []
+        self.seen = []
+        self.fail_embedding = False
+
+        def record_task(sender=None, **kwargs):
+            self.started.append(sender.name.rsplit('.', 1)[-1])
+
+        task_prerun.connect(record_task, weak=False)
+        self.addCleanup(task_prerun.disconnect, record_task)
+
+        for patcher in (
+            mock.patch('app.ml_services.pdf_processor.PDFProcessor', return_value=mock.Mock(
+                extract_text=self._stage('pdf_extraction', {'full_text': PAPER_TEXT, 'num_pages': 1, 'section': None}),
+            )),
+            mock.patch('app.ml_services.hierarchical_summarizer.HierarchicalSummarizer', return_value=mock.Mock(
+                summarize_many=self._stage('summarization', None, self._summaries),
+            )),
+            mock.patch('app.ml_services.summarization_service.SummarizationService', return_value=mock.Mock(
+                extract_key_insights=self._stage('key_insight', {'key_findings': ['attention'], 'methodology': 'm'}),
+            )),
+            mock.patch('app.ml_services.reindex.index_paper_chunks', self._stage('embedding', None, self._embed)),
+            mock.patch('app.ml_services.related_papers.RelatedPaperFinder', return_value=mock.Mock(
+                refresh=self._stage('related_papers', 0),
+            )),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _stage(self, task_type, result, work=None):
+
+        def run(*args, **kwargs):
+            paper = Paper.objects.get(pk=self.paper.pk)
+            stage = tasks._latest_stage(paper.pk, task_type)
+            self.seen.append((task_type, paper.status, stage.status))
+            return work(*args, **kwargs) if work else result
+
+        return mock.Mock(side_effect=run)
+
+    @staticmethod
+    def _summaries(texts, sections=None):
+
+        summaries = {'short': 'short', 'medium': 'medium', 'long': 'long'}
+        return [{'summaries': summaries, 'timings_ms': {}, 'stats': {}} for _ in texts]
+
+    def _embed(self, paper):
+
+        if self.fail_embedding:
+            raise RuntimeError('embedding model unavailable')
+        return {'chunks': paper.num_chunks}
+
+    def _process(self):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.process_paper(self.paper)
+
+    def _stage_statuses(self):
+
+        return {
+            task_type: tasks._latest_stage(self.paper.pk, task_type).status
+            for task_type in tasks.PIPELINE_STAGES
+        }
+
+    def test_stages_run_in_order_and_mark_the_paper_ready(self):
+        self._process()
+
+        first_runs = list(dict.fromkeys(self.started))
+        self.assertEqual(first_runs, [
+            'extract_paper_text',
+            'chunk_paper_text',
+            'summarize_paper',
+            'summarize_pending_papers',
+            'extract_paper_insights',
+            'embed_paper_chunks',
+            'find_related_papers',
+        ])
+        # chunking runs the real TextChunker, every other stage one of the stubs
+        self.assertEqual(self.seen, [
+            (task_type, tasks.STAGE_STATUS[task_type], 'processing')
+            for task_type in tasks.PIPELINE_STAGES if task_type != 'chunking'
+        ])
+
+        self.paper.refresh_from_db()
+        self.assertEqual(self.paper.status, 'ready')
+        self.assertEqual(self.paper.short_summary, 'short')
+        self.assertGreater(self.paper.num_chunks, 0)
+        self.assertEqual(set(self._stage_statuses().values()), {'complete'})
+        self.assertEqual(ProcessingTask.objects.filter(paper=self.paper).count(), len(tasks.PIPELINE_STAGES))
+
+    def test_requeue_after_a_failed_stage_skips_completed_stages(self):
+        self.fail_embedding = True
+        with self.assertRaises(RuntimeError):
+            self._process()
+
+        self.paper.refresh_from_db()
+        self.assertEqual(self.paper.status, 'failed')
+        self.assertIn('embedding', self.paper.processing_error)
+        self.assertEqual(self._stage_statuses(), {
+            'pdf_extraction': 'complete',
+            'chunking': 'complete',
+            'summarization': 'complete',
+            'key_insight': 'complete',
+            'embedding': 'failed',
+            'related_papers': 'pending',
+        })
+
+        self.fail_embedding = False
+        self.seen.clear()
+        self._process()
+
+        self.assertEqual([task_type for task_type, _, _ in self.seen], ['embedding', 'related_papers'])
+        self.paper.refresh_from_db()
+        self.assertEqual(self.paper.status, 'ready')
+        self.assertEqual(set(self._stage_statuses().values()), {'complete'})
+
+
+class FairQueuingRuleTests(SimpleTestCase):
+
+    def test_newcomer_tag_sorts_ahead_of_a_bulk_backlog(self):
+        tag = 0.0
+        for _ in range(300):
+            tag = finish_tag(0.0, tag, weight=1.0)
+
+        self.assertEqual(tag, 300.0)
+        self.assertEqual(finish_tag(0.0, 0.0, weight=1.0), 1.0)
+        self.assertEqual(finish_tag(0.0, 0.0, weight=4.0), 0.25)
+        # a returning user does not get credit for time spent idle
+        self.assertEqual(finish_tag(50.0, 2.0, weight=1.0), 51.0)
+
+    def test_first_papers_of_a_user_are_interactive(self):
+        self.assertEqual([choose_lane(pending, 2) for pending in range(4)],
+                         [INTERACTIVE_LANE, INTERACTIVE_LANE, BULK, BULK])
+
+    def test_bulk_never_takes_the_reserved_slots(self):
+        # 8 slots, 2 reserved: an idle system starts at most 6 bulk jobs
+        self.assertEqual(dispatch_slots(8, 2, in_flight=0, interactive_waiting=0), (0, 6))
+        self.assertEqual(dispatch_slots(8, 2, in_flight=6, interactive_waiting=0), (0, 0))
+        # interactive work may use every free slot
+        self.assertEqual(dispatch_slots(8, 2, in_flight=6, interactive_waiting=5), (2, 0))
+        # ...and bulk still leaves two free after it
+        self.assertEqual(dispatch_slots(8, 2, in_flight=3, interactive_waiting=1), (1, 2))
+
+    def test_single_upload_starts_ahead_of_a_bulk_backlog(self):
+        queue = FairQueue(max_in_flight=4, interactive_reserved=1, interactive_per_user=2)
+        for paper in range(20):
+            queue.submit('bulk-user', paper)
+        started = queue.dispatch()
+        self.assertEqual([lane for _, _, lane in started], [INTERACTIVE_LANE, INTERACTIVE_LANE, BULK])
+
+        # the reserved slot is still free for the newcomer
+        self.assertEqual(queue.submit('newcomer', 'paper'), INTERACTIVE_LANE)
+        self.assertEqual(queue.dispatch(), [('newcomer', 'paper', INTERACTIVE_LANE)])
+
+        queue.finish('newcomer', INTERACTIVE_LANE)
+        self.assertEqual(queue.dispatch(), [])
+        queue.finish('bulk-user', INTERACTIVE_LANE)
+        self.assertEqual([(user, lane) for user, _, lane in queue.dispatch()], [('bulk-user', BULK)])
+
+
+class FairSchedulerTests(TestCase):
+
+    def setUp(self):
+        overrider = override_settings(ML_CONFIG={
+            **settings.ML_CONFIG,
+            'SCHEDULER_MAX_IN_FLIGHT': 3,
+            'SCHEDULER_INTERACTIVE_RESERVED': 1,
+            'SCHEDULER_INTERACTIVE_PER_USER': 2,
+            'SCHEDULER_MAX_QUEUED_PER_USER': 3,
+            'SCHEDULER_MAX_QUEUED': 100,
+            'SCHEDULER_PLAN_WEIGHTS': {},
+        })
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+        patcher = mock.patch('app.ml_services.tasks.start_pipeline')
+        self.start_pipeline = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user(username='uploader', password='secret')
+
+    def _paper(self, number):
+
+        return Paper.objects.create(
+            user=self.user, title=f'Paper {number}', pdf_file=f'pdfs/{number}.pdf', file_size=1,
+            content_hash=f'{number:064d}',
+        )
+
+    def test_submit_assigns_lanes_and_increasing_tags(self):
+        jobs = [FairScheduler().submit(self._paper(number)) for number in range(3)]
+
+        self.assertEqual([job.lane for job in jobs], [INTERACTIVE_LANE, INTERACTIVE_LANE, BULK])
+        tags = [job.virtual_finish for job in jobs]
+        self.assertEqual(tags, sorted(tags))
+        self.assertEqual(len(set(tags)), 3)
+
+    def test_dispatch_respects_slots_and_refills_a_freed_one(self):
+        scheduler = FairScheduler()
+        jobs = [scheduler.submit(self._paper(number)) for number in range(3)]
+
+        # 3 slots, 1 reserved: the bulk job waits while both interactive ones run
+        self.assertEqual(scheduler.dispatch(), 2)
+        self.assertEqual(
+            list(ScheduledJob.objects.filter(status='dispatched').values_list('lane', flat=True)),
+            [INTERACTIVE_LANE, INTERACTIVE_LANE],
+        )
+        self.assertEqual(scheduler.dispatch(), 0)
+
+        scheduler.job_finished(jobs[0].paper_id)
+
+        self.assertEqual(ScheduledJob.objects.get(pk=jobs[2].pk).status, 'dispatched')
+        self.assertEqual(self.start_pipeline.call_count, 3)
+
+    def test_queue_full_is_a_429_with_retry_after(self):
+        scheduler = FairScheduler()
+        for number in range(3):
+            scheduler.submit(self._paper(number))
+
+        with self.assertRaises(QueueFull) as raised:
+            scheduler.submit(self._paper(3))
+
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        response = exception_handler(raised.exception, {})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(raised.exception.retry_after))
+
+
+class SectionDetectorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.detector = SectionDetector()
+
+    def test_numbered_roman_and_lettered_headings(self):
+        cases = {
+            '3. Results\nfoo': ('results', True),
+            '3.1 Results\nfoo': ('results', True),
+            'III. Methods\nfoo': ('methodology', True),
+            'A. Introduction\nfoo': ('introduction', True),
+            'B) Discussion\nfoo': ('discussion', True),
+            'References\n[1] foo': ('references', False),
+        }
+        for text, (name, numbered) in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(self.detector.find_headings(text), [(name, 0, numbered)])
+
+    def test_run_in_headings(self):
+        for text, name in (
+            ('Abstract—We propose a model.', 'abstract'),
+            ('Results: we find that', 'results'),
+            ('Introduction.\nText', 'introduction'),
+            ('Conclusion - final remarks', 'conclusion'),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(self.detector.find_headings(text), [(name, 0, False)])
+
+    def test_prose_is_not_a_heading(self):
+        for text in (
+            'A results-driven approach',
+            'Results-driven design',
+            'The results show an improvement',
+            'A Results',
+            'Methods-based evaluation',
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(self.detector.find_headings(text), [])
+
+    def test_normalize_heading(self):
+        self.assertEqual(normalize_heading('3.1  Results:'), 'results')
+        self.assertEqual(normalize_heading('IV. Conclusion'), 'conclusion')
+        self.assertEqual(normalize_heading('  Related   Work. '), 'related work')
+
+    def test_sections_end_where_the_next_one_starts(self):
+        text = 'Abstract\nshort\n1. Introduction\nbody\n2. Results\nmore'
+
+        self.assertEqual(self.detector.detect(text), {
+            'abstract': {'start': 0, 'end': text.index('1. Introduction')},
+            'introduction': {'start': text.index('1. Introduction'), 'end': text.index('2. Results')},
+            'results': {'start': text.index('2. Results'), 'end': len(text)},
+        })
+
+    def test_numbered_heading_beats_an_earlier_plain_line(self):
+        text = 'Contents\nResults\n\n[Page 2]\n4. Results\nmore'
+
+        self.assertEqual(self.detector.detect(text)['results']['start'], text.index('4. Results'))
+
+    def test_font_hints_skip_the_table_of_contents(self):
+        text = 'Contents\nIntroduction .... 1\nResults .... 4\n\n[Page 2]\nIntroduction\nbody\nResults\nmore'
+        body = text.index('[Page 2]')
+
+        # without hints the first occurrence (the contents page) wins
+        self.assertLess(self.detector.detect(text)['introduction']['start'], body)
+
+        sections = self.detector.detect(text, heading_lines={'introduction', 'results'})
+        self.assertEqual(sections['introduction']['start'], text.index('Introduction', body))
+        self.assertEqual(sections['results'], {'start': text.index('Results', body), 'end': len(text)})
+
+    def test_heading_lines_from_fonts(self):
+        lines = [('1 Introduction', 14, False), ('body text', 10, False), ('Results', 10, True)]
+
+        self.assertEqual(
+            SectionDetector.heading_lines_from_fonts(lines, Counter({10: 1000, 14: 20})),
+            {'introduction', 'results'},
+        )
+
+
+CHUNKER_PAGES = [
+    {'page_number': 1, 'text': 'Abstract\nWe study chunking. ' * 6},
+    {'page_number': 2, 'text': 'It keeps offsets. Pages are short.\n\n' * 5},
+    {'page_number': 3, 'text': ''},
+    {'page_number': 4, 'text': '1. Results\n' + 'Chunks never cross sections. ' * 8},
+]
+
+
+def join_pages(pages):
+
+    return ''.join(PAGE_HEADER.format(page_number=page['page_number']) + page['text'] for page in pages)
+
+
+class TextChunkerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.chunker = TextChunker(chunk_size=120, chunk_overlap=30)
+        self.full_text = join_pages(CHUNKER_PAGES)
+        self.sections = {
+            'abstract': {'start': self.full_text.index('Abstract')},
+            'results': {'start': self.full_text.index('1. Results')},
+        }
+
+    def test_offsets_point_at_the_chunk_content(self):
+        chunks = self.chunker.chunk_pages(CHUNKER_PAGES, self.sections)
+
+        self.assertGreater(len(chunks), 5)
+        for chunk in chunks:
+            self.assertEqual(self.full_text[chunk['start']:chunk['end']], chunk['content'])
+            self.assertLessEqual(len(chunk['content']), 120)
+        self.assertEqual([chunk['chunk_index'] for chunk in chunks], list(range(len(chunks))))
+
+        for start, end in self.chunker.split_spans(self.full_text):
+            self.assertEqual(self.full_text[start:end], self.full_text[start:end].strip())
+
+    def test_pages_and_sections_across_page_headers(self):
+        chunks = self.chunker.chunk_pages(CHUNKER_PAGES, self.sections)
+        abstract_start = self.sections['abstract']['start']
+        results_start = self.sections['results']['start']
+        page_starts = {
+            page['page_number']: self.full_text.index(PAGE_HEADER.format(page_number=page['page_number']))
+            for page in CHUNKER_PAGES
+        }
+
+        for chunk in chunks:
+            # a chunk starts on the last page whose header begins at or before it
+            expected_page = max(number for number, start in page_starts.items() if start <= chunk['start'])
+            self.assertEqual(chunk['page_number'], expected_page)
+            self.assertGreaterEqual(chunk['page_end'], chunk['page_number'])
+            if chunk['start'] >= results_start:
+                self.assertEqual(chunk['section'], 'results')
+            elif chunk['start'] >= abstract_start:
+                self.assertEqual(chunk['section'], 'abstract')
+            else:
+                # the first page header, ahead of any detected section
+                self.assertIsNone(chunk['section'])
+            # no chunk crosses the section boundary
+            self.assertFalse(chunk['start'] < results_start < chunk['end'])
+
+        self.assertTrue(any(chunk['page_end'] > chunk['page_number'] for chunk in chunks))
+        self.assertNotIn(3, [chunk['page_number'] for chunk in chunks])
+        self.assertEqual(chunks[-1]['page_number'], 4)
+
+    def test_iter_chunks_matches_chunk_pages(self):
+        for sections in (None, self.sections):
+            with self.subTest(sections=sections):
+                self.assertEqual(
+                    list(self.chunker.iter_chunks(iter(CHUNKER_PAGES), sections)),
+                    self.chunker.chunk_pages(CHUNKER_PAGES, sections),
+                )
+
+        for chunk_size, chunk_overlap in ((40, 0), (300, 80), (5000, 0)):
+            chunker = TextChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    list(chunker.iter_chunks(iter(CHUNKER_PAGES), self.sections)),
+                    chunker.chunk_pages(CHUNKER_PAGES, self.sections),
+                )
+
+
+class StubTokenizer:
+    """
+    Fast-tokenizer stand-in: every word or punctuation mark, with words split into
+    word pieces of at most four characters.
+    """
+    is_fast = True
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False, verbose=True):
+        if isinstance(text, list):
+            return {'input_ids': [self(item)['input_ids'] for item in text]}
+
+        offsets = []
+        for match in re.finditer(r'\w+|[^\w\s]', text):
+            for start in range(match.start(), match.end(), 4):
+                offsets.append((start, min(start + 4, match.end())))
+        encoding = {'input_ids': list(range(len(offsets)))}
+        if return_offsets_mapping:
+            encoding['offset_mapping'] = offsets
+        return encoding
+
+
+TOKEN_TEXT = (
+    'Tokenization-aware chunking keeps embeddings untruncated. '
+    'Transformers process sequences of subword units; long words become several pieces.\n\n'
+) * 12
+
+
+class TokenChunkingTests(SimpleTestCase):
+
+    def setUp(self):
+        overrider = override_settings(ML_CONFIG={
+            **settings.ML_CONFIG, 'CHUNK_UNIT': 'tokens', 'CHUNK_TOKENS': 0, 'CHUNK_TOKEN_OVERLAP': 8,
+        })
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+    def _chunker(self, tokenizer):
+        model = mock.Mock(max_seq_length=34)
+        with mock.patch.object(TokenCounter, '_load', return_value=tokenizer), \
+                mock.patch('app.ml_services.model_registry.get_embedding_model', return_value=model):
+            return TextChunker.from_config()
+
+    def test_chunks_fit_the_embedding_model(self):
+        chunker = self._chunker(StubTokenizer())
+        self.assertEqual(chunker.chunk_size, 32)
+
+        chunks = chunker.chunk_text(TOKEN_TEXT)
+        counts = chunker.token_counter.count_many([chunk['content'] for chunk in chunks])
+
+        self.assertGreater(len(chunks), 10)
+        # [CLS] and [SEP] fit next to every chunk
+        self.assertLessEqual(max(counts) + 2, 34)
+        # windows are cut in their second half, so chunks stay close to the limit
+        self.assertGreaterEqual(min(counts[:-1]), 16)
+        for chunk in chunks:
+            self.assertEqual(TOKEN_TEXT[chunk['start']:chunk['end']], chunk['content'])
+            # overlaps never start inside a word
+            self.assertFalse(chunk['start'] and TOKEN_TEXT[chunk['start'] - 1].isalnum())
+
+    def test_regex_offsets_without_a_fast_tokenizer(self):
+        counter = self._chunker(None).token_counter
+        self.assertIsNone(counter.tokenizer)
+
+        text = '  Dense retrieval (DPR) scores 0.93 -- “ok”.\n\nNext'
+        offsets = counter.offsets(text)
+
+        self.assertEqual(
+            [text[start:end] for start, end in offsets],
+            ['Dense', 'retrieval', '(', 'DPR', ')', 'scores', '0', '.', '93', '-', '-', '“', 'ok', '”', '.', 'Next'],
+        )
+        self.assertEqual(offsets, sorted(offsets))
+        for (_, end), (start, _) in zip(offsets, offsets[1:]):
+            self.assertLessEqual(end, start)
+
+    def test_regex_fallback_chunks_stay_within_the_limit(self):
+        chunker = self._chunker(None)
+
+        spans = chunker.split_spans(TOKEN_TEXT)
+
+        self.assertGreater(len(spans), 5)
+        for start, end in spans:
+            self.assertLess(start, end)
+            self.assertLessEqual(len(chunker.token_counter.offsets(TOKEN_TEXT[start:end])), 32)
+
+
+def packer_chunk(chunk_id, content, paper_id=1, section='methodology', chunk_index=None, page_number=1):
+
+    metadata = {'paper_id': paper_id, 'section': section, 'page_number': page_number}
+    if chunk_index is not None:
+        metadata['chunk_index'] = chunk_index
+    return {'id': chunk_id, 'content': content, 'metadata': metadata}
+
+
+class ContextPackerTests(SimpleTestCase):
+
+    def setUp(self):
+        overrider = override_settings(ML_CONFIG={**settings.ML_CONFIG, 'CHUNK_OVERLAP': 50})
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+        with mock.patch.object(TokenCounter, '_load', return_value=None):
+            # no tokenizer: 4 characters per token
+            self.counter = TokenCounter('')
+
+    def _packer(self, token_budget=2000):
+        return ContextPacker(token_budget=token_budget, dedup_threshold=0.8, token_counter=self.counter)
+
+    def test_adjacent_chunks_write_their_overlap_once(self):
+        first = 'Attention weights every token pair. The overlap sentence repeats across chunk edges.'
+        second = 'The overlap sentence repeats across chunk edges. Multi-head attention runs in parallel.'
+        chunks = [
+            packer_chunk('c2', second, chunk_index=2, page_number=2),
+            packer_chunk('c1', first, chunk_index=1, page_number=1),
+            packer_chunk('c3', 'Positional encodings are added to the embeddings.', chunk_index=3, page_number=2),
+        ]
+
+        packed = self._packer().pack(chunks)
+
+        self.assertEqual(packed['merged'], 2)
+        [block] = packed['blocks']
+        self.assertEqual(block['source_ids'], ['c1', 'c2', 'c3'])
+        self.assertEqual(block['content'].count('The overlap sentence repeats'), 1)
+        self.assertTrue(block['content'].startswith('Attention weights'))
+        self.assertTrue(block['content'].endswith('\nPositional encodings are added to the embeddings.'))
+        # a block prepended with an earlier chunk takes that chunk's page
+        self.assertEqual(block['metadata']['page_number'], 1)
+
+    def test_chunks_of_other_sections_or_papers_are_not_merged(self):
+        chunks = [
+            packer_chunk('a', 'Results on the first benchmark improve.', chunk_index=4),
+            packer_chunk('b', 'A different section starts here entirely.', section='results', chunk_index=5),
+            packer_chunk('c', 'Another paper uses the same chunk index.', paper_id=2, chunk_index=5),
+        ]
+
+        packed = self._packer().pack(chunks)
+
+        self.assertEqual(packed['merged'], 0)
+        self.assertEqual([block['source_ids'] for block in packed['blocks']], [['a'], ['b'], ['c']])
+
+    def test_near_duplicates_of_a_better_block_are_dropped(self):
+        text = ' '.join(f'word{number}' for number in range(60))
+        chunks = [
+            packer_chunk('best', text, paper_id=1),
+            packer_chunk('copy', text + ' trailing', paper_id=2),
+            packer_chunk('other', ' '.join(f'term{number}' for number in range(60)), paper_id=3),
+        ]
+
+        packed = self._packer().pack(chunks)
+
+        self.assertEqual(packed['dropped_duplicates'], 1)
+        self.assertEqual([block['id'] for block in packed['blocks']], ['best', 'other'])
+
+    def test_blocks_are_added_by_relevance_within_the_budget(self):
+        chunks = [packer_chunk(f'c{number}', chr(ord('a') + number) * 200, paper_id=number) for number in range(4)]
+        block_tokens = self.counter.count(ContextPacker._format_block(1, chunks[0]))
+
+        packed = self._packer(token_budget=block_tokens * 2 + 5).pack(chunks)
+
+        self.assertEqual([block['id'] for block in packed['blocks']], ['c0', 'c1'])
+        self.assertEqual(packed['dropped_budget'], 2)
+        self.assertEqual(packed['tokens'], block_tokens * 2)
+
+    def test_an_oversized_first_block_is_truncated_to_the_budget(self):
+        chunks = [packer_chunk('long', 'x' * 4000), packer_chunk('short', 'short text', paper_id=2)]
+
+        packed = self._packer(token_budget=100).pack(chunks)
+
+        [block] = packed['blocks']
+        self.assertEqual(block['id'], 'long')
+        self.assertLess(len(block['content']), 400)
+        self.assertLessEqual(packed['tokens'], 100)
+        self.assertLessEqual(self.counter.count(packed['text']), 100)
+        self.assertEqual(packed['dropped_budget'], 1)
+
+
+def dense_hit(chunk_id, score):
+
+    return {'id': chunk_id, 'content': f'dense {chunk_id}', 'metadata': {}, 'similarity_score': score}
+
+
+def lexical_hit(chunk_id):
+
+    return {'id': chunk_id, 'content': f'lexical {chunk_id}', 'metadata': {}, 'lexical_rank': 0.5}
+
+
+class HybridRetrieverTests(SimpleTestCase):
+
+    def setUp(self):
+        overrider = override_settings(ML_CONFIG={
+            **settings.ML_CONFIG, 'HYBRID_RETRIEVAL': True, 'HYBRID_CANDIDATES': 20, 'RRF_K': 60, 'TOP_K_RESULTS': 3,
+        })
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+        self.paper = mock.Mock(pk=7)
+        self.lexical = mock.Mock()
+        self.retriever = HybridRetriever(embedding_service=mock.Mock(), global_index=mock.Mock(), lexical=self.lexical)
+
+        patcher = mock.patch.object(self.retriever, 'dense_search')
+        self.dense_search = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_are_ordered_by_fused_rank(self):
+        self.dense_search.return_value = [dense_hit('a', 0.9), dense_hit('b', 0.8), dense_hit('c', 0.7)]
+        self.lexical.search.return_value = [lexical_hit('c'), lexical_hit('a'), lexical_hit('d')]
+
+        results = self.retriever.retrieve(self.paper, 'question', top_k=4)
+
+        # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+        self.assertEqual([result['id'] for result in results], ['a', 'c', 'b', 'd'])
+        self.assertAlmostEqual(results[0]['rrf_score'], 1 / 61 + 1 / 62)
+        self.assertEqual(
+            [result['retrieved_by'] for result in results],
+            [['dense', 'lexical'], ['dense', 'lexical'], ['dense'], ['lexical']],
+        )
+        # the first list a result appears in provides its fields
+        self.assertEqual(results[1]['content'], 'dense c')
+        self.assertEqual(results[1]['similarity_score'], 0.7)
+        self.assertEqual(results[3]['similarity_score'], 0.0)
+
+        self.dense_search.assert_called_once_with(self.paper, 'question', 20)
+        self.lexical.search.assert_called_once_with('question', top_k=20, paper_id=7)
+
+    def test_fused_results_are_cut_to_top_k(self):
+        self.dense_search.return_value = [dense_hit(str(number), 1.0) for number in range(10)]
+        self.lexical.search.return_value = []
+
+        self.assertEqual([result['id'] for result in self.retriever.retrieve(self.paper, 'question')], ['0', '1', '2'])
+
+    def test_lexical_results_stand_in_when_dense_search_finds_nothing(self):
+        self.dense_search.return_value = []
+        self.lexical.search.return_value = [lexical_hit('x'), lexical_hit('y')]
+
+        results = self.retriever.retrieve(self.paper, 'BLEU on WMT14')
+
+        self.assertEqual([result['id'] for result in results], ['x', 'y'])
+        self.assertEqual([result['similarity_score'] for result in results], [0.0, 0.0])
+        self.assertEqual([result['retrieved_by'] for result in results], [['lexical'], ['lexical']])
+
+    def test_disabled_hybrid_retrieval_is_dense_only(self):
+        self.retriever.enabled = False
+        self.dense_search.return_value = [dense_hit('a', 0.9)]
+
+        self.assertEqual(self.retriever.retrieve(self.paper, 'question'), [dense_hit('a', 0.9)])
+        self.lexical.search.assert_not_called()
+
+
+class FaissVectorStoreTests(SimpleTestCase):
+    """
+    add -> query -> delete -> compact -> get for every index type, with a delta segment
+    small enough that papers are merged into the main index as they arrive.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.vectors = {}
+        self.rng = np.random.default_rng(0)
+
+    def _store(self, index_type):
+        return FaissVectorStore(
+            self.root, index_type=index_type, nlist=2, nprobe=2, delta_max_vectors=40, compact_ratio=0.3,
+        )
+
+    def _add_paper(self, store, paper_id, size=25):
+        vectors = self.rng.normal(size=(size, 16)).astype(np.float32)
+        ids = [f'{paper_id}:{number}' for number in range(size)]
+        store.add(
+            'papers', ids, vectors, [f'text of {chunk_id}' for chunk_id in ids],
+            [{'paper_id': paper_id, 'chunk_index': number} for number in range(size)],
+        )
+        self.vectors.update(zip(ids, vectors))
+
+    def _assert_finds_itself(self, store, chunk_id, where=None):
+        [hit] = store.query('papers', self.vectors[chunk_id], top_k=1, where=where)
+        self.assertEqual(hit['id'], chunk_id)
+        self.assertEqual(hit['content'], f'text of {chunk_id}')
+        self.assertAlmostEqual(hit['distance'], 0.0, places=4)
+
+    def _main_index(self, store):
+        # the IndexIDMap2 owns the wrapped index, so it has to outlive the downcast one
+        self.id_map = store._read_index('papers', writable=True)
+        return store.faiss.downcast_index(self.id_map.index)
+
+    def test_round_trip(self):
+        faiss_types = {'flat': 'IndexFlat', 'hnsw': 'IndexHNSW', 'ivf': 'IndexIVF'}
+
+        for index_type, faiss_type in faiss_types.items():
+            with self.subTest(index_type=index_type):
+                store = self._store(index_type)
+                store.delete_collection('papers')
+                store.ensure_collection('papers')
+                self.vectors.clear()
+
+                # the first paper stays in the delta segment
+                self._add_paper(store, 'p0')
+                self.assertTrue(store._index_path('papers', DELTA).exists())
+                self.assertFalse(store._index_path('papers', MAIN).exists())
+                self._assert_finds_itself(store, 'p0:3')
+
+                # the delta is merged once it holds 40 vectors; IVF trains at 2 lists * 39
+                for paper in range(1, 6):
+                    self._add_paper(store, f'p{paper}')
+                self.assertTrue(store._index_path('papers', MAIN).exists())
+                self.assertTrue(isinstance(self._main_index(store), getattr(store.faiss, faiss_type)))
+                self.assertEqual(store.count('papers'), 150)
+
+                # a second store reads the same files (memory-mapped where the index allows)
+                reader = self._store(index_type)
+                for chunk_id in ('p0:0', 'p2:24', 'p5:10'):
+                    self._assert_finds_itself(reader, chunk_id)
+                    self._assert_finds_itself(reader, chunk_id, where={'paper_id': chunk_id.split(':')[0]})
+                self.assertEqual(reader.query('papers', self.vectors['p1:0'], where={'paper_id': 'none'}), [])
+
+                # deleting from the main index leaves tombstones that queries skip
+                store.delete('papers', {'paper_id': 'p1'})
+                connection = store._mapping('papers')
+                self.assertEqual(connection.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0], 25)
+                hits = reader.query('papers', self.vectors['p1:4'], top_k=150)
+                self.assertEqual(len(hits), 125)
+                self.assertFalse(any(hit['metadata']['paper_id'] == 'p1' for hit in hits))
+
+                # a second delete crosses compact_ratio: the main index is rebuilt without them
+                store.delete('papers', {'paper_id': 'p2'})
+                self.assertEqual(connection.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0], 0)
+                main = self._main_index(store)
+                # an IVF rebuild keeps the trained coarse quantizer
+                self.assertTrue(isinstance(main, getattr(store.faiss, faiss_type)))
+                self.assertEqual(main.ntotal, 100)
+                self.assertEqual(store.count('papers'), 100)
+
+                # re-adding a deleted paper gets fresh faiss ids
+                self._add_paper(store, 'p1')
+                for chunk_id in ('p1:4', 'p3:7', 'p5:24'):
+                    self._assert_finds_itself(reader, chunk_id)
+                self.assertEqual(
+                    {hit['metadata']['paper_id'] for hit in reader.query('papers', self.vectors['p2:0'], top_k=200)},
+                    {'p0', 'p1', 'p3', 'p4', 'p5'},
+                )
+
+                stored = store.get('papers', where={'paper_id': 'p3'}, include_embeddings=True)
+                self.assertEqual(stored['ids'], [f'p3:{number}' for number in range(25)])
+                self.assertEqual(stored['documents'][0], 'text of p3:0')
+                self.assertEqual(stored['metadatas'][1], {'paper_id': 'p3', 'chunk_index': 1})
+                expected = np.stack([self.vectors[chunk_id] for chunk_id in stored['ids']])
+                expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+                np.testing.assert_allclose(stored['embeddings'], expected, atol=1e-5)
+
+    def test_a_narrow_filter_on_a_merged_hnsw_shard_keeps_full_recall(self):
+        # a sparse graph and small efSearch: a selector-restricted HNSW search finds ~30% here
+        store = FaissVectorStore(
+            self.root, index_type='hnsw', hnsw_m=8, ef_search=16, delta_max_vectors=500, exact_filter_ratio=0.05,
+        )
+        for paper in range(40):
+            self._add_paper(store, f'p{paper}', size=50)
+        # one vector of p7 is still in the delta segment
+        store.add('papers', ['p7:late'], self.rng.normal(size=(1, 16)).astype(np.float32), ['late'],
+                  [{'paper_id': 'p7'}])
+        self.assertTrue(store._index_path('papers', MAIN).exists())
+        self.assertTrue(store._index_path('papers', DELTA).exists())
+
+        for paper in range(10):
+            paper_id = f'p{paper}'
+            query = self.rng.normal(size=16).astype(np.float32)
+            stored = store.get('papers', where={'paper_id': paper_id}, include_embeddings=True)
+            scores = stored['embeddings'] @ (query / np.linalg.norm(query))
+            expected = [stored['ids'][position] for position in np.argsort(-scores)[:10]]
+
+            hits = store.query('papers', query, top_k=10, where={'paper_id': paper_id})
+
+            self.assertEqual([hit['id'] for hit in hits], expected)
+            np.testing.assert_allclose([1.0 - hit['distance'] for hit in hits], np.sort(scores)[::-1][:10], atol=1e-5)
+
+        # broad filters still go through the index
+        broad = [f'p{paper}' for paper in range(20)]
+        hits = store.query('papers', self.vectors['p3:5'], top_k=5, where={'paper_id': {'$in': broad}})
+        self.assertEqual(hits[0]['id'], 'p3:5')
+
+
+class HashingEmbeddingModel:
+    """
+    SentenceTransformer stand-in: a normalized bag of hashed words.
+    """
+    max_seq_length = 128
+
+    def get_sentence_embedding_dimension(self):
+        return 64
+
+    def tokenizer(self, texts, **kwargs):
+        return {'length': [len(text.split()) for text in texts]}
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'\w+', text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % 64] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+
+REUSED_CHUNKS = [
+    'Transformers replace recurrence with attention layers.',
+    'Convolutional networks slide learned kernels over images.',
+    'Recurrent networks process sequences one token at a time.',
+]
+
+
+class ContentCacheReuseTests(TestCase):
+
+    def setUp(self):
+        overrider = override_settings(ML_CONFIG={
+            **settings.ML_CONFIG, 'EMBEDDING_CACHE_ENABLED': False, 'GLOBAL_INDEX_SHARDS': 1,
+            'HYBRID_RETRIEVAL': False,
+        })
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = FaissVectorStore(directory.name, index_type='flat')
+        for patcher in (
+            mock.patch('app.ml_services.embedding_service.get_embedding_model', return_value=HashingEmbeddingModel()),
+            mock.patch('app.ml_services.embedding_service.get_vector_store', return_value=self.store),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user(username='reader', password='secret')
+        self.source = self._paper('source', status='ready')
+        PaperChunk.objects.bulk_create([
+            PaperChunk(paper=self.source, content=content, chunk_index=number, page_number=1)
+            for number, content in enumerate(REUSED_CHUNKS)
+        ])
+        index_paper_chunks(self.source)
+        self.source.pipeline_fingerprint = pipeline_fingerprint()
+        self.source.save(update_fields=['pipeline_fingerprint'])
+
+    def _paper(self, title, status='processing'):
+        return Paper.objects.create(
+            user=self.user, title=title, pdf_file=f'pdfs/{title}.pdf', file_size=1, content_hash='a' * 64,
+            status=status, full_text=' '.join(REUSED_CHUNKS),
+        )
+
+    def _embedding_ids(self, paper):
+        return set(PaperChunk.objects.filter(paper=paper).values_list('embedding_id', flat=True))
+
+    def test_a_reused_paper_answers_from_its_own_vectors(self):
+        paper = self._paper('copy')
+
+        self.assertTrue(PaperContentCache().reuse(paper))
+
+        paper.refresh_from_db()
+        self.assertEqual(paper.status, 'ready')
+        self.assertEqual(paper.num_chunks, 3)
+        self.assertTrue(self._embedding_ids(paper).isdisjoint(self._embedding_ids(self.source)))
+        manifest = PaperIndexManifest.objects.get(paper=paper, status='active')
+        self.assertEqual((manifest.collection_name, manifest.reused_vectors), (paper.collection_name, 3))
+
+        # the source's vectors may go away (e.g. deleted or re-indexed) without affecting the copy
+        self.store.delete(self.source.collection_name, {'paper_id': str(self.source.pk)})
+
+        retriever = HybridRetriever(embedding_service=EmbeddingService(settings.ML_CONFIG['EMBEDDING_MODEL']))
+        results = retriever.retrieve(paper, 'Which layers do transformers use instead of recurrence?', top_k=3)
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['content'], REUSED_CHUNKS[0])
+        self.assertEqual({result['metadata']['paper_id'] for result in results}, {str(paper.pk)})
+        self.assertEqual({result['id'] for result in results}, self._embedding_ids(paper))
+
+    def test_papers_borrowing_vectors_are_not_adopted(self):
+        # reused before vectors were copied: chunk rows point at the source's vectors
+        borrower = self._paper('borrower', status='ready')
+        PaperChunk.objects.bulk_create([
+            PaperChunk(paper=borrower, content=chunk.content, chunk_index=chunk.chunk_index,
+                       embedding_id=chunk.embedding_id)
+            for chunk in self.source.chunks.all()
+        ])
+        owner = self._paper('owner', status='ready')
+        PaperChunk.objects.create(paper=owner, content='own vector', chunk_index=0, embedding_id='own-vector')
+        Paper.objects.filter(pk__in=[borrower.pk, owner.pk]).update(
+            collection_name=self.source.collection_name, pipeline_fingerprint=pipeline_fingerprint(),
+        )
+
+        self.assertEqual(IncrementalReindexer().adopt_current(), 1)
+        self.assertFalse(PaperIndexManifest.objects.filter(paper=borrower).exists())
+        self.assertTrue(PaperIndexManifest.objects.filter(paper=owner, status='active').exists())
@@ -1,35 +1,116 @@
-from typing import List, Dict
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+import logging
 import re
 
-from django.utils.lorem_ipsum import paragraphs
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import logging
+from app.ml_services.context_packer import TokenCounter
 
 logger = logging.getLogger(__name__)
 
+
+# PDFProcessor joins page records into full_text with this header before every page,
+# so offsets computed here line up with its section spans
+PAGE_HEADER = "\n\n[Page {page_number}]\n"
+PAGE_HEADER_PATTERN = re.compile(r'\n\n\[Page (\d+)\]\n')
+
+# preferred break points, best first
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
 class TextChunker:
 
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    # bump whenever a change alters chunk boundaries for the same size/overlap
+    VERSION = '2'
+
+    def __init__(self,
+                 chunk_size: int = 1000,
+                 chunk_overlap: int = 200,
+                 unit: str = 'chars',
+                 tokenizer_name: Optional[str] = None):
+        """
+        unit='tokens' measures chunk_size / chunk_overlap in tokens of `tokenizer_name`
+        (default: the embedding model's tokenizer) instead of characters.
+        """
+        if unit not in ('chars', 'tokens'):
+            raise ValueError(f"Unknown chunk unit: {unit}")
+
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.unit = unit
+        self.token_counter = None
+        if unit == 'tokens':
+            self.token_counter = TokenCounter(tokenizer_name or settings.ML_CONFIG['EMBEDDING_MODEL'])
+
+    @classmethod
+    def from_config(cls, chunk_overlap: Optional[int] = None) -> 'TextChunker':
+        """
+        Chunker configured from ML_CONFIG. In token mode CHUNK_TOKENS=0 targets the
+        embedding model's max sequence length, so no chunk is truncated when embedded.
+        """
+        ml_config = settings.ML_CONFIG
+        if ml_config.get('CHUNK_UNIT', 'chars') != 'tokens':
+            overlap = ml_config['CHUNK_OVERLAP'] if chunk_overlap is None else chunk_overlap
+            return cls(ml_config['CHUNK_SIZE'], overlap)
+
+        chunk_tokens = ml_config.get('CHUNK_TOKENS', 0) or embedding_max_tokens()
+        overlap = ml_config.get('CHUNK_TOKEN_OVERLAP', 32) if chunk_overlap is None else chunk_overlap
+        return cls(chunk_tokens, overlap, unit='tokens')
+
+    def split_spans(self, text: str, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Single pass over text[start:end]: each chunk ends at the best separator in the second
+        half of its window (found with one rfind per separator), and the next chunk starts
+        chunk_overlap characters earlier on a word boundary. Returns absolute (start, end)
+        offsets with surrounding whitespace excluded.
+        """
+        end = len(text) if end is None else end
+        if self.unit == 'tokens':
+            return self._split_token_spans(text, start, end)
+
+        spans = []
+        position = start
+
+        while position < end:
+            while position < end and text[position].isspace():
+                position += 1
+            if position >= end:
+                break
+
+            limit = position + self.chunk_size
+            cut = end if limit >= end else self._find_break(text, position, limit)
+
+            chunk_end = cut
+            while chunk_end > position and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            spans.append((position, chunk_end))
+
+            if cut >= end:
+                break
 
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+            next_position = cut - self.chunk_overlap
+            if next_position > position + 1 and self.chunk_overlap:
+                space = text.find(' ', next_position, cut)
+                if space != -1:
+                    next_position = space + 1
+            position = next_position if next_position > position else cut
+
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+
+        return [text[start:end] for start, end in self.split_spans(text)]
 
     def chunk_text(self, text: str, metadata: Dict = None) -> List[Dict]:
 
         try:
-            chunks = self.splitter.split_text(text)
-
             result = []
-            for idx, chunk in enumerate(chunks):
+            for idx, (start, end) in enumerate(self.split_spans(text)):
                 chunk_data = {
-                    'content': chunk,
+                    'content': text[start:end],
                     'chunk_index': idx,
+                    'start': start,
+                    'end': end,
                     'metadata': metadata or {},
                 }
                 result.append(chunk_data)
@@ -41,12 +122,49 @@ class TextChunker:
             logger.error(e)
             raise
 
+    def chunk_pages(self, pages: List[Dict], sections: Optional[Dict] = None, metadata: Dict = None) -> List[Dict]:
+        """
+        Chunks PDFProcessor page records in one pass. Offsets are absolute positions in the
+        joined full_text (PDFProcessor.extract_text), `sections` are its section spans.
+        Chunks never cross a section boundary and carry start/end offsets, the page span
+        (page_number .. page_end, resolved by bisect over page start offsets) and the section.
+        """
+        parts = []
+        page_starts = []
+        page_numbers = []
+        offset = 0
+        for page in pages:
+            header = PAGE_HEADER.format(page_number=page['page_number'])
+            page_starts.append(offset)
+            page_numbers.append(page['page_number'])
+            parts.append(header)
+            parts.append(page['text'])
+            offset += len(header) + len(page['text'])
+        text = "".join(parts)
+
+        section_spans = sorted((span['start'], name) for name, span in (sections or {}).items())
+        section_starts = [start for start, _ in section_spans]
+        boundaries = sorted({0, len(text), *section_starts})
+
+        chunks = []
+        for region_start, region_end in zip(boundaries, boundaries[1:]):
+            position = bisect_right(section_starts, region_start) - 1
+            section = section_spans[position][1] if position >= 0 else None
+
+            for start, end in self.split_spans(text, region_start, region_end):
+                chunks.append(_chunk_record(
+                    text[start:end], len(chunks), start, end, page_starts, page_numbers, section, metadata,
+                ))
+
+        logger.info(f"Created {len(chunks)} chunks from {len(pages)} pages")
+        return chunks
+
     def chunk_by_sections(self, sections_dict: Dict[str, str]) -> List[Dict]:
 
         all_chunks = []
 
         for section_name, section_text in sections_dict.items():
-            chunks = self.splitter.split_text(section_text)
+            chunks = self.split_text(section_text)
 
             for idx, chunk in enumerate(chunks):
                 chunk_data = {
@@ -60,33 +178,94 @@ class TextChunker:
                 all_chunks.append(chunk_data)
 
         return all_chunks
-    def smart_chunk(self, text: str, page_mapping: Dict = None) -> List[Dict]:
 
-        paragraphs = text.split("\n\n")
+    def iter_chunks(self, pages: Iterable[Dict], sections: Optional[Dict] = None,
+                    metadata: Dict = None) -> Iterator[Dict]:
+        """
+        Streaming counterpart of chunk_pages for page records from PDFProcessor.iter_pages.
+        Yields the same chunks (offsets, page span, section) but only carries the text from
+        the start of the unfinished tail chunk between pages, so memory stays bounded by
+        a page plus one chunk regardless of document length.
+        """
+        section_spans = sorted((span['start'], name) for name, span in (sections or {}).items())
+        section_starts = [start for start, _ in section_spans]
+        next_section = 0
+        page_starts = []
+        page_numbers = []
+
+        # buffer is the joined text from absolute offset `base` on, position the next chunk start
+        buffer = ""
+        base = 0
+        position = 0
+        region_start = 0
+        chunk_index = 0
+
+        def records(spans):
+            nonlocal chunk_index
+            found = bisect_right(section_starts, region_start) - 1
+            section = section_spans[found][1] if found >= 0 else None
+            for start, end in spans:
+                yield _chunk_record(
+                    buffer[start:end], chunk_index, base + start, base + end,
+                    page_starts, page_numbers, section, metadata,
+                )
+                chunk_index += 1
+
+        for page in pages:
+            header = PAGE_HEADER.format(page_number=page['page_number'])
+            page_starts.append(base + len(buffer))
+            page_numbers.append(page['page_number'])
+            buffer += header + (page.get('text') or '')
+
+            # a section region is complete once the next section has started
+            while next_section < len(section_starts) and section_starts[next_section] <= base + len(buffer):
+                boundary = section_starts[next_section]
+                yield from records(self.split_spans(buffer, position - base, boundary - base))
+                position = region_start = boundary
+                next_section += 1
+
+            # the last chunk may still grow with the next page, so it is split again then
+            spans = self.split_spans(buffer, position - base)
+            yield from records(spans[:-1])
+            if spans:
+                position = base + spans[-1][0]
+            buffer = buffer[position - base:]
+            base = position
+
+        yield from records(self.split_spans(buffer, position - base))
+
+    def smart_chunk(self, text: str, page_mapping: Dict = None) -> List[Dict]:
+        """
+        Packs whole paragraphs into chunks of up to chunk_size. page_mapping is
+        {page_number: (start_offset, end_offset)} in `text`; a chunk gets the page
+        its first paragraph starts on.
+        """
+        page_at = self._page_lookup(page_mapping)
 
         chunks = []
         current_chunk = ""
-        current_page = 1
+        current_start = 0
+
+        for match in re.finditer(r'(?:(?!\n\n).)+', text, flags=re.DOTALL):
+            para = match.group()
 
-        for para in paragraphs:
+            if current_chunk and len(current_chunk) + len(para) > self.chunk_size:
+                chunks.append({
+                    'content': current_chunk.strip(),
+                    'page_number': page_at(current_start),
+                })
+                current_chunk = ""
 
-            if len(current_chunk) + len(para) > self.chunk_size:
-                if current_chunk:
-                    chunks.append({
-                        'content': current_chunk.strip(),
-                        'page_number': current_page,
-                    })
+            if not current_chunk:
                 current_chunk = para
+                current_start = match.start()
             else:
                 current_chunk += "\n\n" + para
 
-            if page_mapping:
-                current_page = self._get_page_number(len(current_chunk), page_mapping)
-
         if current_chunk:
             chunks.append({
                 'content': current_chunk.strip(),
-                'page_number': current_page,
+                'page_number': page_at(current_start),
             })
 
         for idx, chunk in enumerate(chunks):
@@ -94,9 +273,108 @@ class TextChunker:
 
         return chunks
 
-    def _get_page_number(self, char_position: int, page_mapping: Dict) -> int:
+    @staticmethod
+    def _page_lookup(page_mapping: Optional[Dict]):
+
+        if not page_mapping:
+            return lambda offset: 1
+
+        ordered = sorted((char_range[0], page_num) for page_num, char_range in page_mapping.items())
+        starts = [start for start, _ in ordered]
+
+        def page_at(offset: int) -> int:
+            position = bisect_right(starts, offset) - 1
+            return ordered[max(position, 0)][1]
+
+        return page_at
+
+    def _split_token_spans(self, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """
+        split_spans in token units: the region is tokenized once and windows of chunk_size
+        tokens are cut at the best separator in their second half, so every chunk holds
+        at most chunk_size tokens and most hold nearly that many.
+        """
+        offsets = self.token_counter.offsets(text[start:end])
+        token_starts = [start + token_start for token_start, _ in offsets]
+        token_ends = [start + token_end for _, token_end in offsets]
+        num_tokens = len(offsets)
+
+        spans = []
+        first = 0
+        while first < num_tokens:
+            last = first + self.chunk_size
+            if last >= num_tokens:
+                spans.append((token_starts[first], token_ends[-1]))
+                break
+
+            cut = self._best_break(text, token_starts[first + self.chunk_size // 2], token_ends[last - 1])
+            next_token = max(bisect_left(token_starts, cut), first + 1)
+
+            chunk_end = min(cut, token_ends[next_token - 1])
+            while chunk_end > token_starts[first] and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            spans.append((token_starts[first], chunk_end))
+
+            following = max(next_token - self.chunk_overlap, first + 1)
+            # do not start the overlap inside a word (e.g. on a "##ing" word piece)
+            while following < next_token and text[token_starts[following] - 1].isalnum():
+                following += 1
+            first = following
+
+        return spans
+
+    def _find_break(self, text: str, start: int, limit: int) -> int:
+
+        # never break in the first half of the window, so chunks stay close to chunk_size
+        return self._best_break(text, start + self.chunk_size // 2, limit)
+
+    @staticmethod
+    def _best_break(text: str, floor: int, limit: int) -> int:
+
+        for separator in SEPARATORS:
+            index = text.rfind(separator, floor, limit)
+            if index != -1:
+                return index + len(separator)
+        return limit
+
+
+def _chunk_record(content: str, chunk_index: int, start: int, end: int, page_starts: List[int],
+                  page_numbers: List[int], section: Optional[str], metadata: Optional[Dict]) -> Dict:
+
+    return {
+        'content': content,
+        'chunk_index': chunk_index,
+        'start': start,
+        'end': end,
+        'page_number': page_numbers[max(bisect_right(page_starts, start) - 1, 0)],
+        'page_end': page_numbers[max(bisect_right(page_starts, end - 1) - 1, 0)],
+        'section': section,
+        'metadata': metadata or {},
+    }
+
+
+def split_pages(full_text: str) -> List[Dict]:
+    """
+    Page records back from a stored Paper.full_text, the inverse of joining them with
+    PAGE_HEADER. Text without page headers comes back as a single page.
+    """
+    pieces = PAGE_HEADER_PATTERN.split(full_text)
+    if len(pieces) == 1:
+        return [{'page_number': 1, 'text': full_text}]
+
+    # pieces: [text before the first header, number, text, number, text, ...]
+    return [
+        {'page_number': int(number), 'text': text}
+        for number, text in zip(pieces[1::2], pieces[2::2])
+    ]
+
+
+def embedding_max_tokens(model_name: Optional[str] = None) -> int:
+    """
+    Largest chunk, in tokens, the embedding model encodes without truncation.
+    """
+    from app.ml_services.model_registry import get_embedding_model
 
-        for page_num, char_range in page_mapping.items():
-            if char_range[0] <= char_position <= char_range[1]:
-                return page_num
-        return 1
\ No newline at end of file
+    model = get_embedding_model(model_name)
+    # [CLS] and [SEP] count against max_seq_length
+    return model.max_seq_length - 2
@@ -0,0 +1,719 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+
+import numpy as np
+
+from app.ml_services.model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore(ABC):
+    """
+    Interface EmbeddingService talks to. Distances are cosine distances
+    (1 - cosine similarity) for every backend.
+    """
+
+    @abstractmethod
+    def create_collection(self, collection_name: str):
+        ...
+
+    @abstractmethod
+    def ensure_collection(self, collection_name: str):
+        """
+        Creates the collection if it does not exist; never drops existing vectors.
+        """
+
+    @abstractmethod
+    def delete_collection(self, collection_name: str):
+        ...
+
+    @abstractmethod
+    def add(self,
+            collection_name: str,
+            ids: List[str],
+            embeddings: np.ndarray,
+            documents: List[str],
+            metadatas: List[Dict]):
+        ...
+
+    @abstractmethod
+    def query(self,
+              collection_name: str,
+              query_embedding: np.ndarray,
+              top_k: int = 5,
+              where: Optional[Dict] = None) -> List[Dict]:
+        """
+        Returns [{'id', 'content', 'metadata', 'distance'}] ordered by distance.
+        """
+
+    @abstractmethod
+    def get(self,
+            collection_name: str,
+            where: Optional[Dict] = None,
+            include_embeddings: bool = False) -> Dict[str, Any]:
+        """
+        Returns {'ids', 'documents', 'metadatas', 'embeddings'} for every stored vector matching `where`.
+        """
+
+    @abstractmethod
+    def delete(self, collection_name: str, where: Dict):
+        ...
+
+    @abstractmethod
+    def count(self, collection_name: str) -> int:
+        ...
+
+
+class ChromaVectorStore(VectorStore):
+
+    def __init__(self, persist_directory: str):
+        import chromadb
+        self.client = chromadb.PersistentClient(path=persist_directory)
+
+    def create_collection(self, collection_name: str):
+
+        try:
+            self.client.delete_collection(collection_name)
+        except ValueError:
+            pass
+
+        return self.client.create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+    def ensure_collection(self, collection_name: str):
+
+        return self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+    def delete_collection(self, collection_name: str):
+        self.client.delete_collection(collection_name)
+
+    def add(self, collection_name, ids, embeddings, documents, metadatas):
+
+        collection = self.client.get_collection(collection_name)
+        collection.add(
+            # chromadb only accepts nested lists; this is the single conversion point
+            embeddings=np.asarray(embeddings, dtype=np.float32).tolist(),
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids,
+        )
+
+    def query(self, collection_name, query_embedding, top_k=5, where=None):
+
+        collection = self.client.get_collection(collection_name)
+        results = collection.query(
+            query_embeddings=[np.asarray(query_embedding, dtype=np.float32).tolist()],
+            n_results=top_k,
+            where=where or None,
+        )
+
+        return [
+            {
+                'id': results['ids'][0][idx],
+                'content': results['documents'][0][idx],
+                'metadata': results['metadatas'][0][idx],
+                'distance': results['distances'][0][idx],
+            }
+            for idx in range(len(results['ids'][0]))
+        ]
+
+    def get(self, collection_name, where=None, include_embeddings=False):
+
+        collection = self.client.get_collection(collection_name)
+        include = ['documents', 'metadatas'] + (['embeddings'] if include_embeddings else [])
+        results = collection.get(where=where or None, include=include)
+
+        embeddings = None
+        if include_embeddings:
+            embeddings = np.asarray(results['embeddings'], dtype=np.float32)
+        return {
+            'ids': results['ids'],
+            'documents': results['documents'],
+            'metadatas': results['metadatas'],
+            'embeddings': embeddings,
+        }
+
+    def delete(self, collection_name, where):
+        self.client.get_collection(collection_name).delete(where=where)
+
+    def count(self, collection_name):
+        return self.client.get_collection(collection_name).count()
+
+
+METADATA_KEY = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# metadata keys filtered on by the global index
+INDEXED_METADATA_KEYS = ['paper_id', 'user_id']
+
+
+def _where_to_sql(where: Optional[Dict]) -> Tuple[str, List]:
+    """
+    Translates the Chroma `where` subset we use ({k: v}, {k: {'$eq'|'$ne'|'$in': ...}},
+    {'$and'|'$or': [...]}) into SQL over the JSON metadata column.
+    """
+    if not where:
+        return "1", []
+
+    clauses = []
+    params = []
+
+    for key, condition in where.items():
+        if key in ('$and', '$or'):
+            parts = [_where_to_sql(sub) for sub in condition]
+            joiner = ' AND ' if key == '$and' else ' OR '
+            clauses.append('(' + joiner.join(sql for sql, _ in parts) + ')')
+            for _, sub_params in parts:
+                params.extend(sub_params)
+            continue
+
+        if not METADATA_KEY.match(key):
+            raise ValueError(f"Invalid metadata key: {key}")
+        # the path is inlined (not bound) so SQLite can use the json_extract expression indexes
+        column = f"json_extract(metadata, '$.{key}')"
+
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+
+        for operator, value in condition.items():
+            if operator == '$eq':
+                clauses.append(f"{column} = ?")
+                params.append(value)
+            elif operator == '$ne':
+                clauses.append(f"{column} != ?")
+                params.append(value)
+            elif operator == '$in':
+                placeholders = ",".join("?" * len(value))
+                clauses.append(f"{column} IN ({placeholders})")
+                params.extend(value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+
+    return " AND ".join(clauses), params
+
+
+# FaissVectorStore segment files
+MAIN = 'index'
+DELTA = 'delta'
+
+
+class FaissVectorStore(VectorStore):
+    """
+    Local FAISS indexes, one directory per collection:
+
+        <root>/<collection>/index.faiss     vectors (IndexIDMap2 over flat / IVF / HNSW)
+        <root>/<collection>/delta.faiss     vectors added since the last merge (IndexIDMap2 over flat)
+        <root>/<collection>/mapping.sqlite3 faiss id -> chunk id, document and metadata
+
+    Vectors are L2-normalized and searched by inner product, i.e. cosine similarity.
+    Query-side indexes are opened with IO_FLAG_MMAP, so IVF inverted lists are
+    memory-mapped rather than copied into every process. IVF collections
+    stay flat until they hold enough vectors to train the coarse quantizer.
+    Writes take a per-collection file lock, and other processes reload
+    an index when its file changes.
+
+    Writes only rewrite the small delta segment; it is merged into the main index
+    once it holds `delta_max_vectors`, so the cost of ingesting a paper does not grow
+    with the collection. Queries search both segments. Deleting vectors of the main
+    index only records tombstones that searches exclude; the index is rebuilt without
+    them once they make up `compact_ratio` of it.
+
+    A `where` filter that allows at most `exact_filter_ratio` of the vectors (and no more
+    than `exact_filter_max`) is answered by scoring the allowed vectors exactly: an HNSW
+    or IVF search restricted to a few ids explores the whole graph / probed lists and
+    still misses most of them.
+    """
+
+    def __init__(self,
+                 root: str,
+                 index_type: str = 'hnsw',
+                 nlist: int = 1024,
+                 nprobe: int = 16,
+                 hnsw_m: int = 32,
+                 ef_search: int = 64,
+                 delta_max_vectors: int = 5000,
+                 compact_ratio: float = 0.2,
+                 exact_filter_ratio: float = 0.05,
+                 exact_filter_max: int = 20000):
+        import faiss
+        self.faiss = faiss
+
+        if index_type not in ('flat', 'ivf', 'hnsw'):
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.delta_max_vectors = delta_max_vectors
+        self.compact_ratio = compact_ratio
+        self.exact_filter_ratio = exact_filter_ratio
+        self.exact_filter_max = exact_filter_max
+
+        # (collection, segment) -> (index, file mtime it was loaded from)
+        self._indexes: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def create_collection(self, collection_name: str):
+
+        self.delete_collection(collection_name)
+        self._dir(collection_name).mkdir(parents=True)
+        self._mapping(collection_name)
+
+    def ensure_collection(self, collection_name: str):
+
+        self._mapping(collection_name)
+
+    def delete_collection(self, collection_name: str):
+
+        self._forget(collection_name)
+        connections = getattr(self._local, 'connections', {})
+        connection = connections.pop(collection_name, None)
+        if connection is not None:
+            connection.close()
+        shutil.rmtree(self._dir(collection_name), ignore_errors=True)
+
+    def add(self, collection_name, ids, embeddings, documents, metadatas):
+
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32).copy()
+        self.faiss.normalize_L2(vectors)
+
+        with self._write_lock(collection_name):
+            delta = self._read_index(collection_name, DELTA, writable=True)
+            if delta is None:
+                delta = self._new_index(vectors.shape[1], trained_type='flat')
+
+            connection = self._mapping(collection_name)
+            # tombstoned ids are still in the main index and must not be reused
+            (next_id,) = connection.execute(
+                "SELECT COALESCE(MAX(faiss_id), -1) + 1 FROM "
+                "(SELECT MAX(faiss_id) AS faiss_id FROM chunks UNION ALL SELECT MAX(faiss_id) FROM tombstones)"
+            ).fetchone()
+            faiss_ids = np.arange(next_id, next_id + len(ids), dtype=np.int64)
+
+            delta.add_with_ids(vectors, faiss_ids)
+
+            connection.executemany(
+                "INSERT INTO chunks (faiss_id, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (int(faiss_id), chunk_id, document, json.dumps(metadata))
+                    for faiss_id, chunk_id, document, metadata in zip(faiss_ids, ids, documents, metadatas)
+                ],
+            )
+
+            if delta.ntotal >= self.delta_max_vectors:
+                self._merge_delta(collection_name, delta)
+            else:
+                self._write_index(collection_name, delta, DELTA)
+            connection.commit()
+
+            self._forget(collection_name)
+
+    def query(self, collection_name, query_embedding, top_k=5, where=None):
+
+        main, delta = (
+            index if index is not None and index.ntotal > 0 else None
+            for index in (self._read_index(collection_name), self._read_index(collection_name, DELTA))
+        )
+        segments = [index for index in (main, delta) if index is not None]
+        if not segments:
+            return []
+
+        query = np.ascontiguousarray(query_embedding, dtype=np.float32).reshape(1, -1).copy()
+        self.faiss.normalize_L2(query)
+
+        connection = self._mapping(collection_name)
+        selector = None
+        if where:
+            sql, params = _where_to_sql(where)
+            allowed = np.fromiter(
+                (row[0] for row in connection.execute(f"SELECT faiss_id FROM chunks WHERE {sql}", params)),
+                dtype=np.int64,
+            )
+            if len(allowed) == 0:
+                return []
+            total = sum(index.ntotal for index in segments)
+            if len(allowed) <= min(self.exact_filter_ratio * total, self.exact_filter_max):
+                return self._hit_rows(connection, self._search_exact(main, delta, query, allowed, top_k))
+            selector = self.faiss.IDSelectorBatch(allowed)
+        else:
+            dead = np.fromiter((row[0] for row in connection.execute("SELECT faiss_id FROM tombstones")), dtype=np.int64)
+            if len(dead):
+                # the inner selector must outlive the search
+                dead_selector = self.faiss.IDSelectorBatch(dead)
+                selector = self.faiss.IDSelectorNot(dead_selector)
+
+        # a vector is briefly in both segments while a merge is being published
+        best = {}
+        for index in segments:
+            scores, faiss_ids = index.search(query, top_k, params=self._search_params(index, selector))
+            for faiss_id, score in zip(faiss_ids[0], scores[0]):
+                if faiss_id != -1:
+                    best[int(faiss_id)] = max(float(score), best.get(int(faiss_id), -np.inf))
+
+        hits = sorted(best.items(), key=lambda hit: hit[1], reverse=True)[:top_k]
+        return self._hit_rows(connection, hits)
+
+    def _search_exact(self, main, delta, query: np.ndarray, allowed: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """
+        (faiss_id, score) of the top_k allowed vectors by exact inner product. Vectors are
+        reconstructed from the delta segment when it holds them, else from the main index.
+        """
+        faiss = self.faiss
+        in_delta = np.zeros(len(allowed), dtype=bool)
+        if delta is not None:
+            in_delta = np.isin(allowed, faiss.vector_to_array(delta.id_map))
+        if main is None:
+            allowed, in_delta = allowed[in_delta], in_delta[in_delta]
+
+        vectors = np.empty((len(allowed), query.shape[1]), dtype=np.float32)
+        if in_delta.any():
+            vectors[in_delta] = delta.reconstruct_batch(allowed[in_delta])
+        if not in_delta.all():
+            base = faiss.downcast_index(main.index)
+            if isinstance(base, faiss.IndexIVF):
+                # built once per loaded index; IVF can only reconstruct by id through it
+                with self._lock:
+                    if base.direct_map.type == faiss.DirectMap.NoMap:
+                        base.make_direct_map()
+            vectors[~in_delta] = main.reconstruct_batch(allowed[~in_delta])
+
+        scores = vectors @ query[0]
+        best = np.argsort(-scores, kind='stable')[:top_k]
+        return [(int(allowed[position]), float(scores[position])) for position in best]
+
+    def _hit_rows(self, connection: sqlite3.Connection, hits: List[Tuple[int, float]]) -> List[Dict]:
+
+        if not hits:
+            return []
+
+        placeholders = ",".join("?" * len(hits))
+        rows = {
+            row[0]: row[1:]
+            for row in connection.execute(
+                f"SELECT faiss_id, id, document, metadata FROM chunks WHERE faiss_id IN ({placeholders})",
+                [faiss_id for faiss_id, _ in hits],
+            )
+        }
+
+        return [
+            {
+                'id': rows[faiss_id][0],
+                'content': rows[faiss_id][1],
+                'metadata': json.loads(rows[faiss_id][2]),
+                'distance': 1.0 - score,
+            }
+            for faiss_id, score in hits
+            if faiss_id in rows
+        ]
+
+    def get(self, collection_name, where=None, include_embeddings=False):
+
+        connection = self._mapping(collection_name)
+        sql, params = _where_to_sql(where)
+        rows = connection.execute(
+            f"SELECT faiss_id, id, document, metadata FROM chunks WHERE {sql} ORDER BY faiss_id",
+            params,
+        ).fetchall()
+
+        embeddings = None
+        if include_embeddings:
+            embeddings = self._reconstruct(collection_name, [row[0] for row in rows])
+
+        return {
+            'ids': [row[1] for row in rows],
+            'documents': [row[2] for row in rows],
+            'metadatas': [json.loads(row[3]) for row in rows],
+            'embeddings': embeddings,
+        }
+
+    def delete(self, collection_name, where):
+
+        sql, params = _where_to_sql(where)
+        with self._write_lock(collection_name):
+            connection = self._mapping(collection_name)
+            doomed = np.fromiter(
+                (row[0] for row in connection.execute(f"SELECT faiss_id FROM chunks WHERE {sql}", params)),
+                dtype=np.int64,
+            )
+            if len(doomed) == 0:
+                return
+            deleted = len(doomed)
+
+            delta = self._read_index(collection_name, DELTA, writable=True)
+            delta_count = 0
+            if delta is not None:
+                in_delta = np.isin(doomed, self.faiss.vector_to_array(delta.id_map))
+                if in_delta.any():
+                    delta.remove_ids(self.faiss.IDSelectorBatch(doomed[in_delta]))
+                    self._write_index(collection_name, delta, DELTA)
+                doomed = doomed[~in_delta]
+                delta_count = delta.ntotal
+
+            connection.executemany("INSERT OR IGNORE INTO tombstones (faiss_id) VALUES (?)",
+                                   [(int(faiss_id),) for faiss_id in doomed])
+            connection.execute(f"DELETE FROM chunks WHERE {sql}", params)
+            connection.commit()
+            self._maybe_compact(collection_name, delta_count)
+
+            self._forget(collection_name)
+
+        logger.info(f"Deleted {deleted} vectors from collection: {collection_name}")
+
+    def count(self, collection_name):
+
+        (count,) = self._mapping(collection_name).execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return count
+
+    def _merge_delta(self, collection_name: str, delta):
+        """
+        Moves the delta segment's vectors into the main index and removes the delta file.
+        The main index is written first, so readers never miss a vector.
+        """
+        index = self._read_index(collection_name, writable=True)
+        if index is None:
+            index = self._new_index(delta.d, trained_type='flat' if self.index_type == 'ivf' else self.index_type)
+
+        index.add_with_ids(
+            delta.index.reconstruct_n(0, delta.ntotal),
+            self.faiss.vector_to_array(delta.id_map).astype(np.int64),
+        )
+        index = self._maybe_train_ivf(index)
+
+        self._write_index(collection_name, index)
+        self._index_path(collection_name, DELTA).unlink(missing_ok=True)
+        logger.info(f"Merged {delta.ntotal} vectors into collection: {collection_name}")
+
+    def _reconstruct(self, collection_name: str, faiss_ids: List[int]) -> np.ndarray:
+
+        if not faiss_ids:
+            return np.empty((0, 0), np.float32)
+
+        delta = self._read_index(collection_name, DELTA, writable=True)
+        delta_ids = set(self.faiss.vector_to_array(delta.id_map).tolist()) if delta is not None else set()
+
+        index = None
+        if any(faiss_id not in delta_ids for faiss_id in faiss_ids):
+            index = self._read_index(collection_name, writable=True)
+            base = self.faiss.downcast_index(index.index)
+            if isinstance(base, self.faiss.IndexIVF):
+                base.make_direct_map()
+
+        return np.vstack([
+            (delta if faiss_id in delta_ids else index).reconstruct(faiss_id)
+            for faiss_id in faiss_ids
+        ])
+
+    def _new_index(self, dimension: int, trained_type: str):
+
+        faiss = self.faiss
+        if trained_type == 'hnsw':
+            base = faiss.IndexHNSWFlat(dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        elif trained_type == 'ivf':
+            quantizer = faiss.IndexFlatIP(dimension)
+            base = faiss.IndexIVFFlat(quantizer, dimension, self.nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            base = faiss.IndexFlatIP(dimension)
+        return faiss.IndexIDMap2(base)
+
+    def _maybe_train_ivf(self, index):
+        """
+        Rebuilds a flat collection as IVF once it holds ~39 vectors per list,
+        the minimum FAISS recommends for k-means training.
+        """
+        if self.index_type != 'ivf' or not isinstance(self.faiss.downcast_index(index.index), self.faiss.IndexFlat):
+            return index
+        if index.ntotal < self.nlist * 39:
+            return index
+
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+        ids = self.faiss.vector_to_array(index.id_map).astype(np.int64)
+
+        ivf = self._new_index(vectors.shape[1], trained_type='ivf')
+        ivf.train(vectors)
+        ivf.add_with_ids(vectors, ids)
+        logger.info(f"Trained IVF index with {self.nlist} lists on {len(ids)} vectors")
+        return ivf
+
+    def _maybe_compact(self, collection_name: str, delta_count: int):
+        """
+        Rebuilds the main index from its live vectors once tombstones make up
+        `compact_ratio` of it, so each deleted vector costs amortized O(1) rebuild work.
+        The main index size is derived from the mapping, so deletes never load it otherwise.
+        """
+        connection = self._mapping(collection_name)
+        (live,) = connection.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        (tombstones,) = connection.execute("SELECT COUNT(*) FROM tombstones").fetchone()
+        if not tombstones or tombstones < self.compact_ratio * (live - delta_count + tombstones):
+            return
+
+        index = self._read_index(collection_name, writable=True)
+        if index is None:
+            connection.execute("DELETE FROM tombstones")
+            connection.commit()
+            return
+
+        faiss = self.faiss
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        dead = np.fromiter((row[0] for row in connection.execute("SELECT faiss_id FROM tombstones")), dtype=np.int64)
+        keep = ~np.isin(ids, dead)
+
+        base = faiss.downcast_index(index.index)
+        if isinstance(base, faiss.IndexIVF):
+            base.make_direct_map()
+            # keep the trained coarse quantizer
+            empty = faiss.clone_index(base)
+            empty.reset()
+            rebuilt = faiss.IndexIDMap2(empty)
+        else:
+            rebuilt = self._new_index(index.d, trained_type='hnsw' if isinstance(base, faiss.IndexHNSW) else 'flat')
+        if keep.any():
+            rebuilt.add_with_ids(base.reconstruct_n(0, index.ntotal)[keep], ids[keep])
+
+        self._write_index(collection_name, rebuilt)
+        connection.execute("DELETE FROM tombstones")
+        connection.commit()
+        logger.info(f"Compacted collection {collection_name}: dropped {len(ids) - int(keep.sum())} deleted vectors")
+
+    def _write_index(self, collection_name: str, index, segment: str = MAIN):
+
+        index_path = self._index_path(collection_name, segment)
+        tmp_path = index_path.with_suffix('.tmp')
+        self.faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, index_path)
+
+    def _search_params(self, index, selector):
+
+        faiss = self.faiss
+        base = faiss.downcast_index(index.index)
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        if isinstance(base, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+    def _read_index(self, collection_name: str, segment: str = MAIN, writable: bool = False):
+
+        index_path = self._index_path(collection_name, segment)
+        if not index_path.exists():
+            return None
+
+        if writable:
+            return self.faiss.read_index(str(index_path))
+
+        mtime = index_path.stat().st_mtime
+        with self._lock:
+            cached = self._indexes.get((collection_name, segment))
+        if cached is not None and cached[1] == mtime:
+            return cached[0]
+
+        try:
+            index = self.faiss.read_index(str(index_path), self.faiss.IO_FLAG_MMAP | self.faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # HNSW graphs cannot be memory-mapped
+            index = self.faiss.read_index(str(index_path))
+
+        with self._lock:
+            self._indexes[(collection_name, segment)] = (index, mtime)
+        return index
+
+    def _mapping(self, collection_name: str) -> sqlite3.Connection:
+
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        connection = connections.get(collection_name)
+        if connection is None:
+            self._dir(collection_name).mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self._dir(collection_name) / 'mapping.sqlite3', timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    faiss_id INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    document TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+            """)
+            for key in INDEXED_METADATA_KEYS:
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS chunks_{key} ON chunks (json_extract(metadata, '$.{key}'))"
+                )
+            # deleted vectors still present in index.faiss
+            connection.execute("CREATE TABLE IF NOT EXISTS tombstones (faiss_id INTEGER PRIMARY KEY)")
+            connection.commit()
+            connections[collection_name] = connection
+        return connection
+
+    @contextmanager
+    def _write_lock(self, collection_name: str):
+
+        self._dir(collection_name).mkdir(parents=True, exist_ok=True)
+        with open(self._dir(collection_name) / '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _dir(self, collection_name: str) -> Path:
+        return self.root / collection_name
+
+    def _index_path(self, collection_name: str, segment: str = MAIN) -> Path:
+        return self._dir(collection_name) / f'{segment}.faiss'
+
+    def _forget(self, collection_name: str):
+
+        with self._lock:
+            for segment in (MAIN, DELTA):
+                self._indexes.pop((collection_name, segment), None)
+
+
+def build_vector_store(backend: Optional[str] = None) -> VectorStore:
+
+    ml_config = settings.ML_CONFIG
+    backend = backend or ml_config.get('VECTOR_STORE', 'chroma')
+
+    if backend == 'chroma':
+        return ChromaVectorStore(ml_config['CHROMA_PERSIST_DIR'])
+    if backend == 'faiss':
+        return FaissVectorStore(
+            ml_config['FAISS_INDEX_DIR'],
+            index_type=ml_config.get('FAISS_INDEX_TYPE', 'hnsw'),
+            nlist=ml_config.get('FAISS_IVF_NLIST', 1024),
+            nprobe=ml_config.get('FAISS_IVF_NPROBE', 16),
+            hnsw_m=ml_config.get('FAISS_HNSW_M', 32),
+            ef_search=ml_config.get('FAISS_HNSW_EF_SEARCH', 64),
+            delta_max_vectors=ml_config.get('FAISS_DELTA_MAX_VECTORS', 5000),
+            compact_ratio=ml_config.get('FAISS_COMPACT_RATIO', 0.2),
+            exact_filter_ratio=ml_config.get('FAISS_EXACT_FILTER_RATIO', 0.05),
+            exact_filter_max=ml_config.get('FAISS_EXACT_FILTER_MAX', 20000),
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def get_vector_store(backend: Optional[str] = None) -> VectorStore:
+
+    backend = backend or settings.ML_CONFIG.get('VECTOR_STORE', 'chroma')
+    return registry.get(f'vector_store:{backend}', lambda: build_vector_store(backend))
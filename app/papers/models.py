@@ -1,7 +1,21 @@
 from django.db import models
 from django.conf import  settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+import hashlib
 import uuid
 
+
+def compute_content_hash(file) -> str:
+    """
+    SHA-256 of the uploaded PDF bytes, read in chunks so large files are never loaded whole.
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
 class Paper(models.Model):
 
     STATUS_CHOICES = [
@@ -28,6 +42,7 @@ class Paper(models.Model):
     pdf_file = models.FileField(upload_to="pdfs/%Y/%m/")
     file_size = models.IntegerField(help_text="File size in bytes")
     num_pages = models.IntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the PDF bytes")
 
     # Extracted content
 
@@ -51,6 +66,10 @@ class Paper(models.Model):
     # Vector DB info
     collection_name = models.CharField(max_length=512, blank=True)
     num_chunks = models.IntegerField(default=0)
+    pipeline_fingerprint = models.CharField(
+        max_length=64, blank=True,
+        help_text="Extractor/chunker/model versions the stored results were produced with"
+    )
 
     # Metadata
     view_count = models.IntegerField(default=0)
@@ -63,11 +82,17 @@ class Paper(models.Model):
             models.Index(fields=['-created_at']),
             models.Index(fields=['status']),
             models.Index(fields=['user', '-updated_at']),
+            models.Index(fields=['content_hash', 'pipeline_fingerprint', 'status']),
         ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self.pdf_file and not self.content_hash:
+            self.content_hash = compute_content_hash(self.pdf_file)
+        super().save(*args, **kwargs)
+
 
 class PaperChunk(models.Model):
 
@@ -84,6 +109,9 @@ class PaperChunk(models.Model):
     # Vector DB reference
     embedding_id = models.CharField(max_length=128)
 
+    # Postgres full-text vector for lexical retrieval, filled by app.ml_services.retrieval.update_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
+
     # Metadata for better retrievel
     chunk_type = models.CharField(
         max_length=64,
@@ -106,6 +134,8 @@ class PaperChunk(models.Model):
         ordering = ['paper', 'chunk_index']
         indexes = [
             models.Index(fields=['paper', 'chunk_index']),
+            models.Index(fields=['paper', 'embedding_id']),
+            GinIndex(fields=['search_vector']),
         ]
 
     def __str__(self):